@@ -1,7 +1,8 @@
 from django.contrib import admin
+from django.db.models import Count, Q
 from django.utils.translation import gettext_lazy as _
 
-from api.models import DeliveryLog
+from api.models import DeliveryLog, MessageTemplate
 from audit_log.admin import AuditLogModelAdminMixin
 
 
@@ -25,37 +26,45 @@ class MessageStatusListFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         if self.value() in self.MESSAGE_STATUS_OPTIONS:
-            return queryset.filter(report__icontains=self.value())
+            return queryset.filter(
+                Q(report__icontains=self.value())
+                | Q(deliveries__status__iexact=self.value())
+            ).distinct()
         return queryset
 
 
 class DeliveryLogAdmin(AuditLogModelAdminMixin, admin.ModelAdmin):
     search_fields = ["report", "user__email"]
-    list_display = ["id", "user", "get_number", "get_status", "created_at"]
-    list_filter = [MessageStatusListFilter, "created_at"]
+    list_display = ["id", "user", "get_message_count", "status", "created_at"]
+    list_filter = [MessageStatusListFilter, "status", "created_at"]
+    readonly_fields = ["status", "pending_message", "template"]
     date_hierarchy = "created_at"
     ordering = ["-created_at"]
 
-    def get_number(self, obj):
-        try:
-            return ", ".join([number for number in obj.report["messages"]])
-        except (TypeError, KeyError):
-            return ""
+    def get_queryset(self, request):
+        # Count the messages in the same query, instead of loading the messages
+        # of every log of the page
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(message_count=Count("deliveries", distinct=True))
+        )
 
-    get_number.short_description = _("numbers")
+    def get_message_count(self, obj):
+        if obj.report and "messages" in obj.report:
+            # Logs created before the messages were moved to their own table
+            return len(obj.report["messages"])
+        return obj.message_count
 
-    def get_status(self, obj):
-        try:
-            return ", ".join(
-                [
-                    obj.report["messages"][number]["status"]
-                    for number in obj.report["messages"]
-                ]
-            )
-        except (TypeError, KeyError):
-            return ""
+    get_message_count.short_description = _("messages")
+    get_message_count.admin_order_field = "message_count"
 
-    get_status.short_description = _("status")
+
+class MessageTemplateAdmin(AuditLogModelAdminMixin, admin.ModelAdmin):
+    search_fields = ["name", "text", "user__email"]
+    list_display = ["name", "user", "created_at", "updated_at"]
+    ordering = ["name"]
 
 
 admin.site.register(DeliveryLog, DeliveryLogAdmin)
+admin.site.register(MessageTemplate, MessageTemplateAdmin)
@@ -0,0 +1,27 @@
+from django.db.models import TextChoices
+from django.utils.translation import gettext_lazy as _
+
+
+class DeliveryStatus(TextChoices):
+    # The message is waiting for its send time, see `DeliveryLog.send_at`
+    SCHEDULED = "SCHEDULED", _("Scheduled")
+    # The message is waiting in the send queue
+    QUEUED = "QUEUED", _("Queued")
+    # The message has been claimed by a worker which is sending it
+    SENDING = "SENDING", _("Sending")
+    # The message has been handed over to the SMS provider
+    SENT = "SENT", _("Sent")
+
+
+class AggregateDeliveryStatus(TextChoices):
+    """
+    The delivery status of a delivery log, derived from the statuses of its
+    messages.
+    """
+
+    # Every message has been delivered
+    DELIVERED = "DELIVERED", _("Delivered")
+    # Some message has failed
+    FAILED = "FAILED", _("Failed")
+    # Some message has no final status yet
+    PENDING = "PENDING", _("Pending")
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+# The statuses of a message which do not change anymore
+FINAL_MESSAGE_STATUSES = ("DELIVERED", "FAILED")
+
+
+class DeliveryLogChanges:
+    """
+    An in-process publish/subscribe of the changes of the delivery logs.
+
+    The changes are published from the threads handling the delivery reports,
+    and the event streams wait for them on their event loops. The changes made
+    by the other processes are not published here, so the waiters also check
+    the delivery log every `DELIVERY_LOG_EVENTS_POLL_INTERVAL` seconds.
+    """
+
+    def __init__(self):
+        self._waiters = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, log_id) -> None:
+        """
+        Wake up the waiters of the delivery log.
+        """
+        with self._lock:
+            waiters = list(self._waiters.get(str(log_id), ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, log_id, timeout: float) -> bool:
+        """
+        Wait for a change of the delivery log.
+
+        Returns:
+            False if the timeout passed without a change.
+        """
+        key = str(log_id)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters[key].add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters[key].discard(waiter)
+                if not self._waiters[key]:
+                    del self._waiters[key]
+
+
+delivery_log_changes = DeliveryLogChanges()
+
+
+def format_event(event: str, data: dict) -> bytes:
+    """
+    Format a Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
@@ -0,0 +1,6 @@
+class RateLimitExceededError(Exception):
+    """Raised when the SMS provider rate limit does not allow sending right now."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.2f} seconds")
+        self.retry_after = retry_after
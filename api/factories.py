@@ -1,6 +1,6 @@
 import factory
 
-from api.models import DeliveryLog
+from api.models import DeliveryLog, MessageTemplate
 from users.factories import UserFactory
 
 
@@ -10,3 +10,12 @@ class DeliveryLogFactory(factory.django.DjangoModelFactory):
 
     class Meta:
         model = DeliveryLog
+
+
+class MessageTemplateFactory(factory.django.DjangoModelFactory):
+    name = factory.Faker("word")
+    text = "Hi $name"
+    user = factory.SubFactory(UserFactory)
+
+    class Meta:
+        model = MessageTemplate
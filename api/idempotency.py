@@ -0,0 +1,211 @@
+import functools
+import hashlib
+import json
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# The responses which are not stored, so that the request can be retried
+RETRYABLE_STATUS_CODES = (429,)
+
+
+class IdempotencyStore:
+    """
+    Stores the responses of the requests by their idempotency keys.
+
+    The responses are kept in the Django cache for `ttl` seconds. The keys are
+    scoped per user, so the users can not see each other's responses.
+
+    While a request is being handled, its key is locked, so a concurrent
+    request with the same key waits for the response instead of being handled
+    again. The lock expires after `lock_timeout` seconds in case the worker
+    handling the request dies.
+    """
+
+    key_prefix = "idempotency"
+
+    def __init__(
+        self,
+        cache_alias="default",
+        ttl=24 * 60 * 60,
+        lock_timeout=60,
+        poll_interval=0.05,
+    ):
+        """
+        Args:
+            cache_alias: The Django cache used for the responses.
+            ttl: Seconds the responses are kept.
+            lock_timeout: Seconds a request may hold the lock of its key.
+            poll_interval: Seconds between the checks for the response
+                of a concurrent request.
+        """
+        self.cache_alias = cache_alias
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _get_cache_key(self, user_id, key, suffix="response"):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return f"{self.key_prefix}:{user_id}:{digest}:{suffix}"
+
+    def get(self, user_id, key) -> Optional[dict]:
+        """
+        Returns:
+            The stored response, see `save`, or None.
+        """
+        return self.cache.get(self._get_cache_key(user_id, key))
+
+    def save(self, user_id, key, fingerprint, response) -> None:
+        """
+        Store the response of the request. The DRF responses are stored as their
+        data, the other responses as their content.
+        """
+        stored = {"fingerprint": fingerprint, "status": response.status_code}
+        if hasattr(response, "data"):
+            stored["data"] = response.data
+        else:
+            stored["content"] = response.content
+            stored["content_type"] = response.get("Content-Type")
+        self.cache.set(self._get_cache_key(user_id, key), stored, self.ttl)
+
+    def acquire(self, user_id, key) -> bool:
+        """
+        Lock the key for handling the request.
+
+        Returns:
+            False if a concurrent request holds the lock.
+        """
+        return self.cache.add(
+            self._get_cache_key(user_id, key, "lock"), 1, self.lock_timeout
+        )
+
+    def release(self, user_id, key) -> None:
+        self.cache.delete(self._get_cache_key(user_id, key, "lock"))
+
+    def wait(self, user_id, key, timeout) -> Optional[dict]:
+        """
+        Wait for the response of a concurrent request with the same key.
+
+        Returns:
+            The stored response, or None if it was not stored within `timeout`
+            seconds or the concurrent request released the lock without one.
+        """
+        for _ in range(max(1, int(timeout / self.poll_interval))):
+            time.sleep(self.poll_interval)
+            stored = self.get(user_id, key)
+            if stored is not None:
+                return stored
+            if self.cache.get(self._get_cache_key(user_id, key, "lock")) is None:
+                return None
+        return None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    return IdempotencyStore(
+        cache_alias=settings.IDEMPOTENCY_KEY_CACHE,
+        ttl=settings.IDEMPOTENCY_KEY_TTL,
+        lock_timeout=settings.IDEMPOTENCY_KEY_LOCK_TIMEOUT,
+    )
+
+
+def get_request_fingerprint(data) -> str:
+    """
+    Hash of the request payload, for detecting a reused key with another payload.
+    """
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _replay(stored):
+    if "data" in stored:
+        response = Response(stored["data"], status=stored["status"])
+    else:
+        response = HttpResponse(
+            stored["content"],
+            status=stored["status"],
+            content_type=stored["content_type"],
+        )
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view):
+    """
+    Make a DRF function view idempotent with the `Idempotency-Key` header.
+
+    The first response to a key is stored and returned to the later requests
+    with the same key (and the `Idempotent-Replayed: true` header) without
+    calling the view again. A concurrent request with the same key waits for
+    the first one. Reusing a key with another payload is an error (422).
+
+    Requests without the header are handled as usual. Must be applied inside
+    `api_view`, so that the request is authenticated.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                status=400,
+                data={
+                    "error": f"{IDEMPOTENCY_KEY_HEADER} must be 1-"
+                    f"{IDEMPOTENCY_KEY_MAX_LENGTH} characters long"
+                },
+            )
+
+        store = get_idempotency_store()
+        user_id = request.user.pk
+        fingerprint = get_request_fingerprint(request.data)
+
+        stored = store.get(user_id, key)
+        if stored is None:
+            if store.acquire(user_id, key):
+                # A concurrent request may have stored its response and released
+                # the lock between the get and the acquire
+                stored = store.get(user_id, key)
+                if stored is not None:
+                    store.release(user_id, key)
+            else:
+                stored = store.wait(user_id, key, settings.IDEMPOTENCY_KEY_WAIT)
+                if stored is None:
+                    return Response(
+                        status=409,
+                        data={"error": "A request with the same key is in progress"},
+                    )
+        if stored is not None:
+            if stored["fingerprint"] != fingerprint:
+                return Response(
+                    status=422,
+                    data={
+                        "error": f"{IDEMPOTENCY_KEY_HEADER} was already used "
+                        "with another payload"
+                    },
+                )
+            return _replay(stored)
+
+        try:
+            response = view(request, *args, **kwargs)
+            if response.status_code < 500 and (
+                response.status_code not in RETRYABLE_STATUS_CODES
+            ):
+                store.save(user_id, key, fingerprint, response)
+        finally:
+            store.release(user_id, key)
+        return response
+
+    return wrapper
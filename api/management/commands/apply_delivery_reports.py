@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services import apply_delivery_reports
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the buffered delivery reports (i.e. api.DeliveryReport objects) "
+        "to their delivery logs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of delivery reports applied at once. Default is %(default)s",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before polling an empty buffer again. "
+            "Default is %(default)s",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            default=False,
+            help="Exit once the buffer is empty instead of polling it forever",
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs["batch_size"]
+        if batch_size < 1:
+            raise ValueError("Batch size must be a positive integer")
+
+        total_count = 0
+        while True:
+            count = apply_delivery_reports(batch_size=batch_size)
+            total_count += count
+            if count:
+                continue
+            if kwargs["once"]:
+                break
+            time.sleep(kwargs["poll_interval"])
+
+        self.stdout.write(f"Applied {total_count} delivery reports")
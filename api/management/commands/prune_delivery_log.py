@@ -3,6 +3,7 @@ from django.core.management.base import BaseCommand
 from django.db import IntegrityError, transaction
 from django.utils import timezone
 
+from api.enums import DeliveryStatus
 from api.models import DeliveryLog
 
 
@@ -37,19 +38,20 @@ class Command(BaseCommand):
             self.stdout.write("Running in dry-run mode i.e. not committing changes!")
 
         try:
+            # The scheduled messages are kept until they have been sent
             logs_to_be_deleted = DeliveryLog.objects.filter(
                 created_at__lte=timezone.now() - relativedelta(months=months)
-            )
-            deleted_count, deleted_objects = logs_to_be_deleted.delete()
+            ).exclude(status=DeliveryStatus.SCHEDULED)
+            _, deleted_objects = logs_to_be_deleted.delete()
+            deleted_count = deleted_objects.get("api.DeliveryLog", 0)
 
-            # Check that only DeliveryLog objects were deleted and nothing else.
+            # Check that only DeliveryLog objects and their messages were deleted
+            # and nothing else.
             #
             # This is defensive programming meant to prevent accidental data loss
             # by rolling back deletions in case something else than DeliveryLog objects
             # were deleted.
-            if deleted_objects != (
-                {"api.DeliveryLog": deleted_count} if deleted_count else {}
-            ):
+            if set(deleted_objects) - {"api.DeliveryLog", "api.MessageDelivery"}:
                 transaction.set_rollback(True)
                 raise IntegrityError(
                     "Rolling back deletion to prevent accidental data loss. "
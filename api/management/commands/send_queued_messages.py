@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services import create_sms_sender, send_queued_delivery_logs
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the queued SMS messages (i.e. api.DeliveryLog objects "
+        "with status QUEUED) to the SMS provider"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of messages claimed from the queue at once. "
+            "Default is %(default)s",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=10,
+            help="Number of simultaneous requests to the SMS provider. "
+            "Default is %(default)s",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before polling an empty queue again. "
+            "Default is %(default)s",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            default=False,
+            help="Exit once the queue is empty instead of polling it forever",
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs["batch_size"]
+        concurrency = kwargs["concurrency"]
+        if batch_size < 1 or concurrency < 1:
+            raise ValueError("Batch size and concurrency must be positive integers")
+
+        sms_sender = create_sms_sender()
+        total_count = 0
+        while True:
+            sent_count = send_queued_delivery_logs(
+                sms_sender, batch_size=batch_size, concurrency=concurrency
+            )
+            total_count += sent_count
+            if sent_count:
+                continue
+            if kwargs["once"]:
+                break
+            time.sleep(kwargs["poll_interval"])
+
+        self.stdout.write(f"Sent {total_count} queued messages")
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services import create_sms_sender, send_scheduled_delivery_logs
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the scheduled SMS messages (i.e. api.DeliveryLog objects "
+        "with status SCHEDULED) whose send time has come to the SMS provider"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of due messages claimed at once. Default is %(default)s",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=10,
+            help="Number of simultaneous requests to the SMS provider. "
+            "Default is %(default)s",
+        )
+        parser.add_argument(
+            "--spread",
+            type=float,
+            default=0.0,
+            help="Seconds over which the sends of a batch are spread evenly. "
+            "Default is %(default)s",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before checking for due messages again. "
+            "Default is %(default)s",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            default=False,
+            help="Exit once there are no due messages instead of polling forever",
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs["batch_size"]
+        concurrency = kwargs["concurrency"]
+        if batch_size < 1 or concurrency < 1:
+            raise ValueError("Batch size and concurrency must be positive integers")
+        if kwargs["spread"] < 0:
+            raise ValueError("Spread must not be negative")
+
+        sms_sender = create_sms_sender()
+        total_count = 0
+        while True:
+            sent_count = send_scheduled_delivery_logs(
+                sms_sender,
+                batch_size=batch_size,
+                concurrency=concurrency,
+                spread=kwargs["spread"],
+            )
+            total_count += sent_count
+            if sent_count:
+                continue
+            if kwargs["once"]:
+                break
+            time.sleep(kwargs["poll_interval"])
+
+        self.stdout.write(f"Sent {total_count} scheduled messages")
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.urls import reverse
+
+from api.views import delivery_log_webhook_fast
+
+
+class DeliveryReportWebhookMiddleware:
+    """
+    Serves the JSON delivery reports of Quriiri with `delivery_log_webhook_fast`
+    before the rest of the middleware, when the `DELIVERY_REPORT_WEBHOOK_FAST_PATH`
+    setting is enabled.
+
+    The webhook is called once per recipient, and needs none of the sessions,
+    CSRF, authentication, messages, axes, CSP, locale or audit log middleware.
+    Other requests, and the reports which are not JSON, pass through as usual.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.path_prefix = reverse("delivery_log_webhook", kwargs={"id": "0"})[:-1]
+
+    def __call__(self, request):
+        if (
+            settings.DELIVERY_REPORT_WEBHOOK_FAST_PATH
+            and request.method == "POST"
+            and request.content_type == "application/json"
+            and request.path_info.startswith(self.path_prefix)
+        ):
+            log_id = request.path_info[len(self.path_prefix) :]
+            if log_id and "/" not in log_id:
+                return delivery_log_webhook_fast(request, log_id)
+        return self.get_response(request)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0002_alter_deliverylog_report"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deliverylog",
+            name="pending_message",
+            field=models.JSONField(
+                blank=True, null=True, verbose_name="pending message"
+            ),
+        ),
+        migrations.AddField(
+            model_name="deliverylog",
+            name="status",
+            field=models.CharField(
+                choices=[("QUEUED", "Queued"), ("SENT", "Sent")],
+                default="SENT",
+                max_length=16,
+                verbose_name="status",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deliverylog",
+            index=models.Index(
+                fields=["status", "created_at"], name="api_deliverylog_status_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0003_deliverylog_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deliverylog",
+            name="batch_id",
+            field=models.UUIDField(
+                blank=True, db_index=True, null=True, verbose_name="batch id"
+            ),
+        ),
+    ]
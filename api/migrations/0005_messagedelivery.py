@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0004_deliverylog_batch_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MessageDelivery",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "destination",
+                    models.CharField(max_length=64, verbose_name="destination"),
+                ),
+                (
+                    "normalized_destination",
+                    models.CharField(
+                        max_length=64, verbose_name="normalized destination"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(blank=True, max_length=32, verbose_name="status"),
+                ),
+                ("data", models.JSONField(verbose_name="data")),
+                (
+                    "log",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deliveries",
+                        to="api.deliverylog",
+                        verbose_name="delivery log",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "message delivery",
+                "verbose_name_plural": "message deliveries",
+                "indexes": [
+                    models.Index(
+                        fields=["log", "normalized_destination"],
+                        name="api_msgdelivery_dest_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0005_messagedelivery"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeliveryReport",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("log_id", models.UUIDField(verbose_name="delivery log id")),
+                ("data", models.JSONField(verbose_name="data")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="created at"),
+                ),
+            ],
+            options={
+                "verbose_name": "delivery report",
+                "verbose_name_plural": "delivery reports",
+            },
+        ),
+    ]
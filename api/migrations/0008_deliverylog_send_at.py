@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0007_messagetemplate"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deliverylog",
+            name="send_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="send at"),
+        ),
+        migrations.AlterField(
+            model_name="deliverylog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("SCHEDULED", "Scheduled"),
+                    ("QUEUED", "Queued"),
+                    ("SENT", "Sent"),
+                ],
+                default="SENT",
+                max_length=16,
+                verbose_name="status",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deliverylog",
+            index=models.Index(
+                condition=models.Q(("status", "SCHEDULED")),
+                fields=["send_at"],
+                name="api_deliverylog_send_at_idx",
+            ),
+        ),
+    ]
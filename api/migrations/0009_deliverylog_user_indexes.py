@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0008_deliverylog_send_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="deliverylog",
+            index=models.Index(
+                fields=["user", "created_at", "id"], name="api_deliverylog_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deliverylog",
+            index=models.Index(
+                fields=["user", "status", "created_at", "id"],
+                name="api_deliverylog_usr_status_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0009_deliverylog_user_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="deliverylog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("SCHEDULED", "Scheduled"),
+                    ("QUEUED", "Queued"),
+                    ("SENDING", "Sending"),
+                    ("SENT", "Sent"),
+                ],
+                default="SENT",
+                max_length=16,
+                verbose_name="status",
+            ),
+        ),
+    ]
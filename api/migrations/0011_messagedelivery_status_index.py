@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0010_deliverylog_status_sending"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="messagedelivery",
+            index=models.Index(
+                fields=["log", "status"], name="api_msgdelivery_status_idx"
+            ),
+        ),
+    ]
@@ -1,13 +1,98 @@
 # Create your models here.
+import string
+from collections import defaultdict
 from copy import deepcopy
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
 
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from api.enums import DeliveryStatus
+from api.events import delivery_log_changes
+from api.types import TemplateRecipient
+from api.utils import normalize_destination, validate_destinations
 from audit_log.managers import AuditLogManager
 from common.models import TimestampedModel, UUIDPrimaryKeyModel
 
 
+class MessageTemplate(UUIDPrimaryKeyModel, TimestampedModel):
+    """
+    A stored message text with placeholders for the variables of the recipients,
+    e.g. "Hi $name, your appointment is at ${time}." See `string.Template`.
+    """
+
+    user = models.ForeignKey(
+        "users.User",
+        related_name="message_templates",
+        on_delete=models.CASCADE,
+        verbose_name=_("user"),
+    )
+    name = models.CharField(verbose_name=_("name"), max_length=255)
+    text = models.TextField(verbose_name=_("text"))
+
+    objects = AuditLogManager()
+
+    class Meta:
+        verbose_name = _("message template")
+        verbose_name_plural = _("message templates")
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+    def render_messages(
+        self,
+        recipients: List[TemplateRecipient],
+        variables: Optional[dict] = None,
+    ) -> Tuple[Dict[str, List[str]], Dict[str, List[int]]]:
+        """
+        Render the text of every recipient and group the recipients whose
+        texts are identical.
+
+        Args:
+            recipients: The recipients with their own `variables`.
+            variables: The variables shared by all the recipients. The variables
+                of a recipient override them.
+
+        Returns:
+            The valid destinations in international format by the rendered text.
+            A destination listed more than once only gets its first text.
+            And the indexes of the rejected recipients by the reason, see
+            `validate_destinations`.
+
+        Raises:
+            ValueError: If a variable of the text is missing.
+        """
+        template = string.Template(self.text)
+        valid_destinations, rejected = validate_destinations(
+            [recipient["destination"] for recipient in recipients],
+            convert_to_international_format=True,
+        )
+        rejected_indexes = {index for indexes in rejected.values() for index in indexes}
+        valid_destinations = iter(valid_destinations)
+        messages = defaultdict(list)
+        seen = set()
+        for index, recipient in enumerate(recipients):
+            if index in rejected_indexes:
+                continue
+            destination = next(valid_destinations)
+            if destination in seen:
+                continue
+            try:
+                text = template.substitute(
+                    {**(variables or {}), **recipient.get("variables", {})}
+                )
+            except KeyError as e:
+                raise ValueError(
+                    f"Missing variable {e} for {recipient['destination']}"
+                ) from e
+            seen.add(destination)
+            messages[text].append(destination)
+        return dict(messages), rejected
+
+
 class DeliveryLog(UUIDPrimaryKeyModel, TimestampedModel):
     user = models.ForeignKey(
         "users.User",
@@ -16,6 +101,35 @@ class DeliveryLog(UUIDPrimaryKeyModel, TimestampedModel):
         verbose_name=_("user"),
     )
     report = models.JSONField(verbose_name=_("report"), blank=True, null=True)
+    status = models.CharField(
+        verbose_name=_("status"),
+        max_length=16,
+        choices=DeliveryStatus.choices,
+        default=DeliveryStatus.SENT,
+    )
+    # The message waiting to be sent by the queue worker. Cleared once sent.
+    pending_message = models.JSONField(
+        verbose_name=_("pending message"), blank=True, null=True
+    )
+
+    # Delivery logs whose messages were sent in the same provider request share
+    # the batch id. The delivery reports of the batch are sent to the webhook of
+    # the first delivery log in the batch.
+    batch_id = models.UUIDField(
+        verbose_name=_("batch id"), blank=True, null=True, db_index=True
+    )
+
+    # The time when a scheduled message is sent, see `DeliveryStatus.SCHEDULED`
+    send_at = models.DateTimeField(verbose_name=_("send at"), blank=True, null=True)
+    # The template of the message, if it was rendered from one
+    template = models.ForeignKey(
+        MessageTemplate,
+        related_name="delivery_logs",
+        on_delete=models.SET_NULL,
+        verbose_name=_("template"),
+        blank=True,
+        null=True,
+    )
 
     objects = AuditLogManager()
 
@@ -23,14 +137,169 @@ class DeliveryLog(UUIDPrimaryKeyModel, TimestampedModel):
         verbose_name = _("delivery log")
         verbose_name_plural = _("delivery logs")
         ordering = ["-updated_at"]
+        indexes = [
+            models.Index(
+                fields=["status", "created_at"],
+                name="api_deliverylog_status_idx",
+            ),
+            # For finding the scheduled messages which are due
+            models.Index(
+                fields=["send_at"],
+                name="api_deliverylog_send_at_idx",
+                condition=models.Q(status=DeliveryStatus.SCHEDULED),
+            ),
+            # For the keyset pagination of the delivery logs of a user, with and
+            # without the status filter
+            models.Index(
+                fields=["user", "created_at", "id"],
+                name="api_deliverylog_user_idx",
+            ),
+            models.Index(
+                fields=["user", "status", "created_at", "id"],
+                name="api_deliverylog_usr_status_idx",
+            ),
+        ]
+
+    def set_report(self, report: Optional[dict]) -> List["MessageDelivery"]:
+        """
+        Set the report without its messages, which are stored as
+        `MessageDelivery` rows. The log itself is not saved.
+
+        Returns:
+            The unsaved `MessageDelivery` rows of the messages in the report.
+        """
+        if report is None:
+            self.report = None
+            return []
+        self.report = {key: value for key, value in report.items() if key != "messages"}
+        return [
+            MessageDelivery.from_message(self, destination, message)
+            for destination, message in report.get("messages", {}).items()
+        ]
 
-    def update_report(self, report_data):
+    @transaction.atomic
+    def save_report(self, report: Optional[dict]) -> List["MessageDelivery"]:
+        """
+        Save the report and replace the messages of the log with its messages.
+
+        Returns:
+            The created messages, for the audit log.
+        """
+        deliveries = self.set_report(report)
+        self.save()
+        self.deliveries.all().delete()
+        return MessageDelivery.objects.bulk_create(deliveries, batch_size=1000)
+
+    def get_report(self) -> Optional[dict]:
+        """
+        Get the report in the shape returned by `quriiri.send.Sender.send_sms`,
+        with the messages collected from the `MessageDelivery` rows.
+        """
+        if self.report is None or "messages" in self.report:
+            # Logs created before the messages were moved to their own table
+            return self.report
+        if "deliveries" in getattr(self, "_prefetched_objects_cache", {}):
+            # Already loaded with `prefetch_deliveries`
+            messages = {
+                delivery.destination: delivery.data
+                for delivery in self.deliveries.all()
+            }
+        else:
+            messages = dict(
+                self.deliveries.order_by("id").values_list("destination", "data")
+            )
+        return {**self.report, "messages": messages}
+
+    @staticmethod
+    def prefetch_deliveries() -> models.Prefetch:
+        """
+        Prefetch the messages of the logs in the order of `get_report`.
+        """
+        return models.Prefetch(
+            "deliveries", queryset=MessageDelivery.objects.order_by("id")
+        )
+
+    @staticmethod
+    def get_messages_of_logs(
+        logs: List["DeliveryLog"], statuses_only: bool = False
+    ) -> Dict[Any, dict]:
+        """
+        Get the messages of many logs with one query, see `get_report`.
+
+        Args:
+            logs: The delivery logs.
+            statuses_only: If True, get only the status of each message instead
+                of the whole message, without loading the message data.
+
+        Returns:
+            The messages of each log by destination, by the log id.
+        """
+        messages = {}
+        for log in logs:
+            if log.report is not None and "messages" in log.report:
+                # Logs created before the messages were moved to their own table
+                messages[log.pk] = {
+                    destination: message.get("status") if statuses_only else message
+                    for destination, message in log.report["messages"].items()
+                }
+            else:
+                messages[log.pk] = {}
+        deliveries = MessageDelivery.objects.filter(
+            log__in=[log.pk for log in logs if not messages[log.pk]]
+        ).order_by("log_id", "id")
+        for log_id, destination, value in deliveries.values_list(
+            "log_id", "destination", "status" if statuses_only else "data"
+        ):
+            messages[log_id][destination] = value
+        return messages
+
+    def has_destination(self, destination: str) -> bool:
+        """
+        Check whether the report has a message to the given destination.
+        """
+        if self.report and "messages" in self.report:
+            return any(
+                k == destination or v.get("converted") == destination
+                for k, v in self.report["messages"].items()
+            )
+        return self.deliveries.filter(
+            normalized_destination=normalize_destination(destination)
+        ).exists()
+
+    def get_batch_log_for_destination(self, destination: str) -> "DeliveryLog":
+        """
+        Get the delivery log of the batch which has a message to the destination.
+
+        Falls back to this delivery log if none of the batch logs has it.
+        """
+        if self.batch_id and not self.has_destination(destination):
+            for log in DeliveryLog.objects.filter(batch_id=self.batch_id).exclude(
+                id=self.id
+            ):
+                if log.has_destination(destination):
+                    return log
+        return self
+
+    def update_report(self, report_data) -> List["MessageDelivery"]:
         """
         Update delivery of single message base on json data sent from Quriiri to
         our service
         :param report_data: JSON
-        :return:
+        :return: The updated messages, for the audit log. Empty for the logs
+            which still have their messages in the report JSON.
         """
+        if not (self.report and "messages" in self.report):
+            # A single indexed UPDATE of the message row
+            deliveries = MessageDelivery.objects.filter(
+                log=self,
+                normalized_destination=normalize_destination(
+                    report_data["destination"]
+                ),
+            )
+            deliveries.update(status=report_data.get("status", ""), data=report_data)
+            self.touch()
+            return list(deliveries)
+
         report = self.report
         updated_messages = deepcopy(report["messages"])
         destination = report_data["destination"]
@@ -40,3 +309,120 @@ class DeliveryLog(UUIDPrimaryKeyModel, TimestampedModel):
         report["messages"] = updated_messages
         self.report = report
         self.save()
+        self.notify_changed()
+        return []
+
+    def update_reports(self, reports_data: List[dict]) -> None:
+        """
+        Apply several delivery reports at once. When there are many reports of
+        the same message, the last one wins.
+
+        Writes the messages in one bulk update, or the report once for the logs
+        that still have the messages in the report JSON.
+        """
+        if self.report and "messages" in self.report:
+            latest = {data["destination"]: data for data in reports_data}
+            messages = dict(self.report["messages"])
+            for k, v in messages.items():
+                data = latest.get(k) or latest.get(v.get("converted"))
+                if data is not None:
+                    messages[k] = data
+            self.report = {**self.report, "messages": messages}
+            self.save()
+            self.notify_changed()
+            return
+
+        latest = {
+            normalize_destination(data["destination"]): data for data in reports_data
+        }
+        deliveries = list(self.deliveries.filter(normalized_destination__in=latest))
+        for delivery in deliveries:
+            data = latest[delivery.normalized_destination]
+            delivery.status = data.get("status", "")
+            delivery.data = data
+        MessageDelivery.objects.bulk_update(
+            deliveries, ["status", "data"], batch_size=1000
+        )
+        self.touch()
+
+    def touch(self) -> None:
+        """
+        Update `updated_at` without saving the log, when only its messages have
+        changed. The ETag of the log is derived from `updated_at`.
+        """
+        self.updated_at = timezone.now()
+        DeliveryLog.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
+        self.notify_changed()
+
+    def notify_changed(self) -> None:
+        """
+        Wake up the event streams of the log in this process, once the
+        transaction is committed.
+        """
+        transaction.on_commit(partial(delivery_log_changes.publish, self.pk))
+
+
+class MessageDelivery(models.Model):
+    """
+    The delivery state of the message to a single recipient of a delivery log.
+    """
+
+    log = models.ForeignKey(
+        DeliveryLog,
+        related_name="deliveries",
+        on_delete=models.CASCADE,
+        verbose_name=_("delivery log"),
+    )
+    # The destination as it was sent, i.e. the key in `report["messages"]`
+    destination = models.CharField(verbose_name=_("destination"), max_length=64)
+    # The digits of the destination converted by Quriiri, for matching the
+    # delivery reports
+    normalized_destination = models.CharField(
+        verbose_name=_("normalized destination"), max_length=64
+    )
+    status = models.CharField(verbose_name=_("status"), max_length=32, blank=True)
+    # The message in the shape of `report["messages"][destination]`
+    data = models.JSONField(verbose_name=_("data"))
+
+    class Meta:
+        verbose_name = _("message delivery")
+        verbose_name_plural = _("message deliveries")
+        indexes = [
+            models.Index(
+                fields=["log", "normalized_destination"],
+                name="api_msgdelivery_dest_idx",
+            ),
+            # For the delivery status filter of the delivery logs
+            models.Index(fields=["log", "status"], name="api_msgdelivery_status_idx"),
+        ]
+
+    @classmethod
+    def from_message(
+        cls, log: DeliveryLog, destination: str, message: dict
+    ) -> "MessageDelivery":
+        return cls(
+            log=log,
+            destination=destination,
+            normalized_destination=normalize_destination(
+                message.get("converted") or destination
+            ),
+            status=message.get("status", ""),
+            data=message,
+        )
+
+
+class DeliveryReport(models.Model):
+    """
+    A delivery report received from Quriiri and waiting to be applied to its
+    delivery log, see `DELIVERY_REPORTS_BUFFERED`. Append-only, the rows are
+    deleted once applied.
+    """
+
+    # Not a foreign key, so that the webhook does not need to look the log up
+    log_id = models.UUIDField(verbose_name=_("delivery log id"))
+    data = models.JSONField(verbose_name=_("data"))
+    created_at = models.DateTimeField(verbose_name=_("created at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("delivery report")
+        verbose_name_plural = _("delivery reports")
@@ -0,0 +1,147 @@
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from api.exceptions import RateLimitExceededError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Reservation:
+    # The wall clock time (seconds since epoch) when the reserved call may be made
+    ready_at: float
+    # The cache keys and the amounts reserved from them
+    allocations: List[Tuple[str, int]] = field(default_factory=list)
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter shared by all the processes using the same cache.
+
+    Each limit (e.g. `messages` and `requests`) is a bucket of `capacity` tokens
+    that is refilled every second. The buckets are stored as per-second counters
+    in the Django cache and the tokens are taken with atomic `incr` calls, so
+    several pods and uWSGI workers can share the limits without locking.
+
+    A call that does not fit into the current second is given a slot in one of
+    the following seconds, and may wait for it at most `max_wait` seconds. With
+    `max_wait=0` the call either fits into the current second or fails right
+    away with `RateLimitExceededError`, which tells the caller when to retry.
+
+    If the cache is unavailable, a process local cache is used instead, so the
+    limiter keeps working (per process) during a cache outage.
+    """
+
+    key_prefix = "sms-rate-limit"
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        cache_alias: str = "default",
+        max_wait: float = 0.0,
+        clock=time.time,
+    ):
+        """
+        Args:
+            limits: The number of tokens per second by the limit name,
+                e.g. `{"messages": 100, "requests": 10}`.
+            cache_alias: The Django cache used for the counters.
+            max_wait: Maximum number of seconds a call may wait for its slot.
+            clock: Function returning the current wall clock time in seconds.
+        """
+        self.limits = {name: capacity for name, capacity in limits.items() if capacity}
+        self.cache_alias = cache_alias
+        self.max_wait = max_wait
+        self._clock = clock
+        self._fallback_cache = LocMemCache(f"{self.key_prefix}-fallback", {})
+
+    def reserve(self, max_wait: Optional[float] = None, **costs: int) -> Reservation:
+        """
+        Reserve tokens from the limits, e.g. `reserve(messages=5, requests=1)`.
+
+        Args:
+            max_wait: Shortens the `max_wait` of the limiter for this call, e.g.
+                to keep the wait within the deadline of the caller.
+
+        Returns:
+            The reservation. The call may be made at `reservation.ready_at`.
+
+        Raises:
+            RateLimitExceededError: If the tokens are not available within `max_wait`.
+        """
+        if max_wait is None or max_wait > self.max_wait:
+            max_wait = self.max_wait
+        now = self._clock()
+        reservation = Reservation(ready_at=now)
+        try:
+            for name, cost in costs.items():
+                if name in self.limits and cost > 0:
+                    window = self._reserve_tokens(
+                        name, cost, now, max_wait, reservation
+                    )
+                    reservation.ready_at = max(reservation.ready_at, window)
+        except RateLimitExceededError:
+            self.cancel(reservation)
+            raise
+        return reservation
+
+    def cancel(self, reservation: Reservation) -> None:
+        """
+        Give the tokens of an unused reservation back.
+        """
+        for key, amount in reservation.allocations:
+            self._incr(key, -amount, timeout=None)
+        reservation.allocations = []
+
+    def _reserve_tokens(self, name, cost, now, max_wait, reservation):
+        """
+        Take `cost` tokens from the buckets of the current and following seconds.
+
+        Returns:
+            The start time of the last second the tokens were taken from.
+        """
+        capacity = self.limits[name]
+        window = math.floor(now)
+        last_window = window
+        remaining = cost
+        while remaining > 0:
+            if window - now > max_wait:
+                raise RateLimitExceededError(retry_after=window - now)
+            key = f"{self.key_prefix}:{name}:{window}"
+            # Keep the counter alive until its second has passed
+            timeout = window - math.floor(now) + 2
+            used = self._incr(key, remaining, timeout=timeout)
+            granted = max(0, min(remaining, capacity - (used - remaining)))
+            if granted < remaining:
+                # Give back the tokens that did not fit into this second
+                self._incr(key, granted - remaining, timeout=timeout)
+            if granted:
+                reservation.allocations.append((key, granted))
+                remaining -= granted
+                last_window = window
+            window += 1
+        return last_window
+
+    def _incr(self, key, delta, timeout):
+        try:
+            return self._incr_cache(caches[self.cache_alias], key, delta, timeout)
+        except Exception as e:
+            logger.warning(f"Rate limiter cache failed, using local fallback: {e}")
+            return self._incr_cache(self._fallback_cache, key, delta, timeout)
+
+    @staticmethod
+    def _incr_cache(cache, key, delta, timeout):
+        if timeout is not None:
+            cache.add(key, 0, timeout)
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # The counter expired in between
+            cache.add(key, 0, timeout or 2)
+            return cache.incr(key, delta)
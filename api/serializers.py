@@ -1,11 +1,33 @@
+import string
+
 from rest_framework import serializers
 
-from api.models import DeliveryLog
+from api.models import DeliveryLog, MessageTemplate
 
 
 class DeliveryLogSerializer(serializers.ModelSerializer):
-    report = serializers.JSONField()
+    report = serializers.JSONField(source="get_report", read_only=True)
 
     class Meta:
         model = DeliveryLog
         fields = ("id", "report")
+
+
+class DeliveryLogListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeliveryLog
+        fields = ("id", "status", "send_at", "created_at", "updated_at")
+
+
+class MessageTemplateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MessageTemplate
+        fields = ("id", "name", "text", "created_at", "updated_at")
+
+    def validate_text(self, value):
+        if not string.Template(value).is_valid():
+            raise serializers.ValidationError(
+                "Invalid placeholder, use $name or ${name} for the variables and "
+                "$$ for a dollar sign."
+            )
+        return value
@@ -0,0 +1,515 @@
+import logging
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.enums import DeliveryStatus
+from api.exceptions import RateLimitExceededError
+from api.models import DeliveryLog, DeliveryReport, MessageDelivery
+from api.rate_limiter import RateLimiter
+from api.types import PendingMessage, SMSSender
+from api.utils import create_report, merge_reports, validate_delivery_report
+from quriiri.circuit_breaker import CircuitBreaker
+from quriiri.coalesce import CoalescingSender, split_report
+from quriiri.fake import FakeQuriiri, FakeSender
+from quriiri.send import Sender
+
+logger = logging.getLogger(__name__)
+
+
+@cache
+def get_circuit_breaker():
+    """
+    Get the circuit breaker shared by all the SMS senders of the process.
+
+    Returns:
+        The circuit breaker, or None if it is disabled.
+    """
+    if not settings.QURIIRI_CIRCUIT_BREAKER_THRESHOLD:
+        return None
+    return CircuitBreaker(
+        failure_threshold=settings.QURIIRI_CIRCUIT_BREAKER_THRESHOLD,
+        min_calls=settings.QURIIRI_CIRCUIT_BREAKER_MIN_CALLS,
+        reset_timeout=settings.QURIIRI_CIRCUIT_BREAKER_RESET_TIMEOUT,
+    )
+
+
+def create_rate_limiter() -> Optional[RateLimiter]:
+    """
+    Create the SMS provider rate limiter configured from the Django settings.
+
+    Returns:
+        The rate limiter, or None if no limits are set.
+    """
+    limits = {
+        "messages": settings.QURIIRI_MESSAGES_PER_SECOND,
+        "requests": settings.QURIIRI_REQUESTS_PER_SECOND,
+    }
+    if not any(limits.values()):
+        return None
+    return RateLimiter(
+        limits,
+        cache_alias=settings.QURIIRI_RATE_LIMIT_CACHE,
+        max_wait=settings.QURIIRI_RATE_LIMIT_MAX_WAIT,
+    )
+
+
+def get_sender_options() -> dict:
+    """
+    Get the options of the Quriiri senders from the Django settings.
+    """
+    return dict(
+        chunk_size=settings.QURIIRI_CHUNK_SIZE,
+        max_workers=settings.QURIIRI_MAX_WORKERS,
+        connect_timeout=settings.QURIIRI_CONNECT_TIMEOUT,
+        read_timeout=settings.QURIIRI_READ_TIMEOUT,
+        deadline=settings.QURIIRI_DEADLINE,
+        retries=settings.QURIIRI_RETRIES,
+        backoff_factor=settings.QURIIRI_BACKOFF_FACTOR,
+        circuit_breaker=get_circuit_breaker(),
+        rate_limiter=create_rate_limiter(),
+    )
+
+
+def create_quriiri_sender() -> Sender:
+    """
+    Create a Quriiri SMS sender configured from the Django settings.
+    """
+    return Sender(
+        settings.QURIIRI_API_KEY, settings.QURIIRI_API_URL, **get_sender_options()
+    )
+
+
+def create_fake_sender() -> FakeSender:
+    """
+    Create an SMS sender which sends the messages to an in-process fake Quriiri.
+    """
+    fake_quriiri = FakeQuriiri(
+        latency=settings.FAKE_QURIIRI_LATENCY,
+        error_rate=settings.FAKE_QURIIRI_ERROR_RATE,
+        failure_rate=settings.FAKE_QURIIRI_FAILURE_RATE,
+        delivery_report_delay=settings.FAKE_QURIIRI_DELIVERY_REPORT_DELAY,
+        delivery_reports_per_second=settings.FAKE_QURIIRI_DELIVERY_REPORTS_PER_SECOND,
+        delivery_failure_rate=settings.FAKE_QURIIRI_DELIVERY_FAILURE_RATE,
+    )
+    return FakeSender(fake_quriiri, **get_sender_options())
+
+
+def create_sms_sender() -> SMSSender:
+    """
+    Create the SMS sender with the backend chosen by the `SMS_SENDER_BACKEND`
+    setting.
+    """
+    sender = import_string(settings.SMS_SENDER_BACKEND)()
+    if settings.QURIIRI_COALESCE_WINDOW:
+        return CoalescingSender(
+            sender,
+            window=settings.QURIIRI_COALESCE_WINDOW,
+            max_destinations=settings.QURIIRI_CHUNK_SIZE or 1000,
+        )
+    return sender
+
+
+def get_batch_id(report: dict) -> Optional[uuid.UUID]:
+    """
+    Get the batch id of a message that was merged with other messages.
+
+    Args:
+        report: The delivery report returned by the SMS sender.
+
+    Returns:
+        The batch id, or None if the message was sent on its own.
+    """
+    try:
+        return uuid.UUID(report["batchid"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def send_rendered_messages(
+    sms_sender, sender: str, messages: Dict[str, List[str]], **options
+) -> dict:
+    """
+    Send a message whose text differs between the recipients, with one
+    `send_sms` call per distinct text, and merge the reports into one.
+
+    If the sending fails after some of the texts were sent, the rest of the
+    destinations are marked as failed instead of raising, so that a retry
+    would not send the same texts twice.
+
+    Args:
+        sms_sender: The SMS sender, e.g. `quriiri.send.Sender`.
+        sender: The sender of the messages.
+        messages: The destinations by text, see `MessageTemplate.render_messages`.
+        options: The options of `send_sms`.
+
+    Raises:
+        RateLimitExceededError: If the rate limit did not allow sending any of
+            the texts.
+    """
+    reports = []
+    for text, destinations in messages.items():
+        try:
+            reports.append(sms_sender.send_sms(sender, destinations, text, **options))
+        except Exception as e:
+            if not reports:
+                raise
+            logger.exception(f"Sending a rendered message failed: {e}")
+            report = create_report(destinations, "FAILED")
+            report["errors"].append({"message": repr(e)})
+            reports.append(report)
+    return merge_reports(reports)
+
+
+def send_pending_message(sms_sender, pending_message: PendingMessage) -> Optional[dict]:
+    """
+    Send a queued message with the given SMS sender.
+
+    Errors that the sender does not handle itself are converted to a failed
+    report, so that one broken message can not block the rest of the queue.
+
+    Args:
+        sms_sender: The SMS sender, e.g. `quriiri.send.Sender`.
+        pending_message: The message stored in `DeliveryLog.pending_message`.
+
+    Returns:
+        The delivery report returned by the SMS sender, or None if the rate limit
+        did not allow sending the message yet.
+    """
+    try:
+        if "messages" in pending_message:
+            return send_rendered_messages(
+                sms_sender,
+                pending_message["sender"],
+                pending_message["messages"],
+                **pending_message["options"],
+            )
+        return sms_sender.send_sms(
+            pending_message["sender"],
+            pending_message["destinations"],
+            pending_message["text"],
+            **pending_message["options"],
+        )
+    except RateLimitExceededError:
+        return None
+    except Exception as e:
+        logger.exception(f"Sending a queued message failed: {e}")
+        report = create_report(pending_message["destinations"], "FAILED")
+        report["errors"].append({"message": repr(e)})
+        return report
+
+
+def send_grouped_messages(
+    sms_sender,
+    messages: List[Tuple[uuid.UUID, PendingMessage]],
+    concurrency: int = 10,
+) -> List[Optional[dict]]:
+    """
+    Send several messages, merging the messages with the same sender and text
+    into one provider request. A message is not merged into a request which
+    already has one of its destinations, as their reports could not be told
+    apart.
+
+    A merged request uses the options of its first message, so its delivery
+    reports are sent to the webhook of the first message. The reports of the
+    merged messages have the id of the first message as the batch id, see
+    `get_batch_id`.
+
+    Args:
+        sms_sender: The SMS sender, e.g. `quriiri.send.Sender`.
+        messages: The delivery log ids and the messages to send.
+        concurrency: The maximum number of simultaneous provider requests.
+
+    Returns:
+        The report of each message, or None if the rate limit did not allow
+        sending the message.
+    """
+    batches = []
+    batches_by_text = defaultdict(list)
+    for index, (_, message) in enumerate(messages):
+        destinations = set(message["destinations"])
+        for indexes, batch_destinations in batches_by_text[
+            (message["sender"], message["text"])
+        ]:
+            if batch_destinations.isdisjoint(destinations):
+                indexes.append(index)
+                batch_destinations.update(destinations)
+                break
+        else:
+            batch = ([index], destinations)
+            batches_by_text[(message["sender"], message["text"])].append(batch)
+            batches.append(batch)
+
+    def send_batch(indexes):
+        return send_pending_message(
+            sms_sender,
+            {
+                **messages[indexes[0]][1],
+                "destinations": [
+                    destination
+                    for index in indexes
+                    for destination in messages[index][1]["destinations"]
+                ],
+            },
+        )
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        batch_reports = list(
+            executor.map(send_batch, [indexes for indexes, _ in batches])
+        )
+
+    reports = [None] * len(messages)
+    for (indexes, _), report in zip(batches, batch_reports):
+        if report is None:
+            continue
+        batchid = str(messages[indexes[0]][0]) if len(indexes) > 1 else None
+        for index in indexes:
+            reports[index] = split_report(
+                report, messages[index][1]["destinations"], batchid
+            )
+    return reports
+
+
+def send_queued_delivery_logs(
+    sms_sender, batch_size: int = 100, concurrency: int = 10
+) -> int:
+    """
+    Send a batch of queued delivery logs.
+
+    The batch is claimed with `SELECT ... FOR UPDATE SKIP LOCKED` and moved to
+    the `SENDING` status in a short transaction, so several workers can drain
+    the queue at the same time without sending the same message twice. The
+    messages are sent outside of the transaction, so no row locks or database
+    connections are held during the provider requests. A log left `SENDING` by
+    a crashed worker is not sent again, as its message may have already been
+    sent.
+
+    Args:
+        sms_sender: The SMS sender, e.g. `quriiri.send.Sender`.
+        batch_size: The maximum number of delivery logs to send.
+        concurrency: The maximum number of simultaneous provider requests.
+
+    The delivery logs that the rate limit did not allow sending are returned to
+    the queue.
+
+    Returns:
+        The number of delivery logs that were sent.
+    """
+    logs = _claim_delivery_logs(
+        DeliveryLog.objects.filter(status=DeliveryStatus.QUEUED).order_by("created_at"),
+        batch_size,
+    )
+    return _send_claimed_delivery_logs(
+        sms_sender, logs, DeliveryStatus.QUEUED, concurrency
+    )
+
+
+def send_scheduled_delivery_logs(
+    sms_sender, batch_size: int = 100, concurrency: int = 10, spread: float = 0.0
+) -> int:
+    """
+    Send a batch of the scheduled delivery logs whose send time has come.
+
+    The batch is claimed like in `send_queued_delivery_logs`, the earliest send
+    times first. The sends of the batch are spread evenly over `spread` seconds,
+    so that the messages scheduled for the same moment do not reach the SMS
+    provider as a spike. The spread is waited outside of the claiming
+    transaction, so no row locks are held meanwhile.
+
+    Args:
+        sms_sender: The SMS sender, e.g. `quriiri.send.Sender`.
+        batch_size: The maximum number of delivery logs to send.
+        concurrency: The maximum number of simultaneous provider requests.
+        spread: Seconds over which the sends of the batch are spread.
+
+    The delivery logs that the rate limit did not allow sending are returned to
+    the schedule.
+
+    Returns:
+        The number of delivery logs that were sent.
+    """
+    logs = _claim_delivery_logs(
+        DeliveryLog.objects.filter(
+            status=DeliveryStatus.SCHEDULED, send_at__lte=timezone.now()
+        ).order_by("send_at"),
+        batch_size,
+    )
+    return _send_claimed_delivery_logs(
+        sms_sender, logs, DeliveryStatus.SCHEDULED, concurrency, spread
+    )
+
+
+def _claim_delivery_logs(queryset, batch_size: int) -> List[DeliveryLog]:
+    """
+    Claim a batch of delivery logs for sending by moving them to the `SENDING`
+    status.
+    """
+    with transaction.atomic():
+        logs = list(queryset.select_for_update(skip_locked=True)[:batch_size])
+        DeliveryLog.objects.filter(id__in=[log.id for log in logs]).update(
+            status=DeliveryStatus.SENDING, updated_at=timezone.now()
+        )
+    return logs
+
+
+def _send_claimed_delivery_logs(
+    sms_sender,
+    logs: List[DeliveryLog],
+    unsent_status: DeliveryStatus,
+    concurrency: int,
+    spread: float = 0.0,
+) -> int:
+    """
+    Send the claimed delivery logs and save their reports. The logs that the
+    rate limit did not allow sending are returned to `unsent_status`.
+    """
+    if not logs:
+        return 0
+
+    start = time.monotonic()
+
+    def send(index, log):
+        if spread:
+            delay = start + spread * index / len(logs) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return send_pending_message(sms_sender, log.pending_message)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        reports = list(executor.map(send, range(len(logs)), logs))
+
+    now = timezone.now()
+    sent_logs = []
+    unsent_log_ids = []
+    deliveries = []
+    for log, report in zip(logs, reports):
+        if report is None:
+            unsent_log_ids.append(log.id)
+            continue
+        deliveries.extend(log.set_report(report))
+        log.batch_id = get_batch_id(report)
+        log.status = DeliveryStatus.SENT
+        log.pending_message = None
+        log.updated_at = now
+        sent_logs.append(log)
+
+    with transaction.atomic():
+        DeliveryLog.objects.bulk_update(
+            sent_logs,
+            ["report", "batch_id", "status", "pending_message", "updated_at"],
+        )
+        # Replace the queued or scheduled messages with the sent ones
+        MessageDelivery.objects.filter(log__in=sent_logs).delete()
+        MessageDelivery.objects.bulk_create(deliveries, batch_size=1000)
+        DeliveryLog.objects.filter(id__in=unsent_log_ids).update(
+            status=unsent_status, updated_at=now
+        )
+
+    return len(sent_logs)
+
+
+def update_delivery_logs(reports: List[Tuple[uuid.UUID, dict]]) -> List[bool]:
+    """
+    Apply delivery reports to their delivery logs. The reports of the same
+    delivery log are applied together with one update.
+
+    Args:
+        reports: The delivery log ids and the delivery reports.
+
+    Returns:
+        Whether the delivery log of each report was found.
+    """
+    logs = DeliveryLog.objects.in_bulk({log_id for log_id, _ in reports})
+    reports_by_log = defaultdict(list)
+    found = []
+    for log_id, report_data in reports:
+        log = logs.get(log_id)
+        found.append(log is not None)
+        if log is None:
+            continue
+        if log.batch_id:
+            log = log.get_batch_log_for_destination(report_data.get("destination"))
+            log = logs.setdefault(log.pk, log)
+        reports_by_log[log.pk].append(report_data)
+
+    for log_id, reports_data in reports_by_log.items():
+        _update_delivery_log(logs[log_id], reports_data)
+    return found
+
+
+def _update_delivery_log(log: DeliveryLog, reports_data: List[dict]) -> None:
+    """
+    Apply the delivery reports of a delivery log. If applying them together
+    fails, they are applied one by one and the failing ones are dropped, so that
+    one broken report can not block the rest.
+    """
+    try:
+        with transaction.atomic():
+            log.update_reports(reports_data)
+        return
+    except Exception as e:
+        logger.exception(f"Applying the delivery reports of {log.pk} failed: {e}")
+
+    log.refresh_from_db()
+    for report_data in reports_data:
+        try:
+            with transaction.atomic():
+                log.update_reports([report_data])
+        except Exception as e:
+            logger.exception(f"Dropping a delivery report of {log.pk}: {e}")
+            log.refresh_from_db()
+
+
+def apply_delivery_reports(batch_size: int = 1000) -> int:
+    """
+    Apply a batch of buffered delivery reports to their delivery logs.
+
+    The reports are claimed with `SELECT ... FOR UPDATE SKIP LOCKED`, so several
+    workers can run at the same time. The reports of the same delivery log are
+    applied together, so a burst of callbacks is one update per log. The invalid
+    reports and the reports that fail to apply are logged and dropped.
+
+    Args:
+        batch_size: The maximum number of delivery reports to apply.
+
+    Returns:
+        The number of delivery reports that were handled.
+    """
+    with transaction.atomic():
+        reports = list(
+            DeliveryReport.objects.select_for_update(skip_locked=True).order_by("id")[
+                :batch_size
+            ]
+        )
+        if not reports:
+            return 0
+
+        valid_reports = []
+        for report in reports:
+            try:
+                validate_delivery_report(report.data)
+            except ValueError as e:
+                logger.warning(f"Dropping an invalid delivery report {report.id}: {e}")
+            else:
+                valid_reports.append(report)
+
+        found = update_delivery_logs(
+            [(report.log_id, report.data) for report in valid_reports]
+        )
+        for report, log_found in zip(valid_reports, found):
+            if not log_found:
+                logger.warning(
+                    f"Dropping a delivery report of a missing log {report.log_id}"
+                )
+
+        DeliveryReport.objects.filter(id__in=[report.id for report in reports]).delete()
+
+    return len(reports)
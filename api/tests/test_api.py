@@ -1,12 +1,19 @@
 import uuid
+from unittest import mock
 
 import pytest
 from django.urls import reverse
+from freezegun import freeze_time
+from resilient_logger.models import ResilientLogEntry
 from rest_framework.authtoken.models import Token
 
+import quriiri
+from api.enums import DeliveryStatus
+from api.exceptions import RateLimitExceededError
 from api.factories import DeliveryLogFactory
 from api.models import DeliveryLog
 from api.types import MessageWebhookPayload, SendMessagePayload
+from api.utils import create_report, get_delivery_log_cache
 from common.tests.mock_data import QURIIRI_SMS_RESPONSE
 
 
@@ -46,6 +53,87 @@ def test_send_sms(token_api_client, snapshot, mock_send_sms):
     snapshot.assert_match(response.data["report"])
 
 
+def test_send_sms_async(token_api_client, settings, monkeypatch):
+    settings.SMS_SEND_ASYNC = True
+    monkeypatch.setattr(
+        quriiri.send.Sender,
+        "send_sms",
+        lambda *args, **kwargs: pytest.fail("The message should only be queued"),
+    )
+    response = token_api_client.post(
+        reverse("send_message"), SMS_PAYLOAD, format="json"
+    )
+    assert response.status_code == 202
+    log = DeliveryLog.objects.get()
+    assert response.data["id"] == str(log.id)
+    assert log.status == DeliveryStatus.QUEUED
+    assert log.get_report()["messages"] == {
+        "+358 46 1231231": {"converted": "+358 46 1231231", "status": "QUEUED"}
+    }
+    assert log.pending_message["sender"] == SMS_PAYLOAD["sender"]
+    assert log.pending_message["text"] == SMS_PAYLOAD["text"]
+    assert log.pending_message["destinations"] == ["+358 46 1231231"]
+    assert log.pending_message["options"]["drurl"].endswith(
+        reverse("delivery_log_webhook", kwargs={"id": log.id})
+    )
+
+
+def test_send_sms_rejected_destinations(token_api_client, mock_send_sms, caplog):
+    payload = {
+        **SMS_PAYLOAD,
+        "to": SMS_PAYLOAD["to"]
+        + [
+            {"destination": "abc", "format": "MOBILE"},
+            {"destination": "", "format": "MOBILE"},
+            {"destination": "123", "format": "MOBILE"},
+            {"destination": "+358 1", "format": "MOBILE"},
+        ],
+    }
+
+    response = token_api_client.post(reverse("send_message"), payload, format="json")
+
+    assert response.data["rejected"] == {
+        "contains letters": [1],
+        "empty": [2],
+        "invalid number": [3],
+        "invalid format": [4],
+    }
+    assert [record.message for record in caplog.records] == [
+        "Rejected 4 of 5 phone numbers "
+        "(contains letters: 1, empty: 1, invalid format: 1, invalid number: 1)."
+    ]
+
+
+def test_send_sms_destinations_in_recipient_order(token_api_client, settings):
+    settings.SMS_SEND_ASYNC = True
+    destinations = ["0501234567", "+358461231231", "0461231231", "0401234567"]
+    payload = {
+        **SMS_PAYLOAD,
+        "to": [{"destination": d, "format": "MOBILE"} for d in destinations],
+    }
+
+    token_api_client.post(reverse("send_message"), payload, format="json")
+
+    assert DeliveryLog.objects.get().pending_message["destinations"] == [
+        "+358 50 1234567",
+        "+358 46 1231231",
+        "+358 40 1234567",
+    ]
+
+
+def test_send_sms_rate_limit_exceeded(token_api_client, monkeypatch):
+    def send_sms(*args, **kwargs):
+        raise RateLimitExceededError(retry_after=0.4)
+
+    monkeypatch.setattr(quriiri.send.Sender, "send_sms", send_sms)
+    response = token_api_client.post(
+        reverse("send_message"), SMS_PAYLOAD, format="json"
+    )
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert DeliveryLog.objects.count() == 0
+
+
 def test_send_sms_bad_request_as_recipients_missing(
     token_api_client, snapshot, mock_send_sms
 ):
@@ -75,9 +163,10 @@ def test_send_sms_bad_request_as_no_valid_phone_numbers(
     )
     assert response.status_code == 400
     assert DeliveryLog.objects.count() == 0
-    assert (
-        response.content.decode() == "No valid destinations for SMS sender."
-    )  # Check the error message
+    assert response.json() == {
+        "error": "No valid destinations for SMS sender.",
+        "rejected": {"contains letters": [0]},
+    }
 
 
 def test_webhook_delivery_log(
@@ -93,7 +182,7 @@ def test_webhook_delivery_log(
 
     assert DeliveryLog.objects.count() == 1
     log = DeliveryLog.objects.first()
-    snapshot.assert_match(log.report)
+    snapshot.assert_match(log.get_report())
 
     webhook_data = SMS_WEBHOOK_DATA
 
@@ -103,7 +192,51 @@ def test_webhook_delivery_log(
         format="json",
     )
     log.refresh_from_db()
-    snapshot.assert_match(log.report)
+    snapshot.assert_match(log.get_report())
+
+
+def test_webhook_delivery_log_routed_to_batch_log(anonymous_api_client):
+    batch_id = uuid.uuid4()
+    leader = DeliveryLogFactory(
+        batch_id=batch_id, report=create_report(["+358461231232"], "SENT")
+    )
+    follower = DeliveryLogFactory(
+        batch_id=batch_id, report=create_report(["+358461231231"], "SENT")
+    )
+
+    # The delivery reports of the batch are sent to the webhook of the leader
+    response = anonymous_api_client.post(
+        reverse("delivery_log_webhook", kwargs={"id": str(leader.id)}),
+        data=SMS_WEBHOOK_DATA,
+        format="json",
+    )
+
+    assert response.status_code == 200
+    leader.refresh_from_db()
+    follower.refresh_from_db()
+    assert leader.report["messages"]["+358461231232"]["status"] == "SENT"
+    assert follower.report["messages"]["+358461231231"]["status"] == "DELIVERED"
+
+
+def test_webhook_delivery_log_updates_single_message(anonymous_api_client):
+    log = DeliveryLogFactory()
+    log.save_report(create_report(["+358461231231", "+358461231232"], "CREATED"))
+
+    anonymous_api_client.post(
+        reverse("delivery_log_webhook", kwargs={"id": str(log.id)}),
+        data={**SMS_WEBHOOK_DATA, "destination": "358461231231"},
+        format="json",
+    )
+
+    assert log.get_report() == {
+        "errors": [],
+        "warnings": [],
+        "messages": {
+            "+358461231231": {**SMS_WEBHOOK_DATA, "destination": "358461231231"},
+            "+358461231232": {"converted": "+358461231232", "status": "CREATED"},
+        },
+    }
+    assert log.deliveries.get(destination="+358461231231").status == "DELIVERED"
 
 
 def test_get_delivery_log_unauthenticated_or_unauthorized(
@@ -127,3 +260,86 @@ def test_get_delivery_log(token_api_client, snapshot):
     token_api_client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
     response = token_api_client.get(reverse("get_message", kwargs={"id": str(log.id)}))
     snapshot.assert_match(response.data["report"])
+
+
+def test_get_delivery_log_not_modified(token_api_client):
+    log = DeliveryLogFactory()
+    log.save_report(QURIIRI_SMS_RESPONSE)
+    token, _ = Token.objects.get_or_create(user=log.user)
+    token_api_client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+    url = reverse("get_message", kwargs={"id": str(log.id)})
+
+    response = token_api_client.get(url)
+    assert response.status_code == 200
+    assert response["Last-Modified"] == "Sat, 04 Jan 2020 00:00:00 GMT"
+    etag = response["ETag"]
+
+    with mock.patch("api.views.DeliveryLogSerializer") as serializer:
+        response = token_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+    serializer.assert_not_called()
+    assert ResilientLogEntry.objects.filter(context__target__path=url).count() == 2
+
+    # The delivery report updates the message row, not the log itself
+    with freeze_time("2020-01-04 00:00:01"):
+        log.update_report({**SMS_WEBHOOK_DATA, "destination": "+358461231231"})
+    response = token_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert response.data["report"]["messages"]["+358461231231"]["status"] == (
+        "DELIVERED"
+    )
+
+
+def test_get_delivery_log_ignores_if_modified_since(token_api_client):
+    log = DeliveryLogFactory()
+    log.save_report(QURIIRI_SMS_RESPONSE)
+    token, _ = Token.objects.get_or_create(user=log.user)
+    token_api_client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+    url = reverse("get_message", kwargs={"id": str(log.id)})
+    last_modified = token_api_client.get(url)["Last-Modified"]
+
+    # A change within the same second as the last read one
+    with freeze_time("2020-01-04 00:00:00.5"):
+        log.update_report({**SMS_WEBHOOK_DATA, "destination": "+358461231231"})
+    response = token_api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+    assert response.status_code == 200
+    assert response["Last-Modified"] == last_modified
+    assert response.data["report"]["messages"]["+358461231231"]["status"] == (
+        "DELIVERED"
+    )
+
+
+def test_get_delivery_log_cached(token_api_client, user_api_client):
+    log = DeliveryLogFactory()
+    log.save_report(QURIIRI_SMS_RESPONSE)
+    token, _ = Token.objects.get_or_create(user=log.user)
+    token_api_client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+    url = reverse("get_message", kwargs={"id": str(log.id)})
+    get_delivery_log_cache().clear()
+
+    response = token_api_client.get(url)
+    assert response.status_code == 200
+    data = response.data
+
+    with mock.patch("api.views.DeliveryLogSerializer") as serializer:
+        response = token_api_client.get(url)
+    serializer.assert_not_called()
+    assert response.status_code == 200
+    assert response.data == data
+    assert response["ETag"]
+    assert get_delivery_log_cache().stats()["hits"] == 1
+    assert ResilientLogEntry.objects.filter(context__target__path=url).count() == 2
+
+    # The cached log is not given to the other users
+    assert user_api_client.get(url).status_code == 404
+
+    # A delivery report changes the version of the log
+    with freeze_time("2020-01-04 00:00:01"):
+        log.update_report({**SMS_WEBHOOK_DATA, "destination": "+358461231231"})
+    response = token_api_client.get(url)
+    assert response.data["report"]["messages"]["+358461231231"]["status"] == (
+        "DELIVERED"
+    )
@@ -0,0 +1,195 @@
+import uuid
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from api.factories import DeliveryLogFactory
+from api.models import DeliveryLog, DeliveryReport
+from api.utils import create_report
+
+DESTINATIONS = ["+358461231231", "+358401234567"]
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    pass
+
+
+@pytest.fixture
+def buffered(settings):
+    settings.DELIVERY_REPORTS_BUFFERED = True
+
+
+def _create_delivery_report(destination, status="DELIVERED"):
+    return {
+        "sender": "hel.fi",
+        "destination": destination,
+        "status": status,
+        "statustime": "2020-07-21T09:18:00Z",
+        "smscount": "1",
+        "billingref": "Palvelutarjotin",
+    }
+
+
+def _post_delivery_report(client, log_id, data):
+    return client.post(
+        reverse("delivery_log_webhook", kwargs={"id": str(log_id)}),
+        data=data,
+        format="json",
+    )
+
+
+def test_webhook_buffers_delivery_report(buffered, anonymous_api_client):
+    log = DeliveryLogFactory()
+    log.save_report(create_report(DESTINATIONS, "CREATED"))
+
+    response = _post_delivery_report(
+        anonymous_api_client, log.id, _create_delivery_report(DESTINATIONS[0])
+    )
+
+    assert response.status_code == 200
+    report = DeliveryReport.objects.get()
+    assert report.log_id == log.id
+    assert report.data == _create_delivery_report(DESTINATIONS[0])
+    # The report is applied later
+    assert log.get_report()["messages"][DESTINATIONS[0]]["status"] == "CREATED"
+
+
+def test_apply_delivery_reports(buffered, anonymous_api_client):
+    log = DeliveryLogFactory()
+    log.save_report(create_report(DESTINATIONS, "CREATED"))
+    for data in [
+        _create_delivery_report(DESTINATIONS[0], "UNKNOWN"),
+        _create_delivery_report(DESTINATIONS[1], "FAILED"),
+        _create_delivery_report(DESTINATIONS[0], "DELIVERED"),
+    ]:
+        _post_delivery_report(anonymous_api_client, log.id, data)
+
+    call_command("apply_delivery_reports", "--once")
+
+    assert log.get_report()["messages"] == {
+        DESTINATIONS[0]: _create_delivery_report(DESTINATIONS[0], "DELIVERED"),
+        DESTINATIONS[1]: _create_delivery_report(DESTINATIONS[1], "FAILED"),
+    }
+    assert not DeliveryReport.objects.exists()
+
+
+def test_apply_delivery_reports_to_report_json(buffered, anonymous_api_client):
+    log = DeliveryLogFactory(report=create_report(DESTINATIONS, "CREATED"))
+    for destination in DESTINATIONS:
+        _post_delivery_report(
+            anonymous_api_client, log.id, _create_delivery_report(destination)
+        )
+
+    call_command("apply_delivery_reports", "--once")
+
+    log.refresh_from_db()
+    assert {m["status"] for m in log.report["messages"].values()} == {"DELIVERED"}
+
+
+def test_apply_delivery_reports_to_batch_log(buffered, anonymous_api_client):
+    batch_id = uuid.uuid4()
+    leader = DeliveryLogFactory(batch_id=batch_id)
+    leader.save_report(create_report(DESTINATIONS[:1], "CREATED"))
+    follower = DeliveryLogFactory(batch_id=batch_id)
+    follower.save_report(create_report(DESTINATIONS[1:], "CREATED"))
+    for destination in DESTINATIONS:
+        _post_delivery_report(
+            anonymous_api_client, leader.id, _create_delivery_report(destination)
+        )
+
+    call_command("apply_delivery_reports", "--once")
+
+    for log in leader, follower:
+        statuses = {m["status"] for m in log.get_report()["messages"].values()}
+        assert statuses == {"DELIVERED"}
+
+
+def test_webhook_buffered_report_of_missing_log(buffered, anonymous_api_client):
+    response = _post_delivery_report(
+        anonymous_api_client, uuid.uuid4(), _create_delivery_report(DESTINATIONS[0])
+    )
+
+    # Quriiri retries the report like with the reports applied right away
+    assert response.status_code == 404
+    assert not DeliveryReport.objects.exists()
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        [_create_delivery_report(DESTINATIONS[0])],
+        {"status": "DELIVERED"},
+        _create_delivery_report(358461231231),
+    ],
+)
+def test_webhook_buffered_invalid_report(buffered, anonymous_api_client, data):
+    log = DeliveryLogFactory()
+
+    response = _post_delivery_report(anonymous_api_client, log.id, data)
+
+    assert response.status_code == 400
+    assert not DeliveryReport.objects.exists()
+
+
+def test_apply_delivery_reports_of_missing_log():
+    # The log was deleted after the report was received
+    DeliveryReport.objects.create(
+        log_id=uuid.uuid4(), data=_create_delivery_report(DESTINATIONS[0])
+    )
+
+    call_command("apply_delivery_reports", "--once")
+
+    assert not DeliveryReport.objects.exists()
+
+
+def test_apply_delivery_reports_drops_invalid_reports():
+    log = DeliveryLogFactory()
+    log.save_report(create_report(DESTINATIONS, "CREATED"))
+    for data in [
+        {"status": "DELIVERED"},
+        ["not", "a", "report"],
+        _create_delivery_report(DESTINATIONS[0]),
+    ]:
+        DeliveryReport.objects.create(log_id=log.id, data=data)
+
+    call_command("apply_delivery_reports", "--once")
+
+    assert log.get_report()["messages"][DESTINATIONS[0]]["status"] == "DELIVERED"
+    assert not DeliveryReport.objects.exists()
+
+
+def test_apply_delivery_reports_drops_failing_reports():
+    log = DeliveryLogFactory()
+    log.save_report(create_report(DESTINATIONS, "CREATED"))
+    for destination in DESTINATIONS:
+        DeliveryReport.objects.create(
+            log_id=log.id, data=_create_delivery_report(destination)
+        )
+    update_reports = DeliveryLog.update_reports
+
+    def fail_on_first_destination(self, reports_data):
+        if any(data["destination"] == DESTINATIONS[0] for data in reports_data):
+            raise ValueError("Boom")
+        return update_reports(self, reports_data)
+
+    with mock.patch.object(
+        DeliveryLog,
+        "update_reports",
+        autospec=True,
+        side_effect=fail_on_first_destination,
+    ):
+        call_command("apply_delivery_reports", "--once")
+
+    # The other report of the log was still applied
+    messages = log.get_report()["messages"]
+    assert messages[DESTINATIONS[0]]["status"] == "CREATED"
+    assert messages[DESTINATIONS[1]]["status"] == "DELIVERED"
+    assert not DeliveryReport.objects.exists()
+
+
+def test_apply_delivery_reports_invalid_arguments():
+    with pytest.raises(ValueError):
+        call_command("apply_delivery_reports", "--once", "--batch-size=0")
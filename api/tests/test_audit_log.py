@@ -4,6 +4,7 @@ from resilient_logger.models import ResilientLogEntry
 
 from api.factories import DeliveryLogFactory
 from api.models import DeliveryLog
+from api.utils import create_report
 from audit_log.enums import Operation, StoreObjectState
 
 
@@ -231,3 +232,104 @@ def test_audit_log_converts_delivery_log_messages_to_list(admin_user, settings):
     assert isinstance(delivery_log.report["messages"], dict), (
         "Messages should stay dict in DB"
     )
+
+
+def test_delivery_report_webhook_writes_updated_messages(db, client, settings):
+    settings.AUDIT_LOG = {
+        **settings.AUDIT_LOG,
+        "STORE_OBJECT_STATE": StoreObjectState.OLD_AND_NEW_BOTH.value,
+    }
+    log = DeliveryLogFactory()
+    log.save_report(create_report(["+358461231231", "+358461231232"], "CREATED"))
+    url = reverse("delivery_log_webhook", kwargs={"id": str(log.id)})
+
+    response = client.post(
+        url,
+        {"destination": "+358461231231", "status": "DELIVERED"},
+        content_type="application/json",
+    )
+
+    assert response.status_code == 200
+    audit_log = ResilientLogEntry.objects.get(context__target__path=url)
+    new_states = [
+        state["new_object_state"]
+        for state in audit_log.context["target"]["object_states"]
+    ]
+    assert len(new_states) == 2
+    assert new_states[1]["destination"] == "+358461231231"
+    assert new_states[1]["status"] == "DELIVERED"
+    assert new_states[1]["data"] == {
+        "destination": "+358461231231",
+        "status": "DELIVERED",
+    }
+
+
+def _get_object_states(path, state):
+    audit_log = ResilientLogEntry.objects.get(context__target__path=path)
+    return [
+        object_state[state]
+        for object_state in audit_log.context["target"]["object_states"]
+    ]
+
+
+def test_send_message_writes_recipients(db, token_api_client, mock_send_sms, settings):
+    settings.AUDIT_LOG = {
+        **settings.AUDIT_LOG,
+        "STORE_OBJECT_STATE": StoreObjectState.OLD_AND_NEW_BOTH.value,
+    }
+    url = reverse("send_message")
+
+    response = token_api_client.post(
+        url,
+        {
+            "sender": "Hel.fi",
+            "to": [{"destination": "+358461231231", "format": "MOBILE"}],
+            "text": "SMS message",
+        },
+        format="json",
+    )
+
+    assert response.status_code == 200
+    new_states = _get_object_states(url, "new_object_state")
+    assert len(new_states) == 2
+    assert new_states[1]["destination"] == "+358461231231"
+    assert new_states[1]["status"] == "CREATED"
+
+
+def test_get_delivery_log_writes_recipients(db, user, user_api_client, settings):
+    settings.AUDIT_LOG = {
+        **settings.AUDIT_LOG,
+        "STORE_OBJECT_STATE": StoreObjectState.OLD_AND_NEW_BOTH.value,
+    }
+    log = DeliveryLogFactory(user=user)
+    log.save_report(create_report(["+358461231231"], "CREATED"))
+    url = reverse("get_message", kwargs={"id": str(log.id)})
+
+    response = user_api_client.get(url)
+
+    assert response.status_code == 200
+    assert response.data["report"]["messages"]["+358461231231"]["status"] == "CREATED"
+    old_states = _get_object_states(url, "old_object_state")
+    assert len(old_states) == 2
+    assert old_states[1]["destination"] == "+358461231231"
+
+
+def test_delivery_log_admin_changelist_counts_messages(
+    admin_user, django_assert_max_num_queries
+):
+    client = Client()
+    client.force_login(admin_user)
+    for _ in range(3):
+        log = DeliveryLogFactory()
+        log.save_report(create_report(["+358461231231", "+358461231232"], "CREATED"))
+    DeliveryLogFactory(report={"messages": {"+358461231233": {"status": "SENT"}}})
+
+    # The messages of the logs are not loaded row by row
+    with django_assert_max_num_queries(9):
+        response = client.get(reverse("admin:api_deliverylog_changelist"))
+
+    assert response.status_code == 200
+    changelist = response.context["cl"]
+    assert sorted(
+        changelist.model_admin.get_message_count(log) for log in changelist.result_list
+    ) == [1, 2, 2, 2]
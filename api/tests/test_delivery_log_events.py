@@ -0,0 +1,146 @@
+import asyncio
+import threading
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.urls import reverse
+from freezegun import freeze_time
+from resilient_logger.models import ResilientLogEntry
+
+from api.events import DeliveryLogChanges
+from api.factories import DeliveryLogFactory
+from api.utils import create_report
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    """Rename the db fixture"""
+
+
+@pytest.fixture(autouse=True)
+def setup_test_environment():
+    """Let the event loops use the real clock for the timeouts"""
+    with freeze_time("2020-01-04", real_asyncio=True):
+        yield
+
+
+@pytest.fixture
+def delivery_log(user):
+    log = DeliveryLogFactory(user=user)
+    log.save_report(create_report(["+358461231231", "+358461231232"], "CREATED"))
+    return log
+
+
+def _get_events(client, log, **params):
+    response = client.get(
+        reverse("delivery_log_events", kwargs={"id": str(log.id)}), params
+    )
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/event-stream"
+    return async_to_sync(_read)(response.streaming_content).decode()
+
+
+async def _read(streaming_content):
+    return b"".join([chunk async for chunk in streaming_content])
+
+
+def test_delivery_log_events_unauthenticated(anonymous_api_client, delivery_log):
+    response = anonymous_api_client.get(
+        reverse("delivery_log_events", kwargs={"id": str(delivery_log.id)})
+    )
+    assert response.status_code == 401
+
+
+def test_delivery_log_events_of_another_user(token_api_client, delivery_log):
+    response = token_api_client.get(
+        reverse("delivery_log_events", kwargs={"id": str(delivery_log.id)})
+    )
+    assert response.status_code == 404
+
+
+def test_delivery_log_events_timeout(user_api_client, delivery_log):
+    content = _get_events(user_api_client, delivery_log, wait=0)
+
+    assert content == (
+        "event: status\n"
+        'data: {"destination": "+358461231231", "status": "CREATED"}\n\n'
+        "event: status\n"
+        'data: {"destination": "+358461231232", "status": "CREATED"}\n\n'
+    )
+    url = reverse("delivery_log_events", kwargs={"id": str(delivery_log.id)})
+    assert ResilientLogEntry.objects.filter(context__target__path=url).count() == 1
+
+
+def test_delivery_log_events_done(user_api_client, delivery_log, settings):
+    settings.DELIVERY_LOG_EVENTS_POLL_INTERVAL = 0.01
+    delivery_log.update_reports(
+        [{"destination": "+358461231231", "status": "DELIVERED"}]
+    )
+    delivery_log.update_reports([{"destination": "+358461231232", "status": "FAILED"}])
+
+    content = _get_events(user_api_client, delivery_log, wait=10)
+
+    assert content.endswith(
+        'data: {"destination": "+358461231232", "status": "FAILED"}\n\n'
+        "event: done\ndata: {}\n\n"
+    )
+
+
+def test_delivery_log_events_invalid_wait(user_api_client, delivery_log):
+    response = user_api_client.get(
+        reverse("delivery_log_events", kwargs={"id": str(delivery_log.id)}),
+        {"wait": "soon"},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("wait", ["nan", "inf", "-inf"])
+def test_delivery_log_events_non_finite_wait(user_api_client, delivery_log, wait):
+    response = user_api_client.get(
+        reverse("delivery_log_events", kwargs={"id": str(delivery_log.id)}),
+        {"wait": wait},
+    )
+    assert response.status_code == 400
+
+
+def test_delivery_log_events_wsgi_timeout(user_api_client, delivery_log, settings):
+    settings.DELIVERY_LOG_EVENTS_WSGI_TIMEOUT = 0
+
+    # The test client is a WSGI request
+    content = _get_events(user_api_client, delivery_log, wait=300)
+
+    assert "event: done" not in content
+    assert content.count("event: status") == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_delivery_log_events_release_connection(
+    user_api_client, delivery_log, settings
+):
+    settings.DELIVERY_LOG_EVENTS_POLL_INTERVAL = 0.01
+
+    with mock.patch.object(connection, "close", wraps=connection.close) as close:
+        _get_events(user_api_client, delivery_log, wait=0.05)
+
+    # Released before every wait for the changes
+    assert close.call_count >= 2
+
+
+def test_delivery_log_changes_publish_from_another_thread():
+    changes = DeliveryLogChanges()
+
+    async def wait():
+        threading.Timer(0.01, changes.publish, ["log-id"]).start()
+        return await changes.wait("log-id", timeout=5)
+
+    assert asyncio.run(wait()) is True
+    assert changes._waiters == {}
+
+
+def test_delivery_log_changes_timeout():
+    changes = DeliveryLogChanges()
+    changes.publish("another-log-id")
+
+    assert asyncio.run(changes.wait("log-id", timeout=0.01)) is False
@@ -0,0 +1,136 @@
+import json
+import uuid
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+
+from api.factories import DeliveryLogFactory
+from api.models import DeliveryReport
+from api.utils import create_report, get_default_options
+
+DESTINATIONS = ["+358461231231", "+358401234567"]
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    pass
+
+
+@pytest.fixture
+def delivery_logs():
+    logs = []
+    for destination in DESTINATIONS:
+        log = DeliveryLogFactory()
+        log.save_report(create_report([destination], "CREATED"))
+        logs.append(log)
+    return logs
+
+
+def _create_delivery_report(log, destination, status="DELIVERED"):
+    return {
+        "sender": "hel.fi",
+        "destination": destination,
+        "status": status,
+        "statustime": "2020-07-21T09:18:00Z",
+        "smscount": "1",
+        "batchid": str(log.id),
+    }
+
+
+def _post(body, content_type="application/json"):
+    return Client().post(
+        reverse("delivery_reports_webhook"), data=body, content_type=content_type
+    )
+
+
+def test_get_default_options_batch_delivery_reports(settings, rf):
+    settings.QURIIRI_BATCH_DELIVERY_REPORTS = True
+    log_id = uuid.uuid4()
+
+    options = get_default_options(rf.post("/"), id=log_id)
+
+    assert options["drurl"].endswith(reverse("delivery_reports_webhook"))
+    assert options["drtype"] == "json"
+    assert options["batchid"] == str(log_id)
+
+
+def test_delivery_reports_webhook_json_array(delivery_logs):
+    reports = [
+        _create_delivery_report(log, destination)
+        for log, destination in zip(delivery_logs, DESTINATIONS)
+    ]
+
+    response = _post(json.dumps(reports))
+
+    assert response.status_code == 200
+    assert response.json() == {"results": [{"status": "ok"}, {"status": "ok"}]}
+    for log, report in zip(delivery_logs, reports):
+        assert log.get_report()["messages"][report["destination"]] == report
+
+
+def test_delivery_reports_webhook_ndjson(delivery_logs):
+    log = delivery_logs[0]
+    body = "\n".join(
+        json.dumps(_create_delivery_report(log, DESTINATIONS[0], status))
+        for status in ["UNKNOWN", "DELIVERED"]
+    )
+
+    response = _post(body, content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 2
+    message = log.get_report()["messages"][DESTINATIONS[0]]
+    assert message["status"] == "DELIVERED"
+
+
+def test_delivery_reports_webhook_per_item_errors(delivery_logs):
+    missing_log_id = uuid.uuid4()
+    reports = [
+        _create_delivery_report(delivery_logs[0], DESTINATIONS[0]),
+        {"destination": DESTINATIONS[0]},
+        {"destination": DESTINATIONS[0], "batchid": "invalid"},
+        {"batchid": str(delivery_logs[0].id)},
+        "invalid",
+        {"destination": DESTINATIONS[0], "batchid": str(missing_log_id)},
+        {"destination": 358461231231, "batchid": str(delivery_logs[0].id)},
+    ]
+
+    response = _post(json.dumps(reports))
+
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"status": "ok"},
+        {"status": "error", "error": "Missing batchid"},
+        {"status": "error", "error": "Invalid batchid: invalid"},
+        {"status": "error", "error": "Missing destination"},
+        {"status": "error", "error": "Expected a JSON object"},
+        {"status": "error", "error": f"Message ID: {missing_log_id} does not exist"},
+        {"status": "error", "error": "Expected the destination to be a string"},
+    ]
+
+
+def test_delivery_reports_webhook_buffered(settings, delivery_logs):
+    settings.DELIVERY_REPORTS_BUFFERED = True
+    reports = [
+        _create_delivery_report(log, destination)
+        for log, destination in zip(delivery_logs, DESTINATIONS)
+    ]
+
+    missing_log_report = {**reports[0], "batchid": str(uuid.uuid4())}
+
+    response = _post(json.dumps([*reports, missing_log_report]))
+
+    assert response.status_code == 200
+    assert response.json()["results"][2] == {
+        "status": "error",
+        "error": f"Message ID: {missing_log_report['batchid']} does not exist",
+    }
+    assert [r.data for r in DeliveryReport.objects.order_by("id")] == reports
+
+
+@pytest.mark.parametrize("body", ["{invalid", "[{}, {}"])
+def test_delivery_reports_webhook_invalid_body(body):
+    response = _post(body)
+
+    assert response.status_code == 400
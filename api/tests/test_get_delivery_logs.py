@@ -0,0 +1,108 @@
+import uuid
+
+import pytest
+from django.urls import reverse
+from resilient_logger.models import ResilientLogEntry
+
+from api.factories import DeliveryLogFactory
+from api.utils import create_report
+from common.tests.mock_data import QURIIRI_SMS_RESPONSE
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    """Rename the db fixture"""
+
+
+@pytest.fixture
+def delivery_logs(user):
+    logs = DeliveryLogFactory.create_batch(3, user=user)
+    for index, log in enumerate(logs):
+        log.save_report(create_report([f"+35846123123{index}"], "CREATED"))
+    return logs
+
+
+def _get_delivery_logs(client, payload):
+    return client.post(reverse("get_messages"), payload, format="json")
+
+
+def test_get_delivery_logs_unauthenticated(anonymous_api_client):
+    response = _get_delivery_logs(anonymous_api_client, {"ids": []})
+    assert response.status_code == 401
+
+
+def test_get_delivery_logs(user_api_client, delivery_logs, django_assert_num_queries):
+    other_log = DeliveryLogFactory()
+    legacy_log = DeliveryLogFactory(
+        user=delivery_logs[0].user, report=QURIIRI_SMS_RESPONSE
+    )
+    missing_id = str(uuid.uuid4())
+    ids = [str(log.id) for log in reversed(delivery_logs)] + [
+        str(legacy_log.id),
+        str(other_log.id),
+        missing_id,
+        "invalid",
+    ]
+
+    with django_assert_num_queries(5):
+        response = _get_delivery_logs(user_api_client, {"ids": ids})
+
+    assert response.status_code == 200
+    assert response.data["results"] == [
+        {"id": str(log.id), "report": log.get_report()}
+        for log in [*reversed(delivery_logs), legacy_log]
+    ]
+    assert response.data["not_found"] == [str(other_log.id), missing_id, "invalid"]
+    assert (
+        ResilientLogEntry.objects.filter(
+            context__target__path=reverse("get_messages")
+        ).count()
+        == 1
+    )
+
+
+def test_get_delivery_logs_statuses_only(user_api_client, delivery_logs):
+    delivery_logs[0].update_reports(
+        [{"destination": "+358461231230", "status": "DELIVERED"}]
+    )
+
+    response = _get_delivery_logs(
+        user_api_client,
+        {"ids": [str(log.id) for log in delivery_logs[:2]], "statuses_only": True},
+    )
+
+    assert response.data["results"] == [
+        {
+            "id": str(delivery_logs[0].id),
+            "status": "SENT",
+            "messages": {"+358461231230": "DELIVERED"},
+        },
+        {
+            "id": str(delivery_logs[1].id),
+            "status": "SENT",
+            "messages": {"+358461231231": "CREATED"},
+        },
+    ]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {},
+        {"ids": "id"},
+        {"ids": [1]},
+        [],
+        {"ids": [], "statuses_only": "false"},
+        {"ids": [], "statuses_only": 1},
+    ],
+)
+def test_get_delivery_logs_bad_request(user_api_client, payload):
+    assert _get_delivery_logs(user_api_client, payload).status_code == 400
+
+
+def test_get_delivery_logs_too_many_ids(user_api_client, settings):
+    settings.DELIVERY_LOG_BATCH_MAX_SIZE = 2
+
+    response = _get_delivery_logs(user_api_client, {"ids": ["1", "2", "3"]})
+
+    assert response.status_code == 400
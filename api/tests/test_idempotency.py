@@ -0,0 +1,177 @@
+from copy import deepcopy
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.response import Response
+
+import quriiri.send
+from api.exceptions import RateLimitExceededError
+from api.idempotency import get_idempotency_store, IdempotencyStore
+from api.models import DeliveryLog
+from common.tests.mock_data import QURIIRI_SMS_RESPONSE
+
+SMS_PAYLOAD = {
+    "sender": "Hel.fi",
+    "to": [{"destination": "+358461231231", "format": "MOBILE"}],
+    "text": "SMS message",
+}
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    """Rename the db fixture"""
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def send_calls(monkeypatch):
+    calls = []
+
+    def send_sms(*args, **kwargs):
+        calls.append(args)
+        return deepcopy(QURIIRI_SMS_RESPONSE)
+
+    monkeypatch.setattr(quriiri.send.Sender, "send_sms", send_sms)
+    return calls
+
+
+def _send(client, key, payload=SMS_PAYLOAD):
+    return client.post(
+        reverse("send_message"), payload, format="json", HTTP_IDEMPOTENCY_KEY=key
+    )
+
+
+def test_send_without_key_is_not_idempotent(token_api_client, send_calls):
+    for _ in range(2):
+        response = token_api_client.post(
+            reverse("send_message"), SMS_PAYLOAD, format="json"
+        )
+        assert response.status_code == 200
+        assert "Idempotent-Replayed" not in response
+
+    assert len(send_calls) == 2
+    assert DeliveryLog.objects.count() == 2
+
+
+def test_send_with_same_key_is_sent_once(token_api_client, send_calls):
+    first = _send(token_api_client, "key-1")
+    second = _send(token_api_client, "key-1")
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first
+    assert len(send_calls) == 1
+    assert DeliveryLog.objects.count() == 1
+
+
+def test_send_with_different_keys(token_api_client, send_calls):
+    first = _send(token_api_client, "key-1")
+    second = _send(token_api_client, "key-2")
+
+    assert first.json()["id"] != second.json()["id"]
+    assert len(send_calls) == 2
+
+
+def test_keys_are_scoped_per_user(token_api_client, user_api_client, send_calls):
+    first = _send(token_api_client, "key-1")
+    second = _send(user_api_client, "key-1")
+
+    assert first.json()["id"] != second.json()["id"]
+    assert "Idempotent-Replayed" not in second
+    assert len(send_calls) == 2
+
+
+def test_key_reused_with_another_payload(token_api_client, send_calls):
+    _send(token_api_client, "key-1")
+    response = _send(token_api_client, "key-1", {**SMS_PAYLOAD, "text": "Other"})
+
+    assert response.status_code == 422
+    assert len(send_calls) == 1
+
+
+@pytest.mark.parametrize("key", ["", "x" * 256])
+def test_invalid_key(token_api_client, send_calls, key):
+    response = _send(token_api_client, key)
+
+    assert response.status_code == 400
+    assert len(send_calls) == 0
+
+
+def test_validation_error_is_replayed(token_api_client, send_calls):
+    first = _send(token_api_client, "key-1", {"sender": "Hel.fi"})
+    second = _send(token_api_client, "key-1", {"sender": "Hel.fi"})
+
+    assert first.status_code == second.status_code == 400
+    assert second.content == first.content
+    assert second["Idempotent-Replayed"] == "true"
+
+
+def test_rate_limited_response_is_not_stored(token_api_client, monkeypatch):
+    def send_sms(*args, **kwargs):
+        raise RateLimitExceededError(retry_after=1)
+
+    monkeypatch.setattr(quriiri.send.Sender, "send_sms", send_sms)
+    assert _send(token_api_client, "key-1").status_code == 429
+
+    monkeypatch.setattr(
+        quriiri.send.Sender,
+        "send_sms",
+        lambda *args, **kwargs: deepcopy(QURIIRI_SMS_RESPONSE),
+    )
+    response = _send(token_api_client, "key-1")
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response
+
+
+def test_concurrent_request_with_same_key(user, user_api_client, send_calls, settings):
+    settings.IDEMPOTENCY_KEY_WAIT = 0.1
+    IdempotencyStore().acquire(user.pk, "key-1")
+
+    response = _send(user_api_client, "key-1")
+
+    assert response.status_code == 409
+    assert len(send_calls) == 0
+
+
+def test_response_stored_before_acquiring_the_lock(token_api_client, send_calls):
+    first = _send(token_api_client, "key-1")
+    get = IdempotencyStore.get
+    calls = []
+
+    def get_after_concurrent_request(self, user_id, key):
+        # The first lookup misses the response of the concurrent request
+        calls.append(key)
+        return None if len(calls) == 1 else get(self, user_id, key)
+
+    with mock.patch.object(IdempotencyStore, "get", get_after_concurrent_request):
+        second = _send(token_api_client, "key-1")
+
+    assert second.json()["id"] == first.json()["id"]
+    assert second["Idempotent-Replayed"] == "true"
+    assert len(send_calls) == 1
+    # The lock was released
+    user_id = DeliveryLog.objects.get(id=first.json()["id"]).user_id
+    assert get_idempotency_store().acquire(user_id, "key-1")
+
+
+def test_store_wait_returns_the_response_of_concurrent_request():
+    store = IdempotencyStore(poll_interval=0.01)
+    store.acquire(1, "key")
+    store.save(1, "key", "fingerprint", Response({}, status=200))
+
+    assert store.wait(1, "key", timeout=0.1)["status"] == 200
+
+
+def test_store_wait_stops_when_the_lock_is_released():
+    store = IdempotencyStore(poll_interval=0.01)
+
+    assert store.wait(1, "key", timeout=10) is None
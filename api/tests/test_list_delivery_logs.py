@@ -0,0 +1,124 @@
+import pytest
+from django.urls import reverse
+from freezegun import freeze_time
+from resilient_logger.models import ResilientLogEntry
+
+from api.enums import DeliveryStatus
+from api.factories import DeliveryLogFactory
+from api.utils import create_report
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    """Rename the db fixture"""
+
+
+def _list_delivery_logs(client, **params):
+    response = client.get(reverse("list_messages"), params)
+    assert response.status_code == 200
+    return response.data
+
+
+def _ids(logs):
+    return [str(log.id) for log in logs]
+
+
+def test_list_delivery_logs_unauthenticated(anonymous_api_client):
+    response = anonymous_api_client.get(reverse("list_messages"))
+    assert response.status_code == 401
+
+
+def test_list_delivery_logs_pages(user_api_client, user):
+    # The logs created at the same time are ordered by the id
+    logs = DeliveryLogFactory.create_batch(3, user=user)
+    with freeze_time("2020-01-05"):
+        logs += DeliveryLogFactory.create_batch(2, user=user)
+    DeliveryLogFactory()
+    expected = sorted(logs, key=lambda log: (log.created_at, log.id), reverse=True)
+
+    pages = [_list_delivery_logs(user_api_client, page_size=2)]
+    while pages[-1]["next"]:
+        pages.append(user_api_client.get(pages[-1]["next"]).data)
+
+    assert [len(page["results"]) for page in pages] == [2, 2, 1]
+    assert [result["id"] for page in pages for result in page["results"]] == _ids(
+        expected
+    )
+    assert (
+        ResilientLogEntry.objects.filter(
+            context__target__path=reverse("list_messages")
+        ).count()
+        == 3
+    )
+
+
+def test_list_delivery_logs_filters(user_api_client, user):
+    DeliveryLogFactory(user=user)
+    with freeze_time("2020-01-05"):
+        sent = DeliveryLogFactory(user=user)
+        DeliveryLogFactory(user=user, status=DeliveryStatus.QUEUED)
+    with freeze_time("2020-01-06"):
+        DeliveryLogFactory(user=user)
+
+    data = _list_delivery_logs(
+        user_api_client,
+        status="SENT",
+        created_after="2020-01-05T00:00:00+00:00",
+        created_before="2020-01-06T00:00:00+00:00",
+    )
+
+    assert [result["id"] for result in data["results"]] == _ids([sent])
+    assert data["results"][0]["status"] == "SENT"
+    assert data["next"] is None
+
+
+@pytest.mark.parametrize(
+    "delivery_status,expected",
+    [("DELIVERED", ["delivered"]), ("FAILED", ["failed"]), ("PENDING", ["pending"])],
+)
+def test_list_delivery_logs_delivery_status(
+    user_api_client, user, delivery_status, expected
+):
+    statuses = {
+        "delivered": ["DELIVERED", "DELIVERED"],
+        "failed": ["DELIVERED", "FAILED"],
+        "pending": ["DELIVERED", "CREATED"],
+    }
+    logs = {}
+    for name, message_statuses in statuses.items():
+        logs[name] = DeliveryLogFactory(user=user)
+        logs[name].save_report(
+            create_report(["+358461231231", "+358461231232"], "CREATED")
+        )
+        logs[name].update_reports(
+            [
+                {"destination": destination, "status": status}
+                for destination, status in zip(
+                    ["+358461231231", "+358461231232"], message_statuses
+                )
+            ]
+        )
+    # A log without messages has no delivery status
+    DeliveryLogFactory(user=user)
+
+    data = _list_delivery_logs(user_api_client, delivery_status=delivery_status)
+
+    assert [result["id"] for result in data["results"]] == _ids(
+        [logs[name] for name in expected]
+    )
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"status": "UNKNOWN"},
+        {"delivery_status": "SENT"},
+        {"created_after": "yesterday"},
+        {"cursor": "invalid"},
+        {"page_size": "0"},
+        {"page_size": "many"},
+    ],
+)
+def test_list_delivery_logs_bad_request(user_api_client, params):
+    response = user_api_client.get(reverse("list_messages"), params)
+    assert response.status_code == 400
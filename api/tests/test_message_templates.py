@@ -0,0 +1,270 @@
+import pytest
+from django.urls import reverse
+
+import quriiri.send
+from api.enums import DeliveryStatus
+from api.exceptions import RateLimitExceededError
+from api.factories import MessageTemplateFactory
+from api.models import DeliveryLog, MessageTemplate
+from api.services import send_queued_delivery_logs
+from api.utils import create_report
+from quriiri.send import Sender
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    """Rename the db fixture"""
+
+
+@pytest.fixture
+def template(user):
+    return MessageTemplateFactory(user=user, text="Hi $name, see you at ${time}.")
+
+
+@pytest.fixture
+def send_calls(monkeypatch):
+    calls = []
+
+    def send_sms(self, sender, destinations, text, **optional):
+        calls.append((list(destinations), text))
+        return create_report(destinations, "CREATED")
+
+    monkeypatch.setattr(quriiri.send.Sender, "send_sms", send_sms)
+    return calls
+
+
+def _template_payload(template, recipients, **kwargs):
+    return {
+        "sender": "Hel.fi",
+        "template": str(template.id),
+        "to": [
+            {"destination": destination, "variables": variables}
+            for destination, variables in recipients
+        ],
+        **kwargs,
+    }
+
+
+def test_render_messages(template):
+    messages, rejected = template.render_messages(
+        [
+            {"destination": "+358461231231", "variables": {"name": "Matti"}},
+            {"destination": "+358461231232", "variables": {"name": "Maija"}},
+            {"destination": "+358461231233", "variables": {"name": "Matti"}},
+            {"destination": "+358461231231", "variables": {"name": "Again"}},
+            {"destination": "invalid", "variables": {"name": "Nobody"}},
+            {
+                "destination": "+358461231234",
+                "variables": {"name": "Liisa", "time": "11"},
+            },
+        ],
+        {"time": "10"},
+    )
+
+    assert messages == {
+        "Hi Matti, see you at 10.": ["+358 46 1231231", "+358 46 1231233"],
+        "Hi Maija, see you at 10.": ["+358 46 1231232"],
+        "Hi Liisa, see you at 11.": ["+358 46 1231234"],
+    }
+    assert rejected == {"contains letters": [4]}
+
+
+def test_render_messages_missing_variable(template):
+    with pytest.raises(ValueError, match="Missing variable 'time' for"):
+        template.render_messages(
+            [{"destination": "+358461231231", "variables": {"name": "Matti"}}]
+        )
+
+
+def test_send_template_message(user_api_client, template, send_calls):
+    response = user_api_client.post(
+        reverse("send_message"),
+        _template_payload(
+            template,
+            [
+                ("+358461231231", {"name": "Matti"}),
+                ("+358461231232", {"name": "Maija"}),
+                ("+358461231233", {"name": "Matti"}),
+            ],
+            variables={"time": "10"},
+        ),
+        format="json",
+    )
+
+    assert response.status_code == 200
+    # One provider request per distinct text
+    assert sorted(send_calls) == [
+        (["+358 46 1231231", "+358 46 1231233"], "Hi Matti, see you at 10."),
+        (["+358 46 1231232"], "Hi Maija, see you at 10."),
+    ]
+    # All the recipients under one delivery log
+    log = DeliveryLog.objects.get()
+    assert log.template == template
+    assert sorted(log.get_report()["messages"]) == [
+        "+358 46 1231231",
+        "+358 46 1231232",
+        "+358 46 1231233",
+    ]
+    assert sorted(response.data["report"]["messages"]) == sorted(
+        log.get_report()["messages"]
+    )
+
+
+@pytest.mark.parametrize(
+    "payload_kwargs,error",
+    [
+        ({"template": "not-a-uuid"}, "does not exist"),
+        ({"to": [{"destination": "+358461231231"}]}, "Missing variable"),
+        ({"to": [{"destination": "+358461231231", "variables": []}]}, "'To' must"),
+        ({"variables": "x"}, "'Variables' must"),
+    ],
+)
+def test_send_template_message_invalid(
+    user_api_client, template, send_calls, payload_kwargs, error
+):
+    payload = _template_payload(
+        template, [("+358461231231", {"name": "Matti", "time": "10"})]
+    )
+    response = user_api_client.post(
+        reverse("send_message"), {**payload, **payload_kwargs}, format="json"
+    )
+
+    assert response.status_code == 400
+    assert error in response.content.decode()
+    assert send_calls == []
+
+
+def test_send_template_of_another_user(user_api_client, send_calls):
+    template = MessageTemplateFactory(text="Hi")
+
+    response = user_api_client.post(
+        reverse("send_message"),
+        _template_payload(template, [("+358461231231", {})]),
+        format="json",
+    )
+
+    assert response.status_code == 400
+    assert send_calls == []
+
+
+def test_send_template_message_rate_limited_halfway(
+    user_api_client, template, monkeypatch
+):
+    calls = []
+
+    def send_sms(self, sender, destinations, text, **optional):
+        calls.append(text)
+        if len(calls) > 1:
+            raise RateLimitExceededError(retry_after=1)
+        return create_report(destinations, "CREATED")
+
+    monkeypatch.setattr(quriiri.send.Sender, "send_sms", send_sms)
+    response = user_api_client.post(
+        reverse("send_message"),
+        _template_payload(
+            template,
+            [
+                ("+358461231231", {"name": "Matti"}),
+                ("+358461231232", {"name": "Maija"}),
+            ],
+            variables={"time": "10"},
+        ),
+        format="json",
+    )
+
+    # The first text was sent, so the rest is failed instead of retried
+    assert response.status_code == 200
+    statuses = {
+        destination: message["status"]
+        for destination, message in response.data["report"]["messages"].items()
+    }
+    assert sorted(statuses.values()) == ["CREATED", "FAILED"]
+
+
+def test_send_template_message_async(user_api_client, template, send_calls, settings):
+    settings.SMS_SEND_ASYNC = True
+
+    response = user_api_client.post(
+        reverse("send_message"),
+        _template_payload(
+            template,
+            [
+                ("+358461231231", {"name": "Matti"}),
+                ("+358461231232", {"name": "Maija"}),
+            ],
+            variables={"time": "10"},
+        ),
+        format="json",
+    )
+
+    assert response.status_code == 202
+    assert send_calls == []
+    log = DeliveryLog.objects.get()
+    assert log.pending_message["messages"] == {
+        "Hi Matti, see you at 10.": ["+358 46 1231231"],
+        "Hi Maija, see you at 10.": ["+358 46 1231232"],
+    }
+
+    assert send_queued_delivery_logs(Sender("apikey", "http://localhost/")) == 1
+
+    assert len(send_calls) == 2
+    log.refresh_from_db()
+    assert log.status == DeliveryStatus.SENT
+    assert {m["status"] for m in log.get_report()["messages"].values()} == {"CREATED"}
+
+
+def test_create_message_template(user_api_client, user):
+    response = user_api_client.post(
+        reverse("message_templates"),
+        {"name": "Reminder", "text": "Hi $name"},
+        format="json",
+    )
+
+    assert response.status_code == 201
+    template = MessageTemplate.objects.get()
+    assert template.user == user
+    assert response.data["id"] == str(template.id)
+
+
+def test_create_message_template_invalid_placeholder(user_api_client):
+    response = user_api_client.post(
+        reverse("message_templates"),
+        {"name": "Reminder", "text": "Costs 5 $"},
+        format="json",
+    )
+
+    assert response.status_code == 400
+    assert "text" in response.data
+
+
+def test_list_message_templates(user_api_client, template):
+    MessageTemplateFactory()
+
+    response = user_api_client.get(reverse("message_templates"))
+
+    assert response.status_code == 200
+    assert [t["id"] for t in response.data] == [str(template.id)]
+
+
+def test_update_and_delete_message_template(user_api_client, template):
+    url = reverse("message_template", kwargs={"id": template.id})
+
+    response = user_api_client.put(
+        url, {"name": "Renamed", "text": "Bye $name"}, format="json"
+    )
+    assert response.status_code == 200
+    template.refresh_from_db()
+    assert template.text == "Bye $name"
+
+    assert user_api_client.delete(url).status_code == 204
+    assert not MessageTemplate.objects.exists()
+
+
+def test_get_message_template_of_another_user(user_api_client):
+    template = MessageTemplateFactory()
+
+    response = user_api_client.get(
+        reverse("message_template", kwargs={"id": template.id})
+    )
+
+    assert response.status_code == 404
@@ -1,9 +1,14 @@
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
 import pytest
+from freezegun import freeze_time
 from resilient_logger.models import ResilientLogEntry
 from resilient_logger.sources.resilient_log_source_entry import ResilientLogSourceEntry
 
 from api.factories import DeliveryLogFactory
 from api.models import DeliveryLog
+from api.utils import create_report
 from audit_log.enums import Operation, Status
 
 
@@ -38,3 +43,18 @@ def test_delivery_log_manager_with_audit_log():
     assert document["audit_event"]["target"]["path"] == ""
     assert document["audit_event"]["target"]["type"] == DeliveryLog._meta.model_name
     assert document["audit_event"]["target"]["object_ids"] == [str(delivery_log.pk)]
+
+
+def test_delivery_log_update_reports_touches_log():
+    delivery_log = DeliveryLogFactory()
+    delivery_log.save_report(create_report(["+358461231231"], "CREATED"))
+
+    with freeze_time("2020-01-04 00:00:01"):
+        delivery_log.update_reports(
+            [{"destination": "+358461231231", "status": "DELIVERED"}]
+        )
+
+    delivery_log.refresh_from_db()
+    assert delivery_log.updated_at == datetime(
+        2020, 1, 4, 0, 0, 1, tzinfo=dt_timezone.utc
+    )
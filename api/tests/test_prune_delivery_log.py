@@ -7,6 +7,7 @@ from django.core.management import call_command
 from django.db import IntegrityError
 from freezegun import freeze_time
 
+from api.enums import DeliveryStatus
 from api.factories import DeliveryLogFactory
 from api.models import DeliveryLog
 from common.utils import utc_datetime
@@ -117,3 +118,19 @@ def test_unexpected_data_deletion_leads_to_transaction_rollback(capsys):
     captured = capsys.readouterr()
     assert captured.out == captured.err == ""
     assert DeliveryLog.objects.count() == orig_delivery_log_count
+
+
+@pytest.mark.django_db
+def test_scheduled_delivery_logs_are_not_deleted():
+    """
+    Test that the prune_delivery_log command keeps the scheduled messages
+    which have not been sent yet, however old they are.
+    """
+    with freeze_time(_TEST_TIME - relativedelta(years=1)):
+        scheduled_log = DeliveryLogFactory(
+            status=DeliveryStatus.SCHEDULED,
+            send_at=_TEST_TIME + relativedelta(days=1),
+        )
+    with freeze_time(_TEST_TIME):
+        call_command("prune_delivery_log", months=0)
+    assert list(DeliveryLog.objects.all()) == [scheduled_log]
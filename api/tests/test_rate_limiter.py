@@ -0,0 +1,165 @@
+import asyncio
+import threading
+from unittest import mock
+
+import httpx
+import pytest
+from django.core.cache import caches
+
+import quriiri.send
+from api.exceptions import RateLimitExceededError
+from api.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self, now=1000.25):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    caches["default"].clear()
+    yield
+    caches["default"].clear()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_rate_limiter_reserves_current_second(clock):
+    limiter = RateLimiter({"messages": 10, "requests": 2}, clock=clock)
+    reservation = limiter.reserve(messages=5, requests=1)
+    assert reservation.ready_at == clock.now
+    reservation = limiter.reserve(messages=5, requests=1)
+    assert reservation.ready_at == clock.now
+
+
+def test_rate_limiter_fails_immediately_without_wait(clock):
+    limiter = RateLimiter({"messages": 10}, clock=clock)
+    limiter.reserve(messages=8)
+    with pytest.raises(RateLimitExceededError) as excinfo:
+        limiter.reserve(messages=3)
+    assert excinfo.value.retry_after == pytest.approx(0.75)
+    # The failed reservation gave its tokens back
+    limiter.reserve(messages=2)
+
+
+def test_rate_limiter_waits_for_next_second(clock):
+    limiter = RateLimiter({"requests": 2}, max_wait=5, clock=clock)
+    assert limiter.reserve(requests=2).ready_at == clock.now
+    assert limiter.reserve(requests=1).ready_at == 1001
+    assert limiter.reserve(requests=2).ready_at == 1002
+
+
+def test_rate_limiter_spreads_large_cost_over_seconds(clock):
+    limiter = RateLimiter({"messages": 10}, max_wait=5, clock=clock)
+    reservation = limiter.reserve(messages=25)
+    assert reservation.ready_at == 1002
+    assert [amount for _, amount in reservation.allocations] == [10, 10, 5]
+    # The next caller queues behind the reserved tokens
+    assert limiter.reserve(messages=5).ready_at == 1002
+    assert limiter.reserve(messages=1).ready_at == 1003
+
+
+def test_rate_limiter_cancel(clock):
+    limiter = RateLimiter({"messages": 10}, clock=clock)
+    reservation = limiter.reserve(messages=10)
+    limiter.cancel(reservation)
+    assert limiter.reserve(messages=10).ready_at == clock.now
+
+
+def test_rate_limiter_shared_by_instances(clock):
+    """Instances in different processes share the limits through the cache"""
+    RateLimiter({"messages": 10}, clock=clock).reserve(messages=10)
+    with pytest.raises(RateLimitExceededError):
+        RateLimiter({"messages": 10}, clock=clock).reserve(messages=1)
+
+
+def test_rate_limiter_unlimited(clock):
+    limiter = RateLimiter({"messages": 0, "requests": 1}, clock=clock)
+    limiter.reserve(messages=1000, requests=1)
+    with pytest.raises(RateLimitExceededError):
+        limiter.reserve(messages=1, requests=1)
+
+
+def test_rate_limiter_falls_back_to_local_cache(clock):
+    limiter = RateLimiter({"messages": 10}, clock=clock)
+    with mock.patch.object(
+        caches["default"], "incr", side_effect=ConnectionError("Cache is down")
+    ):
+        limiter.reserve(messages=10)
+        with pytest.raises(RateLimitExceededError):
+            limiter.reserve(messages=1)
+
+
+def test_sender_reserves_every_chunk_before_sending(clock):
+    limiter = RateLimiter({"messages": 10}, clock=clock)
+    sender = quriiri.send.Sender(
+        "apikey", "https://api.example.com/v1/", chunk_size=6, rate_limiter=limiter
+    )
+    with mock.patch.object(sender.session, "send") as send:
+        with pytest.raises(RateLimitExceededError):
+            sender.send_sms("Hel.fi", [f"+35840123456{i}" for i in range(12)], "SMS")
+    send.assert_not_called()
+    # The reservation of the first chunk was cancelled
+    limiter.reserve(messages=10)
+
+
+def test_rate_limiter_max_wait_of_call(clock):
+    limiter = RateLimiter({"messages": 10}, clock=clock, max_wait=5)
+    limiter.reserve(messages=10)
+    with pytest.raises(RateLimitExceededError):
+        limiter.reserve(max_wait=0, messages=1)
+    # The call can not wait longer than the limiter allows
+    with pytest.raises(RateLimitExceededError):
+        limiter.reserve(max_wait=60, messages=100)
+    assert limiter.reserve(messages=1).ready_at == 1001
+
+
+def test_sender_rate_limit_wait_counts_against_deadline(clock):
+    limiter = RateLimiter({"messages": 10}, clock=clock, max_wait=5)
+    sender = quriiri.send.Sender(
+        "apikey",
+        "https://api.example.com/v1/",
+        connect_timeout=3,
+        read_timeout=10,
+        deadline=15,
+        rate_limiter=limiter,
+    )
+    with mock.patch.object(limiter, "reserve", wraps=limiter.reserve) as reserve:
+        with mock.patch.object(sender.session, "send"):
+            sender.send_sms("Hel.fi", "+358401234567", "SMS")
+    # The wait leaves the time of one attempt before the deadline
+    assert reserve.call_args.kwargs["max_wait"] == 2
+
+
+def test_async_sender_reserves_outside_event_loop(clock):
+    limiter = RateLimiter({"messages": 10}, clock=clock)
+    threads = []
+
+    def reserve(**kwargs):
+        threads.append(threading.get_ident())
+        return RateLimiter.reserve(limiter, **kwargs)
+
+    def handler(request):
+        return httpx.Response(200, json={"errors": [], "warnings": [], "messages": {}})
+
+    async def send():
+        async with quriiri.send.AsyncSender(
+            "apikey",
+            "https://api.example.com/v1/",
+            transport=httpx.MockTransport(handler),
+            rate_limiter=limiter,
+        ) as sender:
+            await sender.send_sms("Hel.fi", "+358401234567", "SMS")
+        return threading.get_ident()
+
+    with mock.patch.object(limiter, "reserve", side_effect=reserve):
+        loop_thread = asyncio.run(send())
+
+    assert threads and loop_thread not in threads
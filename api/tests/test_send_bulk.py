@@ -0,0 +1,279 @@
+import json
+
+import pytest
+from django.urls import reverse
+from resilient_logger.models import ResilientLogEntry
+
+import api.views
+import quriiri.send
+from api.enums import DeliveryStatus
+from api.models import DeliveryLog
+from api.services import send_grouped_messages
+from api.utils import create_report
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    """Rename the db fixture"""
+
+
+@pytest.fixture
+def send_calls(monkeypatch):
+    calls = []
+
+    def send_sms(self, sender, destinations, text, **optional):
+        calls.append((sender, list(destinations), text, optional))
+        return create_report(destinations, "CREATED")
+
+    monkeypatch.setattr(quriiri.send.Sender, "send_sms", send_sms)
+    return calls
+
+
+def _item(destination, text="SMS message", sender="Hel.fi"):
+    return {"sender": sender, "to": [{"destination": destination}], "text": text}
+
+
+def _send_bulk(client, lines):
+    response = client.post(
+        reverse("send_messages_bulk"),
+        "\n".join(
+            line if isinstance(line, str) else json.dumps(line) for line in lines
+        ),
+        content_type="application/x-ndjson",
+    )
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+    content = b"".join(response.streaming_content).decode()
+    return [json.loads(line) for line in content.splitlines()]
+
+
+def test_send_bulk_unauthenticated(anonymous_api_client):
+    response = anonymous_api_client.post(
+        reverse("send_messages_bulk"),
+        json.dumps(_item("+358461231231")),
+        content_type="application/x-ndjson",
+    )
+    assert response.status_code == 401
+
+
+def test_send_bulk(token_api_client, send_calls):
+    results = _send_bulk(
+        token_api_client,
+        [
+            _item("+358461231231", "Hello"),
+            _item("+358461231232", "Hello"),
+            _item("+358461231233", "Hi"),
+        ],
+    )
+
+    assert [result["status"] for result in results] == ["ok"] * 3
+    assert [result["index"] for result in results] == [0, 1, 2]
+    # The messages with the same text are sent with one request
+    assert sorted((text, destinations) for _, destinations, text, _ in send_calls) == [
+        ("Hello", ["+358 46 1231231", "+358 46 1231232"]),
+        ("Hi", ["+358 46 1231233"]),
+    ]
+    logs = [DeliveryLog.objects.get(id=result["id"]) for result in results]
+    assert [list(log.get_report()["messages"]) for log in logs] == [
+        ["+358 46 1231231"],
+        ["+358 46 1231232"],
+        ["+358 46 1231233"],
+    ]
+    assert logs[0].batch_id == logs[1].batch_id == logs[0].id
+    assert logs[2].batch_id is None
+    # The delivery reports of the merged request go to the first delivery log
+    hello_options = next(o for _, _, text, o in send_calls if text == "Hello")
+    assert hello_options["drurl"].endswith(
+        reverse("delivery_log_webhook", kwargs={"id": logs[0].id})
+    )
+
+
+def test_send_bulk_delivery_report_of_merged_message(token_api_client, send_calls):
+    results = _send_bulk(
+        token_api_client, [_item("+358461231231"), _item("+358461231232")]
+    )
+
+    response = token_api_client.post(
+        reverse("delivery_log_webhook", kwargs={"id": results[0]["id"]}),
+        {"destination": "+358461231232", "status": "DELIVERED"},
+        format="json",
+    )
+
+    assert response.status_code == 200
+    log = DeliveryLog.objects.get(id=results[1]["id"])
+    assert log.get_report()["messages"]["+358 46 1231232"]["status"] == "DELIVERED"
+
+
+def test_send_bulk_errors(token_api_client, send_calls):
+    results = _send_bulk(
+        token_api_client,
+        [
+            _item("+358461231231"),
+            "{not json",
+            {"sender": "Hel.fi"},
+            _item("not a number"),
+            "",
+            _item("+358461231232"),
+        ],
+    )
+
+    assert [(result["index"], result["status"]) for result in results] == [
+        (0, "ok"),
+        (1, "error"),
+        (2, "error"),
+        (3, "error"),
+        # The blank line is counted
+        (5, "ok"),
+    ]
+    assert results[1]["error"].startswith("Invalid JSON")
+    assert results[3]["error"] == "No valid destinations for SMS sender."
+    assert results[3]["rejected"] == {"contains letters": [0]}
+    assert DeliveryLog.objects.count() == 2
+
+
+def test_send_bulk_rejected_destinations(token_api_client, send_calls, caplog):
+    item = _item("+358461231231")
+    item["to"] += [{"destination": "123"}, {"destination": ""}]
+
+    results = _send_bulk(token_api_client, [item, _item("+358461231232")])
+
+    assert results[0]["rejected"] == {"invalid number": [1], "empty": [2]}
+    assert "rejected" not in results[1]
+    assert [record.message for record in caplog.records] == [
+        "Rejected 2 of 4 phone numbers (empty: 1, invalid number: 1)."
+    ]
+
+
+def test_send_bulk_too_long_line(token_api_client, send_calls, settings):
+    settings.BULK_SEND_MAX_ITEM_SIZE = 100
+
+    results = _send_bulk(
+        token_api_client,
+        [_item("+358461231231", "x" * 200), _item("+358461231232")],
+    )
+
+    assert [result["status"] for result in results] == ["error", "ok"]
+    assert results[0]["error"] == "Line is longer than 100 bytes"
+
+
+def test_send_bulk_in_chunks(token_api_client, send_calls, settings):
+    settings.BULK_SEND_CHUNK_SIZE = 2
+
+    results = _send_bulk(
+        token_api_client, [_item(f"+35846123123{i}") for i in range(5)]
+    )
+
+    assert [result["status"] for result in results] == ["ok"] * 5
+    assert [len(destinations) for _, destinations, _, _ in send_calls] == [2, 2, 1]
+    assert (
+        ResilientLogEntry.objects.filter(
+            context__target__path=reverse("send_messages_bulk")
+        ).count()
+        == 3
+    )
+
+
+def test_send_bulk_same_destination_is_not_merged(token_api_client, send_calls):
+    results = _send_bulk(
+        token_api_client, [_item("+358461231231"), _item("+358461231231")]
+    )
+
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    assert len(send_calls) == 2
+
+
+def test_send_bulk_async(token_api_client, send_calls, settings):
+    settings.SMS_SEND_ASYNC = True
+
+    results = _send_bulk(
+        token_api_client, [_item("+358461231231"), _item("+358461231232")]
+    )
+
+    assert send_calls == []
+    logs = [DeliveryLog.objects.get(id=result["id"]) for result in results]
+    assert {log.status for log in logs} == {DeliveryStatus.QUEUED}
+    assert logs[1].pending_message["destinations"] == ["+358 46 1231232"]
+    assert logs[1].get_report()["messages"] == {
+        "+358 46 1231232": {"converted": "+358 46 1231232", "status": "QUEUED"}
+    }
+
+
+def test_send_bulk_rate_limited(token_api_client, monkeypatch):
+    monkeypatch.setattr(
+        "api.services.send_pending_message", lambda sms_sender, message: None
+    )
+
+    results = _send_bulk(token_api_client, [_item("+358461231231")])
+
+    assert results[0]["status"] == "error"
+    assert DeliveryLog.objects.count() == 0
+
+
+def test_send_grouped_messages_failure(monkeypatch):
+    def send_sms(self, sender, destinations, text, **optional):
+        raise RuntimeError("Boom")
+
+    monkeypatch.setattr(quriiri.send.Sender, "send_sms", send_sms)
+    message = {"sender": "Hel.fi", "text": "Hi", "options": {}}
+
+    reports = send_grouped_messages(
+        quriiri.send.Sender("user", "pass"),
+        [
+            ("a", {**message, "destinations": ["+358461231231"]}),
+            ("b", {**message, "destinations": ["+358461231232"]}),
+        ],
+    )
+
+    assert reports[0]["messages"]["+358461231231"]["status"] == "FAILED"
+    assert reports[1]["messages"]["+358461231232"]["status"] == "FAILED"
+    assert reports[0]["batchid"] == "a"
+
+
+def test_send_bulk_without_content_length(token_api_client, send_calls):
+    response = token_api_client.post(
+        reverse("send_messages_bulk"),
+        json.dumps(_item("+358461231231")),
+        content_type="application/x-ndjson",
+        CONTENT_LENGTH="",
+    )
+
+    assert response.status_code == 411
+    assert send_calls == []
+
+
+def test_send_bulk_too_long_body(token_api_client, send_calls, settings):
+    settings.BULK_SEND_MAX_SIZE = 100
+
+    response = token_api_client.post(
+        reverse("send_messages_bulk"),
+        "\n".join(json.dumps(_item(f"+35846123123{i}")) for i in range(3)),
+        content_type="application/x-ndjson",
+    )
+
+    assert response.status_code == 413
+    assert send_calls == []
+
+
+def test_send_bulk_chunk_failure(token_api_client, send_calls, settings, monkeypatch):
+    settings.BULK_SEND_CHUNK_SIZE = 1
+    send_grouped_messages = api.views.send_grouped_messages
+    calls = []
+
+    def fail_first_chunk(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("Boom")
+        return send_grouped_messages(*args, **kwargs)
+
+    monkeypatch.setattr("api.views.send_grouped_messages", fail_first_chunk)
+
+    results = _send_bulk(
+        token_api_client, [_item("+358461231231"), _item("+358461231232")]
+    )
+
+    assert results[0] == {
+        "index": 0,
+        "status": "error",
+        "error": "Internal error, the message may have been sent",
+    }
+    assert results[1]["status"] == "ok"
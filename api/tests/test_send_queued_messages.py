@@ -0,0 +1,118 @@
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+
+import quriiri
+from api import services
+from api.enums import DeliveryStatus
+from api.exceptions import RateLimitExceededError
+from api.factories import DeliveryLogFactory
+from api.models import DeliveryLog
+from api.utils import create_report
+
+DESTINATIONS = ["+358 46 1231231", "+358 40 1234567"]
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    pass
+
+
+def _create_queued_delivery_log(**kwargs):
+    return DeliveryLogFactory(
+        status=DeliveryStatus.QUEUED,
+        report=create_report(DESTINATIONS, DeliveryStatus.QUEUED.value),
+        pending_message={
+            "sender": "Hel.fi",
+            "destinations": DESTINATIONS,
+            "text": "SMS message",
+            "options": {"drurl": "https://example.com/v1/message/webhook/1"},
+        },
+        **kwargs,
+    )
+
+
+def test_send_queued_messages():
+    queued_logs = [_create_queued_delivery_log() for _ in range(3)]
+    sent_log = DeliveryLogFactory()
+    report = create_report(DESTINATIONS, "CREATED")
+
+    with mock.patch.object(
+        quriiri.send.Sender, "send_sms", return_value=report
+    ) as send_sms:
+        call_command("send_queued_messages", "--once", "--batch-size=2")
+
+    assert send_sms.call_count == len(queued_logs)
+    send_sms.assert_called_with(
+        "Hel.fi",
+        DESTINATIONS,
+        "SMS message",
+        drurl="https://example.com/v1/message/webhook/1",
+    )
+    for log in queued_logs:
+        log.refresh_from_db()
+        assert log.status == DeliveryStatus.SENT
+        assert log.get_report() == report
+        assert log.pending_message is None
+
+    old_report = sent_log.report
+    sent_log.refresh_from_db()
+    assert sent_log.report == old_report
+
+
+def test_send_queued_messages_provider_exception():
+    log = _create_queued_delivery_log()
+
+    with mock.patch.object(
+        quriiri.send.Sender, "send_sms", side_effect=ConnectionError("Boom")
+    ):
+        call_command("send_queued_messages", "--once")
+
+    log.refresh_from_db()
+    assert log.status == DeliveryStatus.SENT
+    assert log.report["errors"] == [{"message": "ConnectionError('Boom')"}]
+    assert {m["status"] for m in log.get_report()["messages"].values()} == {"FAILED"}
+
+
+def test_send_queued_messages_claims_the_logs():
+    log = _create_queued_delivery_log()
+    send_claimed_delivery_logs = services._send_claimed_delivery_logs
+    statuses = []
+
+    def send(sms_sender, logs, *args, **kwargs):
+        statuses.extend(DeliveryLog.objects.get(id=log.id).status for log in logs)
+        return send_claimed_delivery_logs(sms_sender, logs, *args, **kwargs)
+
+    report = create_report(DESTINATIONS, "CREATED")
+    with (
+        mock.patch.object(quriiri.send.Sender, "send_sms", return_value=report),
+        mock.patch("api.services._send_claimed_delivery_logs", side_effect=send),
+    ):
+        call_command("send_queued_messages", "--once")
+
+    # The log was claimed before it was sent
+    assert statuses == [DeliveryStatus.SENDING]
+    log.refresh_from_db()
+    assert log.status == DeliveryStatus.SENT
+
+
+def test_send_queued_messages_rate_limit_exceeded():
+    log = _create_queued_delivery_log()
+
+    with mock.patch.object(
+        quriiri.send.Sender,
+        "send_sms",
+        side_effect=RateLimitExceededError(retry_after=1),
+    ):
+        call_command("send_queued_messages", "--once")
+
+    log.refresh_from_db()
+    assert log.status == DeliveryStatus.QUEUED
+    assert log.pending_message is not None
+
+
+@pytest.mark.parametrize("option", ["--batch-size=0", "--concurrency=0"])
+def test_send_queued_messages_invalid_arguments(option):
+    with pytest.raises(ValueError):
+        call_command("send_queued_messages", "--once", option)
@@ -0,0 +1,210 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+import quriiri.send
+from api import services
+from api.enums import DeliveryStatus
+from api.exceptions import RateLimitExceededError
+from api.factories import DeliveryLogFactory
+from api.models import DeliveryLog
+from api.services import send_scheduled_delivery_logs
+from api.utils import create_report, parse_send_at
+from quriiri.send import Sender
+
+DESTINATIONS = ["+358 46 1231231", "+358 40 1234567"]
+
+SMS_PAYLOAD = {
+    "sender": "Hel.fi",
+    "to": [{"destination": "+358461231231", "format": "MOBILE"}],
+    "text": "SMS message",
+}
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    pass
+
+
+def _create_scheduled_delivery_log(send_at, **kwargs):
+    return DeliveryLogFactory(
+        status=DeliveryStatus.SCHEDULED,
+        send_at=send_at,
+        report=create_report(DESTINATIONS, DeliveryStatus.SCHEDULED.value),
+        pending_message={
+            "sender": "Hel.fi",
+            "destinations": DESTINATIONS,
+            "text": "SMS message",
+            "options": {"drurl": "https://example.com/v1/message/webhook/1"},
+        },
+        **kwargs,
+    )
+
+
+def test_parse_send_at():
+    assert parse_send_at(None) is None
+    # The past send times are sent right away
+    assert parse_send_at("2020-01-03T12:00:00+00:00") is None
+    assert parse_send_at("2020-01-05T07:30:00+02:00") == datetime(
+        2020, 1, 5, 5, 30, tzinfo=dt_timezone.utc
+    )
+    assert timezone.is_aware(parse_send_at("2020-01-05T07:30:00"))
+    for value in ("tomorrow", 1578000000):
+        with pytest.raises(ValueError):
+            parse_send_at(value)
+
+
+def test_send_scheduled_message(token_api_client, monkeypatch):
+    monkeypatch.setattr(
+        quriiri.send.Sender,
+        "send_sms",
+        lambda *args, **kwargs: pytest.fail("The message should only be scheduled"),
+    )
+
+    response = token_api_client.post(
+        reverse("send_message"),
+        {**SMS_PAYLOAD, "send_at": "2020-01-05T07:30:00+02:00"},
+        format="json",
+    )
+
+    assert response.status_code == 202
+    log = DeliveryLog.objects.get()
+    assert log.status == DeliveryStatus.SCHEDULED
+    assert log.send_at == datetime(2020, 1, 5, 5, 30, tzinfo=dt_timezone.utc)
+    assert log.pending_message["destinations"] == ["+358 46 1231231"]
+    assert log.get_report()["messages"]["+358 46 1231231"]["status"] == "SCHEDULED"
+
+
+def test_send_message_with_past_send_at_is_sent(token_api_client, mock_send_sms):
+    response = token_api_client.post(
+        reverse("send_message"),
+        {**SMS_PAYLOAD, "send_at": "2020-01-01T07:30:00+02:00"},
+        format="json",
+    )
+
+    assert response.status_code == 200
+    assert DeliveryLog.objects.get().status == DeliveryStatus.SENT
+
+
+def test_send_message_with_invalid_send_at(token_api_client):
+    response = token_api_client.post(
+        reverse("send_message"),
+        {**SMS_PAYLOAD, "send_at": "at 7:30"},
+        format="json",
+    )
+
+    assert response.status_code == 400
+    assert not DeliveryLog.objects.exists()
+
+
+def test_send_scheduled_messages():
+    now = timezone.now()
+    due_logs = [
+        _create_scheduled_delivery_log(now - timedelta(minutes=1)),
+        _create_scheduled_delivery_log(now),
+    ]
+    future_log = _create_scheduled_delivery_log(now + timedelta(minutes=1))
+    report = create_report(DESTINATIONS, "CREATED")
+
+    with mock.patch.object(
+        quriiri.send.Sender, "send_sms", return_value=report
+    ) as send_sms:
+        call_command("send_scheduled_messages", once=True)
+
+    assert send_sms.call_count == 2
+    for log in due_logs:
+        log.refresh_from_db()
+        assert log.status == DeliveryStatus.SENT
+        assert log.pending_message is None
+        assert log.get_report() == report
+    future_log.refresh_from_db()
+    assert future_log.status == DeliveryStatus.SCHEDULED
+
+
+def test_send_scheduled_messages_in_send_time_order():
+    now = timezone.now()
+    later_log = _create_scheduled_delivery_log(now - timedelta(minutes=1))
+    earlier_log = _create_scheduled_delivery_log(now - timedelta(minutes=2))
+    queued_log = DeliveryLogFactory(status=DeliveryStatus.QUEUED)
+
+    with mock.patch.object(
+        quriiri.send.Sender,
+        "send_sms",
+        return_value=create_report(DESTINATIONS, "CREATED"),
+    ):
+        sent_count = send_scheduled_delivery_logs(
+            Sender("apikey", "http://localhost/"), batch_size=1
+        )
+
+    assert sent_count == 1
+    earlier_log.refresh_from_db()
+    later_log.refresh_from_db()
+    queued_log.refresh_from_db()
+    assert earlier_log.status == DeliveryStatus.SENT
+    assert later_log.status == DeliveryStatus.SCHEDULED
+    assert queued_log.status == DeliveryStatus.QUEUED
+
+
+def test_send_scheduled_messages_spread():
+    now = timezone.now()
+    for _ in range(4):
+        _create_scheduled_delivery_log(now)
+    send_claimed_delivery_logs = services._send_claimed_delivery_logs
+    statuses = []
+
+    def send(sms_sender, logs, *args, **kwargs):
+        statuses.extend(
+            DeliveryLog.objects.filter(id__in=[log.id for log in logs]).values_list(
+                "status", flat=True
+            )
+        )
+        return send_claimed_delivery_logs(sms_sender, logs, *args, **kwargs)
+
+    with (
+        mock.patch("api.services._send_claimed_delivery_logs", side_effect=send),
+        mock.patch.object(
+            quriiri.send.Sender,
+            "send_sms",
+            return_value=create_report(DESTINATIONS, "CREATED"),
+        ),
+        mock.patch("api.services.time.monotonic", return_value=0.0),
+        mock.patch("api.services.time.sleep") as sleep,
+    ):
+        sent_count = send_scheduled_delivery_logs(
+            Sender("apikey", "http://localhost/"), concurrency=4, spread=2.0
+        )
+
+    assert sent_count == 4
+    # The clock is stopped, so every send sleeps its whole offset
+    assert sorted(call.args[0] for call in sleep.call_args_list) == [0.5, 1.0, 1.5]
+    # The logs were claimed before the spread, instead of being kept locked
+    assert statuses == [DeliveryStatus.SENDING] * 4
+
+
+def test_send_scheduled_messages_rate_limited():
+    log = _create_scheduled_delivery_log(timezone.now())
+
+    with mock.patch.object(
+        quriiri.send.Sender,
+        "send_sms",
+        side_effect=RateLimitExceededError(retry_after=1),
+    ):
+        call_command("send_scheduled_messages", once=True)
+
+    log.refresh_from_db()
+    assert log.status == DeliveryStatus.SCHEDULED
+    assert log.pending_message is not None
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"batch_size": 0}, {"concurrency": 0}, {"spread": -1.0}],
+)
+def test_send_scheduled_messages_invalid_arguments(kwargs):
+    with pytest.raises(ValueError):
+        call_command("send_scheduled_messages", once=True, **kwargs)
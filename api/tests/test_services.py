@@ -0,0 +1,28 @@
+from api.services import create_sms_sender
+from quriiri.coalesce import CoalescingSender
+from quriiri.fake import FakeSender
+from quriiri.send import Sender
+
+
+def test_create_sms_sender_default_backend():
+    assert type(create_sms_sender()) is Sender
+
+
+def test_create_sms_sender_fake_backend(settings):
+    settings.SMS_SENDER_BACKEND = "api.services.create_fake_sender"
+    settings.FAKE_QURIIRI_FAILURE_RATE = 1.0
+
+    sms_sender = create_sms_sender()
+
+    assert isinstance(sms_sender, FakeSender)
+    resp = sms_sender.send_sms("Hel.fi", ["+358461231231"], "Hello")
+    assert resp["messages"]["+358461231231"]["status"] == "FAILED"
+
+
+def test_create_sms_sender_coalescing(settings):
+    settings.QURIIRI_COALESCE_WINDOW = 0.01
+
+    sms_sender = create_sms_sender()
+
+    assert isinstance(sms_sender, CoalescingSender)
+    assert type(sms_sender.sender) is Sender
@@ -1,6 +1,22 @@
+import random
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
 import pytest
+from django.core.cache import cache
 
-from api.utils import filter_valid_destinations, validate_send_message_payload
+from api.utils import (
+    _get_destination_parse_pool_workers,
+    _parse_destination,
+    _parse_destination_with_phonenumbers,
+    DeliveryLogCache,
+    DestinationCache,
+    filter_valid_destinations,
+    get_destination_parse_pool,
+    parse_destinations,
+    validate_destinations,
+    validate_send_message_payload,
+)
 
 REGION_FI_VALID_PHONE_NUMBERS = [
     "+358 40 123 4567",
@@ -166,6 +182,15 @@ def test_filter_valid_destinations_mixed_numbers():
     assert len(valid_numbers) == 2
 
 
+def test_validate_destinations():
+    destinations = ["040 123 4567", None, "abc", "040 123 4567", "123", ""]
+
+    assert validate_destinations(destinations, True) == (
+        ["+358 40 1234567", "+358 40 1234567"],
+        {"empty": [1, 5], "contains letters": [2], "invalid number": [4]},
+    )
+
+
 def test_filter_valid_destinations_international_format():
     """Test with convert_to_international_format=True."""
     destinations = ["0401234567"]
@@ -175,3 +200,239 @@ def test_filter_valid_destinations_international_format():
     assert len(valid_numbers) == 1
     assert isinstance(valid_numbers[0], str)
     assert valid_numbers[0].startswith("+")  # Check for international format
+
+
+def test_destination_cache():
+    destination_cache = DestinationCache(maxsize=2)
+
+    assert destination_cache.get("040 123 4567") == ("+358 40 1234567", "")
+    assert destination_cache.get("040 123 4567") == ("+358 40 1234567", "")
+    assert destination_cache.get("invalid") == (None, "contains letters")
+    assert destination_cache.get("12345") == (None, "invalid number")
+
+    assert destination_cache.stats() == {
+        "hits": 1,
+        "misses": 3,
+        "shared_hits": 0,
+        "hit_rate": 0.25,
+        "size": 2,
+        "maxsize": 2,
+    }
+    # The least recently used destination was evicted
+    destination_cache.get("040 123 4567")
+    assert destination_cache.stats()["misses"] == 4
+
+
+def test_destination_cache_get_many():
+    destination_cache = DestinationCache()
+    destinations = ["0401234567", "invalid", "0401234567", "", None]
+
+    results = destination_cache.get_many(destinations)
+
+    assert results == {
+        "0401234567": ("+358 40 1234567", ""),
+        "invalid": (None, "contains letters"),
+    }
+    assert destination_cache.stats()["misses"] == 2
+    destination_cache.get_many(destinations)
+    assert destination_cache.stats()["hits"] == 2
+
+
+def test_destination_cache_disabled():
+    destination_cache = DestinationCache(maxsize=0)
+
+    destination_cache.get("0401234567")
+    destination_cache.get("0401234567")
+
+    assert destination_cache.stats()["misses"] == 2
+    assert destination_cache.stats()["size"] == 0
+
+
+def test_destination_cache_shared():
+    cache.clear()
+    first = DestinationCache(cache_alias="default")
+    second = DestinationCache(cache_alias="default")
+
+    with mock.patch("api.utils._parse_destination", wraps=_parse_destination) as parse:
+        first.get("0401234567")
+        assert second.get("0401234567") == ("+358 40 1234567", "")
+
+    assert parse.call_count == 1
+    assert second.stats()["shared_hits"] == 1
+    assert second.stats()["misses"] == 0
+
+
+def test_delivery_log_cache():
+    delivery_log_cache = DeliveryLogCache(maxsize=2)
+
+    delivery_log_cache.set("first", "1", {"id": "first"})
+    delivery_log_cache.set("second", "1", {"id": "second"})
+    assert delivery_log_cache.get("first", "1") == {"id": "first"}
+    # The entry of another version is a miss
+    assert delivery_log_cache.get("first", "2") is None
+    delivery_log_cache.set("third", "1", {"id": "third"})
+
+    # The least recently used log was evicted
+    assert delivery_log_cache.get("second", "1") is None
+    assert delivery_log_cache.get("third", "1") == {"id": "third"}
+    assert delivery_log_cache.stats() == {
+        "hits": 2,
+        "misses": 2,
+        "shared_hits": 0,
+        "hit_rate": 0.5,
+        "size": 2,
+        "maxsize": 2,
+        "messages": 2,
+        "max_messages": 0,
+    }
+
+
+def _serialized_log(id, message_count):
+    messages = {f"+35846123{index:04}": {} for index in range(message_count)}
+    return {"id": id, "report": {"messages": messages}}
+
+
+def test_delivery_log_cache_max_messages():
+    delivery_log_cache = DeliveryLogCache(max_messages=5)
+
+    delivery_log_cache.set("first", "1", _serialized_log("first", 2))
+    delivery_log_cache.set("second", "1", _serialized_log("second", 2))
+    # A log larger than the whole LRU is not kept
+    delivery_log_cache.set("large", "1", _serialized_log("large", 6))
+    assert delivery_log_cache.get("large", "1") is None
+    assert delivery_log_cache.stats()["messages"] == 4
+
+    # The least recently used logs are evicted to fit the messages
+    delivery_log_cache.set("third", "1", _serialized_log("third", 3))
+    assert delivery_log_cache.get("first", "1") is None
+    assert delivery_log_cache.get("second", "1") is not None
+    assert delivery_log_cache.stats()["messages"] == 5
+
+    # A new version replaces the messages of the old one
+    delivery_log_cache.set("third", "2", _serialized_log("third", 1))
+    assert delivery_log_cache.stats()["messages"] == 3
+    assert delivery_log_cache.stats()["size"] == 2
+
+
+def test_delivery_log_cache_shared():
+    cache.clear()
+    first = DeliveryLogCache(cache_alias="default")
+    second = DeliveryLogCache(cache_alias="default")
+
+    first.set("log", "1", {"id": "log"})
+    assert second.get("log", "1") == {"id": "log"}
+    assert second.get("log", "1") == {"id": "log"}
+    assert second.stats()["shared_hits"] == 1
+    assert second.stats()["hits"] == 1
+
+    first.delete("log")
+    assert first.get("log", "1") is None
+    second.clear()
+    assert second.get("log", "1") is None
+
+
+@mock.patch("api.utils.get_destination_cache")
+def test_filter_valid_destinations_uses_destination_cache(get_destination_cache):
+    destination_cache = DestinationCache()
+    get_destination_cache.return_value = destination_cache
+
+    filter_valid_destinations(["0401234567", "0401234567", "invalid"])
+    filter_valid_destinations(["0401234567"], convert_to_international_format=True)
+
+    assert destination_cache.stats()["misses"] == 2
+    assert destination_cache.stats()["hits"] == 1
+
+
+def _create_destination_corpus(count, seed=0):
+    """
+    Create phone numbers around the shapes of the Finnish mobile numbers, with
+    valid and invalid prefixes and lengths, with random spaces and with some
+    non-ASCII digits.
+    """
+    rng = random.Random(seed)
+    prefixes = ["+358", "00358", "0", "+3580", "358", "+ 358", "00 358", ""]
+    starts = ["4", "40", "41", "45", "457", "46", "48", "49", "4946", "5", "50", "51"]
+    # ASCII, Arabic-Indic and fullwidth digits
+    digits = ["0123456789"] * 8 + [
+        "\u0660\u0661\u0662\u0663\u0664\u0665\u0666\u0667\u0668\u0669",
+        "\uff10\uff11\uff12\uff13\uff14\uff15\uff16\uff17\uff18\uff19",
+    ]
+    destinations = []
+    for _ in range(count):
+        number = rng.choice(prefixes) + rng.choice(starts)
+        number += "".join(rng.choices(rng.choice(digits), k=rng.randint(0, 11)))
+        destinations.append(
+            "".join(char + (" " if rng.random() < 0.15 else "") for char in number)
+        )
+    return destinations
+
+
+def test_parse_destination_fast_path():
+    """
+    The fast path for the Finnish mobile numbers gives the same results as
+    phonenumbers.
+    """
+    destinations = (
+        REGION_FI_VALID_PHONE_NUMBERS
+        + [number for number in INVALID_PHONE_NUMBERS if number is not None]
+        + _create_destination_corpus(5000)
+    )
+    differences = [
+        destination
+        for destination in destinations
+        if _parse_destination(destination)
+        != _parse_destination_with_phonenumbers(destination)
+    ]
+    assert differences == []
+
+
+@pytest.fixture
+def destination_parse_pool(settings):
+    settings.DESTINATION_PARSE_POOL_THRESHOLD = 10
+    settings.DESTINATION_PARSE_POOL_WORKERS = 2
+    get_destination_parse_pool.cache_clear()
+    yield
+    get_destination_parse_pool().shutdown()
+    get_destination_parse_pool.cache_clear()
+
+
+def test_parse_destinations_in_process_pool(destination_parse_pool):
+    destinations = _create_destination_corpus(100)
+
+    assert parse_destinations(destinations) == [
+        _parse_destination(destination) for destination in destinations
+    ]
+
+
+def test_parse_destinations_below_threshold(destination_parse_pool):
+    with mock.patch("api.utils.get_destination_parse_pool") as pool:
+        parse_destinations(["0401234567"] * 9)
+
+    pool.assert_not_called()
+
+
+def test_parse_destinations_broken_process_pool(destination_parse_pool):
+    destinations = _create_destination_corpus(10)
+
+    with mock.patch("api.utils.get_destination_parse_pool") as pool:
+        pool.return_value.map.side_effect = BrokenProcessPool
+        assert parse_destinations(destinations) == [
+            _parse_destination(destination) for destination in destinations
+        ]
+
+    pool.cache_clear.assert_called_once()
+
+
+def test_parse_destinations_pool_disabled_by_default():
+    with mock.patch("api.utils.get_destination_parse_pool") as pool:
+        parse_destinations(["0401234567"] * 20000)
+
+    pool.assert_not_called()
+
+
+@pytest.mark.parametrize("cpus, workers", [(1, 1), (3, 3), (64, 4)])
+def test_destination_parse_pool_workers(settings, cpus, workers):
+    settings.DESTINATION_PARSE_POOL_WORKERS = 0
+
+    with mock.patch("api.utils.os.sched_getaffinity", return_value=set(range(cpus))):
+        assert _get_destination_parse_pool_workers() == workers
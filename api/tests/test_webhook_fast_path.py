@@ -0,0 +1,90 @@
+import json
+import uuid
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+
+from api.factories import DeliveryLogFactory
+from api.models import DeliveryReport
+from api.utils import create_report
+
+DESTINATION = "+358461231231"
+
+WEBHOOK_DATA = {
+    "sender": "hel.fi",
+    "destination": DESTINATION,
+    "status": "DELIVERED",
+    "statustime": "2020-07-21T09:18:00Z",
+    "smscount": "1",
+    "billingref": "Palvelutarjotin",
+}
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def fast_path(settings):
+    settings.DELIVERY_REPORT_WEBHOOK_FAST_PATH = True
+
+
+@pytest.fixture
+def delivery_log():
+    log = DeliveryLogFactory()
+    log.save_report(create_report([DESTINATION], "CREATED"))
+    return log
+
+
+def _post(log_id, data, content_type="application/json"):
+    return Client().post(
+        reverse("delivery_log_webhook", kwargs={"id": str(log_id)}),
+        data=data,
+        content_type=content_type,
+    )
+
+
+def test_webhook_fast_path(delivery_log, monkeypatch):
+    monkeypatch.setattr(
+        "rest_framework.views.APIView.dispatch",
+        lambda *args, **kwargs: pytest.fail("DRF should be skipped"),
+    )
+
+    response = _post(delivery_log.id, json.dumps(WEBHOOK_DATA))
+
+    assert response.status_code == 200
+    assert delivery_log.get_report()["messages"][DESTINATION] == WEBHOOK_DATA
+
+
+def test_webhook_fast_path_buffered(delivery_log, settings):
+    settings.DELIVERY_REPORTS_BUFFERED = True
+
+    response = _post(delivery_log.id, json.dumps(WEBHOOK_DATA))
+
+    assert response.status_code == 200
+    assert DeliveryReport.objects.get().data == WEBHOOK_DATA
+
+
+def test_webhook_fast_path_missing_log():
+    response = _post(uuid.uuid4(), json.dumps(WEBHOOK_DATA))
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("body", ["{invalid", "[]"])
+def test_webhook_fast_path_invalid_json(delivery_log, body):
+    response = _post(delivery_log.id, body)
+
+    assert response.status_code == 400
+
+
+def test_webhook_fast_path_falls_back_for_form_data(delivery_log):
+    response = Client().post(
+        reverse("delivery_log_webhook", kwargs={"id": str(delivery_log.id)}),
+        data=WEBHOOK_DATA,
+    )
+
+    assert response.status_code == 200
+    assert delivery_log.get_report()["messages"][DESTINATION] == WEBHOOK_DATA
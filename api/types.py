@@ -1,4 +1,4 @@
-from typing import List, Optional, TypedDict
+from typing import Dict, List, NotRequired, Optional, Protocol, TypedDict, Union
 
 
 class Recipient(TypedDict):
@@ -12,6 +12,19 @@ class SendMessagePayload(TypedDict):
     text: str
 
 
+class TemplateRecipient(TypedDict):
+    destination: str
+    format: NotRequired[Optional[str]]
+    variables: NotRequired[dict]
+
+
+class TemplateSendMessagePayload(TypedDict):
+    sender: str
+    template: str
+    to: List[TemplateRecipient]
+    variables: NotRequired[dict]
+
+
 class MessageWebhookPayload(TypedDict):
     sender: str
     destination: str
@@ -19,3 +32,25 @@ class MessageWebhookPayload(TypedDict):
     statustime: str
     smscount: str
     billingref: str
+
+
+class PendingMessage(TypedDict):
+    sender: str
+    destinations: List[str]
+    text: NotRequired[str]
+    # The texts rendered from a template and their destinations, instead of `text`
+    messages: NotRequired[Dict[str, List[str]]]
+    options: dict
+
+
+class SMSSender(Protocol):
+    """
+    The interface of the SMS provider backends, e.g. `quriiri.send.Sender`.
+    """
+
+    def send_sms(
+        self, sender: str, destination: Union[str, List[str]], text: str, **optional
+    ) -> dict:
+        """
+        Send the message and return the report of the messages by destination.
+        """
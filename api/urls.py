@@ -3,8 +3,27 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+    path("messages", views.list_delivery_logs, name="list_messages"),
     path("message/send", views.send_message, name="send_message"),
+    path("message/send-bulk", views.send_messages_bulk, name="send_messages_bulk"),
+    path(
+        "message/delivery-reports",
+        views.delivery_reports_webhook,
+        name="delivery_reports_webhook",
+    ),
+    path("message/statuses", views.get_delivery_logs, name="get_messages"),
+    path("message/templates", views.message_templates, name="message_templates"),
+    path(
+        "message/templates/<uuid:id>",
+        views.message_template,
+        name="message_template",
+    ),
     path("message/<id>", views.get_delivery_log, name="get_message"),
+    path(
+        "message/<id>/events",
+        views.delivery_log_events,
+        name="delivery_log_events",
+    ),
     path(
         "message/webhook/<id>",
         views.delivery_log_webhook,
@@ -1,16 +1,48 @@
+import hashlib
+import json
 import logging
-from typing import Any, List, Optional, Union
+import math
+import multiprocessing
+import os
+import re
+import threading
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import cache
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import phonenumbers
+from django.conf import settings
+from django.core.cache import caches
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from phonenumbers.phonenumberutil import NumberParseException
 
 from api.const import NOTIFICATION_TYPE_MOBILE, REGION
-from api.types import Recipient, SendMessagePayload
+from api.types import Recipient, SendMessagePayload, TemplateSendMessagePayload
 from notification_service.settings import DEBUG, QURIIRI_REPORT_URL
 
 logger = logger = logging.getLogger(__name__)
 
+try:
+    # orjson is an optional, faster JSON decoder
+    from orjson import loads as _loads_json
+except ImportError:
+    _loads_json = json.loads
+
+
+def loads_json(data: Union[bytes, str]) -> Any:
+    """
+    Decode JSON with orjson if it is installed, or with the standard library.
+
+    Raises:
+        ValueError: If the data is not valid JSON.
+    """
+    return _loads_json(data)
+
 
 def collect_destinations(
     recipients: List[Recipient], number_type: Optional[str] = NOTIFICATION_TYPE_MOBILE
@@ -26,20 +58,495 @@ def collect_destinations(
 
 def get_default_options(request, **kwargs):
     options = {}
-    relative_drurl = reverse("delivery_log_webhook", kwargs={"id": kwargs.get("id")})
+    if settings.QURIIRI_BATCH_DELIVERY_REPORTS:
+        # The reports of all the delivery logs are sent to the same endpoint,
+        # which finds the delivery log by the batch id
+        relative_drurl = reverse("delivery_reports_webhook")
+        options["drtype"] = settings.QURIIRI_DELIVERY_REPORT_TYPE
+        options["batchid"] = str(kwargs.get("id"))
+    else:
+        relative_drurl = reverse(
+            "delivery_log_webhook", kwargs={"id": kwargs.get("id")}
+        )
     if DEBUG:
         # Dev setting to receive delivery log
         options["drurl"] = f"{QURIIRI_REPORT_URL}{relative_drurl}"
     else:
         options["drurl"] = request.build_absolute_uri(relative_drurl)
+    if settings.QURIIRI_COALESCE_WINDOW:
+        # Identifies the delivery log whose webhook receives the delivery reports
+        # when the message is merged with other identical messages
+        options["batchid"] = str(kwargs.get("id"))
     return options
 
 
-def filter_valid_destinations(
+def normalize_destination(destination: str) -> str:
+    """
+    Normalize a phone number for matching the delivery reports to the messages.
+
+    Only the digits are kept, so e.g. "+358 46 1231231" and "358461231231"
+    are the same destination.
+    """
+    return "".join(char for char in destination if char.isdigit())
+
+
+def validate_delivery_report(report_data) -> None:
+    """
+    Validate a delivery report sent by Quriiri before it is applied or stored.
+
+    Raises:
+        ValueError: If the report is not valid.
+    """
+    if not isinstance(report_data, dict):
+        raise ValueError("Expected a JSON object")
+    if not report_data.get("destination"):
+        raise ValueError("Missing destination")
+    if not isinstance(report_data["destination"], str):
+        raise ValueError("Expected the destination to be a string")
+
+
+def create_report(destinations: List[str], status: str) -> dict:
+    """
+    Create a delivery report where every destination has the same status.
+
+    The report has the same shape as the one returned by
+    `quriiri.send.Sender.send_sms`.
+
+    Args:
+        destinations: A list of phone numbers as strings.
+        status: The status to set for every destination.
+
+    Returns:
+        A report dictionary with "errors", "warnings" and "messages" keys.
+    """
+    return {
+        "errors": [],
+        "warnings": [],
+        "messages": {
+            destination: {"converted": destination, "status": status}
+            for destination in destinations
+        },
+    }
+
+
+# The common shapes of the Finnish mobile numbers (e.g. "+358401234567",
+# "040 123 4567"), without the spaces. The national significant number matches
+# the mobile number pattern of the "FI" metadata of phonenumbers.
+# [0-9] instead of \d, which matches the other Unicode digits too
+_FI_MOBILE_NUMBER_RE = re.compile(r"(?:(?:\+|00)358|0)((?:4[0-8]|50)[0-9]{4,8})")
+
+
+def _parse_destination(destination: Optional[str]) -> Tuple[Optional[str], str]:
+    """
+    Returns:
+        The destination in international format and an empty string, or None
+        and the reason for rejecting the destination.
+    """
+    if destination and REGION == "FI":
+        # Fast path for the common Finnish mobile numbers, which gives the same
+        # result as phonenumbers without parsing the number
+        match = _FI_MOBILE_NUMBER_RE.fullmatch(destination.replace(" ", ""))
+        if match:
+            number = match.group(1)
+            return f"+358 {number[:2]} {number[2:]}", ""
+    return _parse_destination_with_phonenumbers(destination)
+
+
+def _parse_destination_with_phonenumbers(
+    destination: Optional[str],
+) -> Tuple[Optional[str], str]:
+    if not destination:
+        return None, "empty"
+
+    # Pre-check for letters to prevent unwanted conversions
+    if any(char.isalpha() for char in destination):
+        return None, "contains letters"
+
+    try:
+        phone_number = phonenumbers.parse(destination, REGION)
+    except NumberParseException:
+        return None, "invalid format"
+
+    if not phonenumbers.is_valid_number(phone_number):
+        return None, "invalid number"
+
+    return (
+        phonenumbers.format_number(
+            phone_number, phonenumbers.PhoneNumberFormat.INTERNATIONAL
+        ),
+        "",
+    )
+
+
+# The maximum number of processes of the destination parse pool, when the number
+# is taken from the CPUs available to the process
+DESTINATION_PARSE_POOL_MAX_WORKERS = 4
+
+
+@cache
+def get_destination_parse_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool that validates the long lists of phone numbers.
+
+    The workers are started by a fork server instead of forking the calling
+    process, as forking a multi-threaded uWSGI worker can deadlock.
+    """
+    return ProcessPoolExecutor(
+        max_workers=_get_destination_parse_pool_workers(),
+        mp_context=multiprocessing.get_context("forkserver"),
+    )
+
+
+def _get_destination_parse_pool_workers() -> int:
+    if settings.DESTINATION_PARSE_POOL_WORKERS:
+        return settings.DESTINATION_PARSE_POOL_WORKERS
+    try:
+        cpu_count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on all the platforms
+        cpu_count = os.cpu_count() or 1
+    return min(cpu_count, DESTINATION_PARSE_POOL_MAX_WORKERS)
+
+
+def parse_destinations(
+    destinations: List[Optional[str]],
+) -> List[Tuple[Optional[str], str]]:
+    """
+    Parse the destinations with `_parse_destination`, in the same order.
+
+    At least `DESTINATION_PARSE_POOL_THRESHOLD` destinations are parsed in chunks
+    in the process pool, so that a huge recipient list does not keep one CPU
+    busy.
+    """
+    threshold = settings.DESTINATION_PARSE_POOL_THRESHOLD
+    if not threshold or len(destinations) < threshold:
+        return [_parse_destination(destination) for destination in destinations]
+
+    # A few chunks per worker, so that a slow chunk does not leave the
+    # other workers idle
+    chunksize = math.ceil(
+        len(destinations) / (_get_destination_parse_pool_workers() * 4)
+    )
+    try:
+        return list(
+            get_destination_parse_pool().map(
+                _parse_destination, destinations, chunksize=chunksize
+            )
+        )
+    except BrokenProcessPool:
+        logger.exception("The destination parse pool is broken, parsing serially.")
+        get_destination_parse_pool.cache_clear()
+        return [_parse_destination(destination) for destination in destinations]
+
+
+class SharedLRUCache:
+    """
+    A per-process LRU of `maxsize` entries. With a `cache_alias`, the entries
+    missing from the LRU are looked up in that Django cache, so that the
+    processes share them.
+
+    With a `maxweight`, the LRU also keeps the total weight of its entries, see
+    `_get_weight`, below it. An entry heavier than that is not kept in the LRU.
+
+    A lookup is counted as a hit, a shared hit or a miss, when the entry is
+    found in the LRU, in the shared cache or nowhere.
+    """
+
+    key_prefix = ""
+
+    def __init__(
+        self,
+        maxsize: int,
+        cache_alias: Optional[str] = None,
+        ttl: int = 3600,
+        maxweight: int = 0,
+    ):
+        """
+        Args:
+            maxsize: The maximum number of entries in the LRU. 0 disables it.
+            cache_alias: The shared Django cache, or None.
+            ttl: Seconds the entries are kept in the shared cache.
+            maxweight: The maximum total weight of the entries in the LRU. 0
+                for no limit.
+        """
+        self.maxsize = maxsize
+        self.cache_alias = cache_alias
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        # The values with their weights by the key
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_cache_key(self, key: str) -> str:
+        return f"{self.key_prefix}:{key}"
+
+    def _get_weight(self, value) -> int:
+        return 1
+
+    def _get_local(self, keys: List[str]) -> dict:
+        """
+        Returns:
+            The values found in the LRU by the key.
+        """
+        values = {}
+        with self._lock:
+            for key in keys:
+                entry = self._results.get(key)
+                if entry is not None:
+                    self._results.move_to_end(key)
+                    values[key] = entry[0]
+        return values
+
+    def _get_shared(self, keys: List[str]) -> dict:
+        """
+        Returns:
+            The values found in the shared cache by the key.
+        """
+        if not (keys and self.cache_alias):
+            return {}
+        cache_keys = {self._get_cache_key(key): key for key in keys}
+        shared = caches[self.cache_alias].get_many(cache_keys)
+        return {cache_keys[cache_key]: value for cache_key, value in shared.items()}
+
+    def _set_shared(self, values: dict) -> None:
+        if values and self.cache_alias:
+            caches[self.cache_alias].set_many(
+                {self._get_cache_key(key): value for key, value in values.items()},
+                self.ttl,
+            )
+
+    def _store(self, values: dict) -> None:
+        """
+        Put the values to the LRU, and evict the least recently used entries
+        until the LRU fits in `maxsize` and `maxweight`.
+        """
+        if not self.maxsize:
+            return
+        with self._lock:
+            for key, value in values.items():
+                self._pop(key)
+                weight = self._get_weight(value)
+                if self.maxweight and weight > self.maxweight:
+                    continue
+                self._results[key] = (value, weight)
+                self.weight += weight
+            while len(self._results) > self.maxsize or (
+                self.maxweight and self.weight > self.maxweight
+            ):
+                _, (_, weight) = self._results.popitem(last=False)
+                self.weight -= weight
+
+    def _pop(self, key: str) -> None:
+        entry = self._results.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[1]
+
+    def _count(self, hits: int = 0, misses: int = 0, shared_hits: int = 0) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.shared_hits += shared_hits
+
+    def delete(self, key: str) -> None:
+        """
+        Drop the entry from the LRU of this process and from the shared cache.
+        """
+        with self._lock:
+            self._pop(key)
+        if self.cache_alias:
+            caches[self.cache_alias].delete(self._get_cache_key(key))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+            self.weight = 0
+            self.hits = self.misses = self.shared_hits = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            "size": len(self._results),
+            "maxsize": self.maxsize,
+        }
+
+
+class DestinationCache(SharedLRUCache):
+    """
+    Memoises the validation and the conversion of phone numbers, as the same
+    numbers are sent over and over again.
+
+    The results are kept in a per-process LRU of `maxsize` destinations. With a
+    `cache_alias`, the destinations missing from the LRU are looked up in that
+    Django cache before parsing them, so that the processes share the results.
+    """
+
+    key_prefix = "destination"
+
+    def __init__(
+        self,
+        maxsize: int = 100000,
+        cache_alias: Optional[str] = None,
+        ttl: int = 24 * 60 * 60,
+    ):
+        """
+        Args:
+            maxsize: The maximum number of destinations in the LRU. 0 disables it.
+            cache_alias: The shared Django cache, or None.
+            ttl: Seconds the results are kept in the shared cache.
+        """
+        super().__init__(maxsize, cache_alias, ttl)
+
+    def _get_cache_key(self, destination: str) -> str:
+        # The metadata of the library decides which numbers are valid
+        digest = hashlib.sha256(destination.encode()).hexdigest()
+        return f"{self.key_prefix}:{phonenumbers.__version__}:{REGION}:{digest}"
+
+    def get_many(self, destinations: List[str]) -> Dict[str, Tuple[Optional[str], str]]:
+        """
+        Returns:
+            The result of `_parse_destination` by destination.
+        """
+        unique = [
+            destination for destination in dict.fromkeys(destinations) if destination
+        ]
+        results = self._get_local(unique)
+        missing = [destination for destination in unique if destination not in results]
+
+        parsed = self._get_shared(missing)
+        unparsed = [destination for destination in missing if destination not in parsed]
+        new_results = dict(zip(unparsed, parse_destinations(unparsed)))
+        self._set_shared(new_results)
+        parsed.update(new_results)
+        self._count(
+            hits=len(results),
+            misses=len(new_results),
+            shared_hits=len(parsed) - len(new_results),
+        )
+
+        self._store(parsed)
+        results.update(parsed)
+        return results
+
+    def get(self, destination: str) -> Tuple[Optional[str], str]:
+        if not destination:
+            return _parse_destination(destination)
+        return self.get_many([destination])[destination]
+
+
+@cache
+def get_destination_cache() -> DestinationCache:
+    """
+    Get the destination cache shared by the whole process.
+    """
+    return DestinationCache(
+        maxsize=settings.DESTINATION_CACHE_SIZE,
+        cache_alias=settings.DESTINATION_CACHE_ALIAS or None,
+        ttl=settings.DESTINATION_CACHE_TTL,
+    )
+
+
+class DeliveryLogCache(SharedLRUCache):
+    """
+    Caches the serialized delivery logs, as the logs of an active campaign are
+    polled over and over again.
+
+    The logs are cached with their version, e.g. the `updated_at` of the log, and
+    an entry of an older version is a miss. So every write to a log invalidates
+    its entry, without having to find all the places that write.
+
+    The logs are kept in a per-process LRU of `maxsize` logs, which have at most
+    `max_messages` messages in total, so that the size of the LRU stays bounded
+    however large the logs are. A log of more messages is not kept in the LRU.
+    With a `cache_alias`, the logs missing from the LRU are looked up in that
+    Django cache, so that the processes share them.
+    """
+
+    key_prefix = "delivery_log"
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        cache_alias: Optional[str] = None,
+        ttl: int = 3600,
+        max_messages: int = 0,
+    ):
+        """
+        Args:
+            maxsize: The maximum number of logs in the LRU. 0 disables it.
+            cache_alias: The shared Django cache, or None.
+            ttl: Seconds the logs are kept in the shared cache.
+            max_messages: The maximum number of messages of the logs in the LRU.
+                0 for no limit.
+        """
+        super().__init__(maxsize, cache_alias, ttl, maxweight=max_messages)
+
+    def _get_weight(self, entry: Tuple[str, dict]) -> int:
+        report = entry[1].get("report") or {}
+        return max(len(report.get("messages") or ()), 1)
+
+    def get(self, log_id, version: str) -> Optional[dict]:
+        """
+        Returns:
+            The serialized log, or None if the version is not cached.
+        """
+        key = str(log_id)
+        entry = self._get_local([key]).get(key)
+        if entry is not None and entry[0] == version:
+            self._count(hits=1)
+            return entry[1]
+
+        entry = self._get_shared([key]).get(key)
+        if entry is None or entry[0] != version:
+            self._count(misses=1)
+            return None
+        self._count(shared_hits=1)
+        self._store({key: entry})
+        return entry[1]
+
+    def set(self, log_id, version: str, data: dict) -> None:
+        key = str(log_id)
+        self._set_shared({key: (version, data)})
+        self._store({key: (version, data)})
+
+    def delete(self, log_id) -> None:
+        super().delete(str(log_id))
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "messages": self.weight,
+            "max_messages": self.maxweight,
+        }
+
+
+@cache
+def get_delivery_log_cache() -> DeliveryLogCache:
+    """
+    Get the delivery log cache shared by the whole process.
+    """
+    return DeliveryLogCache(
+        maxsize=settings.DELIVERY_LOG_CACHE_SIZE,
+        cache_alias=settings.DELIVERY_LOG_CACHE_ALIAS or None,
+        ttl=settings.DELIVERY_LOG_CACHE_TTL,
+        max_messages=settings.DELIVERY_LOG_CACHE_MAX_MESSAGES,
+    )
+
+
+def validate_destinations(
     destinations: List[str], convert_to_international_format: bool = False
-) -> List[str]:
+) -> Tuple[List[str], Dict[str, List[int]]]:
     """
-    Filters a list of phone numbers and returns a list of valid phone numbers.
+    Validates a list of phone numbers and collects the rejected ones.
+
+    The results are memoised, see `DestinationCache`.
 
     Args:
         destinations: A list of phone numbers as strings.
@@ -48,38 +555,75 @@ def filter_valid_destinations(
 
     Returns:
         A list of valid phone numbers as strings, either in their original
-        format or in international format.
+        format or in international format, and the indexes of the rejected
+        phone numbers by the reason, e.g. `{"invalid number": [1, 4]}`.
     """
+    results = get_destination_cache().get_many(destinations)
 
     valid_destinations = []
-    for destination in destinations:
-        # Pre-check for letters to prevent unwanted conversions
+    rejected = defaultdict(list)
+    for index, destination in enumerate(destinations):
         if not destination:
-            logger.warning(f"The destination was empty in {destinations}.")
+            rejected["empty"].append(index)
             continue
 
-        if any(char.isalpha() for char in destination):
-            logger.warning(f"Invalid phone number: {destination} (contains letters)")
+        international_destination, reason = results[destination]
+        if reason:
+            rejected[reason].append(index)
             continue
 
-        try:
-            phone_number = phonenumbers.parse(destination, REGION)
-        except NumberParseException:
-            logger.warning(f"Invalid phone number format: {destination}")
-            continue
+        # Convert to international format if requested
+        valid_destinations.append(
+            international_destination
+            if convert_to_international_format
+            else destination
+        )
 
-        if not phonenumbers.is_valid_number(phone_number):
-            logger.warning(f"Invalid phone number: {destination}")
-            continue
+    return valid_destinations, dict(rejected)
 
-        # Convert to international format if requested
-        if convert_to_international_format:
-            destination = phonenumbers.format_number(
-                phone_number, phonenumbers.PhoneNumberFormat.INTERNATIONAL
-            )
 
-        valid_destinations.append(destination)
+def log_rejected_destinations(rejected: Dict[str, List[int]], count: int) -> None:
+    """
+    Log one summary line of the rejected phone numbers, see
+    `validate_destinations`.
+
+    Args:
+        rejected: The indexes of the rejected phone numbers by the reason.
+        count: The number of the validated phone numbers.
+    """
+    if not rejected:
+        return
+    reasons = ", ".join(
+        f"{reason}: {len(indexes)}" for reason, indexes in sorted(rejected.items())
+    )
+    logger.warning(
+        f"Rejected {sum(len(indexes) for indexes in rejected.values())} of "
+        f"{count} phone numbers ({reasons})."
+    )
+
+
+def filter_valid_destinations(
+    destinations: List[str], convert_to_international_format: bool = False
+) -> List[str]:
+    """
+    Filters a list of phone numbers and returns a list of valid phone numbers.
+
+    The rejected phone numbers are logged with one summary line, see
+    `validate_destinations`.
 
+    Args:
+        destinations: A list of phone numbers as strings.
+        convert_to_international_format: If True, converts valid phone numbers
+                                            to international format.
+
+    Returns:
+        A list of valid phone numbers as strings, either in their original
+        format or in international format.
+    """
+    valid_destinations, rejected = validate_destinations(
+        destinations, convert_to_international_format
+    )
+    log_rejected_destinations(rejected, len(destinations))
     return valid_destinations
 
 
@@ -138,3 +682,121 @@ def validate_send_message_payload(post_data: Union[Any, SendMessagePayload]) ->
 
     if not isinstance(post_data["text"], str):
         raise ValueError("'Text' must be a string")
+
+
+def validate_template_send_message_payload(
+    post_data: Union[Any, TemplateSendMessagePayload],
+) -> None:
+    """
+    Validates the data to ensure it conforms to the TemplateSendMessagePayload
+    structure.
+
+    Payload example
+    {
+        "sender": "Hel.fi",
+        "template": "<message template id>",
+        "to": [
+            {
+                "destination": "string",
+                "variables": {"name": "Matti"},
+            },
+            {
+                "destination": "string",
+                "variables": {"name": "Maija"},
+            }
+        ],
+        "variables": {"time": "10:00"}
+    }
+
+    Args:
+        data: The data to validate.
+
+    Raises:
+        ValueError: If the data is not valid.
+    """
+
+    if not isinstance(post_data, dict):
+        raise ValueError("Data must be a dictionary")
+
+    if not all(key in post_data for key in ("sender", "to", "template")):
+        raise ValueError(
+            "Missing required keys: 'sender', 'to', and 'template' are required."
+        )
+
+    if not isinstance(post_data["sender"], str):
+        raise ValueError("'Sender' must be a string")
+
+    if not isinstance(post_data["template"], str):
+        raise ValueError("'Template' must be a string")
+
+    if not isinstance(post_data["to"], list) or not all(
+        isinstance(recipient, dict)
+        and isinstance(recipient.get("destination"), str)
+        and isinstance(recipient.get("variables", {}), dict)
+        for recipient in post_data["to"]
+    ):
+        raise ValueError(
+            "'To' must be a list of dictionaries, each with a string "
+            "'destination' field and an optional 'variables' dictionary."
+        )
+
+    if not isinstance(post_data.get("variables", {}), dict):
+        raise ValueError("'Variables' must be a dictionary")
+
+
+def merge_reports(reports: List[dict]) -> dict:
+    """
+    Merge the reports of several `Sender.send_sms` calls into one report.
+    """
+    merged = {"errors": [], "warnings": [], "messages": {}}
+    for report in reports:
+        for key, value in report.items():
+            if key == "messages":
+                merged["messages"].update(value)
+            elif isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            else:
+                merged.setdefault(key, value)
+    return merged
+
+
+def parse_send_at(value: Any) -> Optional[datetime]:
+    """
+    Parse the send time of a scheduled message.
+
+    Args:
+        value: An ISO 8601 datetime string, or None. A time without a timezone
+            is in the timezone of the service.
+
+    Returns:
+        The send time, or None if the message should be sent right away.
+
+    Raises:
+        ValueError: If the value is not a valid datetime.
+    """
+    if value is None:
+        return None
+    send_at = parse_iso_datetime(value, "Send_at")
+    if send_at <= timezone.now():
+        return None
+    return send_at
+
+
+def parse_iso_datetime(value: Any, name: str) -> datetime:
+    """
+    Parse an ISO 8601 datetime. A time without a timezone is in the timezone of
+    the service.
+
+    Args:
+        value: The value to parse.
+        name: The name of the value for the error message.
+
+    Raises:
+        ValueError: If the value is not a valid datetime.
+    """
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError(f"'{name}' must be an ISO 8601 datetime")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
@@ -1,32 +1,95 @@
+import asyncio
+import base64
+import binascii
+import itertools
+import json
 import logging
+import math
+import uuid
+from collections import defaultdict
+from copy import deepcopy
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional, Tuple
 
-from django.db import transaction
-from django.http import HttpResponseBadRequest
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import APIException
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from api.models import DeliveryLog
-from api.serializers import DeliveryLogSerializer
+from api.enums import AggregateDeliveryStatus, DeliveryStatus
+from api.events import (
+    delivery_log_changes,
+    FINAL_MESSAGE_STATUSES,
+    format_event,
+)
+from api.exceptions import RateLimitExceededError
+from api.idempotency import idempotent
+from api.models import DeliveryLog, DeliveryReport, MessageDelivery, MessageTemplate
+from api.serializers import (
+    DeliveryLogListSerializer,
+    DeliveryLogSerializer,
+    MessageTemplateSerializer,
+)
+from api.services import (
+    create_sms_sender,
+    get_batch_id,
+    send_grouped_messages,
+    send_rendered_messages,
+    update_delivery_logs,
+)
 from api.types import SendMessagePayload
 from api.utils import (
     collect_destinations,
-    filter_valid_destinations,
+    create_report,
     get_default_options,
+    get_delivery_log_cache,
+    loads_json,
+    log_rejected_destinations,
+    parse_iso_datetime,
+    parse_send_at,
+    validate_delivery_report,
+    validate_destinations,
     validate_send_message_payload,
+    validate_template_send_message_payload,
 )
 from audit_log.enums import Operation
 from audit_log.services import audit_log_service, create_api_commit_message_from_request
-from notification_service.settings import QURIIRI_API_KEY, QURIIRI_API_URL
-from quriiri.send import Sender
 
 logger = logging.getLogger(__name__)
 
-sms_sender = Sender(QURIIRI_API_KEY, QURIIRI_API_URL)
+sms_sender = create_sms_sender()
+
+# The default and the maximum number of delivery logs per page of the list
+MESSAGES_PAGE_SIZE = 100
+MESSAGES_MAX_PAGE_SIZE = 1000
+
+# Seconds after which an idle event stream sends a comment, so that the proxies
+# do not close the connection
+EVENTS_KEEPALIVE_INTERVAL = 15
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent
 @transaction.atomic
 def send_message(request):
     """
@@ -49,93 +112,1033 @@ def send_message(request):
         ],
         "text": "SMS message"
     }
+
+    Instead of the `text`, the message can be rendered from a stored message
+    template with the variables of each recipient:
+    {
+        "sender": "Hel.fi",
+        "template": "<message template id>",
+        "to": [
+            {
+                "destination": "string",
+                "variables": {"name": "Matti"},
+            }
+        ],
+        "variables": {"time": "10:00"}
+    }
+    The recipients whose rendered texts are identical are sent with one provider
+    request. All the recipients share one delivery log.
+
+    A message with a future `send_at` time (ISO 8601, e.g.
+    "2024-01-31T07:30:00+02:00") is scheduled, and the response is returned with
+    the status 202. The scheduled messages are sent by the
+    `send_scheduled_messages` management command.
+
+    A request with an `Idempotency-Key` header is sent only once, the later
+    requests with the same key get the response of the first one.
+
+    When the `SMS_SEND_ASYNC` setting is enabled, the message is only queued
+    and the response is returned with the status 202. The queued messages are
+    sent by the `send_queued_messages` management command.
     """
     data: SendMessagePayload = request.data
+    template = None
+    messages = None
     try:
-        validate_send_message_payload(data)
+        if isinstance(data, dict) and "template" in data:
+            validate_template_send_message_payload(data)
+            template = _get_message_template(request.user, data["template"])
+            messages, rejected = template.render_messages(
+                data["to"], data.get("variables")
+            )
+        else:
+            validate_send_message_payload(data)
+        send_at = parse_send_at(data.get("send_at"))
     except ValueError as e:
         return HttpResponseBadRequest(e)
 
-    destinations = collect_destinations(recipients=data["to"], number_type=None)
-    # Get unique list of phone numbers converted to international format
-    unique_valid_destinations = list(
-        set(
-            filter_valid_destinations(
-                destinations, convert_to_international_format=True
-            )
+    if messages is not None:
+        unique_valid_destinations = [
+            destination
+            for destinations in messages.values()
+            for destination in destinations
+        ]
+    else:
+        destinations = collect_destinations(recipients=data["to"], number_type=None)
+        valid_destinations, rejected = validate_destinations(
+            destinations, convert_to_international_format=True
         )
-    )
+        # Get unique list of phone numbers converted to international format,
+        # in the order of the recipients
+        unique_valid_destinations = list(dict.fromkeys(valid_destinations))
+    log_rejected_destinations(rejected, len(data["to"]))
 
     if not unique_valid_destinations:
-        return HttpResponseBadRequest("No valid destinations for SMS sender.")
+        return Response(
+            status=400,
+            data={
+                "error": "No valid destinations for SMS sender.",
+                "rejected": rejected,
+            },
+        )
 
-    log = DeliveryLog.objects.create(user=request.user)
-    options = get_default_options(request, id=log.id)
+    if send_at or settings.SMS_SEND_ASYNC:
+        log = DeliveryLog(
+            user=request.user,
+            status=DeliveryStatus.SCHEDULED if send_at else DeliveryStatus.QUEUED,
+            send_at=send_at,
+            template=template,
+        )
+        log.pending_message = {
+            "sender": data["sender"],
+            "destinations": unique_valid_destinations,
+            "options": get_default_options(request, id=log.id),
+        }
+        if messages is not None:
+            log.pending_message["messages"] = messages
+        else:
+            log.pending_message["text"] = data["text"]
+        deliveries = log.save_report(
+            create_report(unique_valid_destinations, log.status.value)
+        )
+        response_status = 202
+    else:
+        log = DeliveryLog.objects.create(user=request.user, template=template)
+        options = get_default_options(request, id=log.id)
 
-    resp = sms_sender.send_sms(
-        data["sender"], unique_valid_destinations, data["text"], **options
-    )
+        try:
+            if messages is not None:
+                resp = send_rendered_messages(
+                    sms_sender, data["sender"], messages, **options
+                )
+            else:
+                resp = sms_sender.send_sms(
+                    data["sender"], unique_valid_destinations, data["text"], **options
+                )
+        except RateLimitExceededError as e:
+            transaction.set_rollback(True)
+            return Response(
+                status=429,
+                data={"error": str(e)},
+                headers={"Retry-After": str(math.ceil(e.retry_after))},
+            )
 
-    log.report = resp
-    log.save()
+        log.batch_id = get_batch_id(resp)
+        deliveries = log.save_report(resp)
+        response_status = 200
 
     try:
-        # Write audit log of the action
+        # Write audit log of the action, with the recipients, which are not a
+        # part of the log itself
         audit_log_service._commit_to_audit_log(
             message=create_api_commit_message_from_request(
                 request=request,
                 operation=Operation.CREATE.value,
                 object_ids=[str(log.pk)],
-                new_objects=[log],
+                new_objects=[log, *deliveries],
             )
         )
     except Exception as e:
         logger.error(f"Committing to audit log failed: {e}")
 
-    return Response(DeliveryLogSerializer(log).data)
+    return Response(
+        {**DeliveryLogSerializer(log).data, "rejected": rejected},
+        status=response_status,
+    )
+
+
+def _get_message_template(user, id) -> MessageTemplate:
+    """
+    Raises:
+        ValueError: If the user does not have a template with the id.
+    """
+    try:
+        return user.message_templates.get(id=id)
+    except (MessageTemplate.DoesNotExist, ValidationError):
+        raise ValueError(f"Message template {id} does not exist")
+
+
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticated])
+def message_templates(request):
+    """
+    List the message templates of the user, or create a new one.
+    """
+    if request.method == "POST":
+        serializer = MessageTemplateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        template = serializer.save(user=request.user)
+        audit_log_service._commit_to_audit_log(
+            message=create_api_commit_message_from_request(
+                request=request,
+                operation=Operation.CREATE.value,
+                object_ids=[str(template.pk)],
+                new_objects=[template],
+            )
+        )
+        return Response(serializer.data, status=201)
+
+    templates = list(request.user.message_templates.all())
+    audit_log_service._commit_to_audit_log(
+        message=create_api_commit_message_from_request(
+            request=request,
+            operation=Operation.READ.value,
+            object_ids=[str(template.pk) for template in templates],
+        )
+    )
+    return Response(MessageTemplateSerializer(templates, many=True).data)
+
+
+@api_view(["GET", "PUT", "DELETE"])
+@permission_classes([IsAuthenticated])
+def message_template(request, id):
+    """
+    Get, update or delete a message template of the user.
+    """
+    try:
+        template = request.user.message_templates.get(id=id)
+    except MessageTemplate.DoesNotExist:
+        return Response(
+            status=404, data={"error": f"Message template {id} does not exist"}
+        )
+
+    if request.method == "PUT":
+        serializer = MessageTemplateSerializer(template, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        old_template = deepcopy(template)
+        serializer.save()
+        audit_log_service._commit_to_audit_log(
+            message=create_api_commit_message_from_request(
+                request=request,
+                operation=Operation.UPDATE.value,
+                object_ids=[str(id)],
+                old_objects=[old_template],
+                new_objects=[template],
+            )
+        )
+        return Response(serializer.data)
+
+    if request.method == "DELETE":
+        audit_log_service._commit_to_audit_log(
+            message=create_api_commit_message_from_request(
+                request=request,
+                operation=Operation.DELETE.value,
+                object_ids=[str(id)],
+                old_objects=[template],
+            )
+        )
+        template.delete()
+        return Response(status=204)
+
+    audit_log_service._commit_to_audit_log(
+        message=create_api_commit_message_from_request(
+            request=request,
+            operation=Operation.READ.value,
+            object_ids=[str(id)],
+            old_objects=[template],
+        )
+    )
+    return Response(MessageTemplateSerializer(template).data)
+
+
+def _read_ndjson(stream, max_line_length):
+    """
+    Read an NDJSON stream one line at a time, so that the memory use does not
+    depend on the length of the stream.
+
+    Yields:
+        The line number and the decoded item, or a `ValueError` for the lines
+        which are not valid JSON or are longer than `max_line_length` bytes.
+        Blank lines are skipped, but counted.
+    """
+    if stream is None:
+        return
+    for index in itertools.count():
+        if not (line := stream.readline(max_line_length + 1)):
+            return
+        if len(line) > max_line_length:
+            # Skip the rest of the line
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_line_length)
+            yield index, ValueError(f"Line is longer than {max_line_length} bytes")
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield index, loads_json(line)
+        except ValueError as e:
+            yield index, ValueError(f"Invalid JSON: {e}")
+
+
+def _send_bulk_chunk(request, items) -> list:
+    """
+    Validate and send (or queue) a chunk of the items of a bulk send request.
+
+    Returns:
+        The result of each item.
+    """
+    results = {}
+    logs = []
+    chunk_rejected = defaultdict(list)
+    recipient_count = 0
+    for index, item in items:
+        try:
+            if isinstance(item, ValueError):
+                raise item
+            validate_send_message_payload(item)
+        except ValueError as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+            continue
+
+        destinations, rejected = validate_destinations(
+            collect_destinations(recipients=item["to"], number_type=None),
+            convert_to_international_format=True,
+        )
+        destinations = list(dict.fromkeys(destinations))
+        for reason, indexes in rejected.items():
+            chunk_rejected[reason].extend(indexes)
+        recipient_count += len(item["to"])
+        if not destinations:
+            results[index] = {
+                "index": index,
+                "status": "error",
+                "error": "No valid destinations for SMS sender.",
+                "rejected": rejected,
+            }
+            continue
+
+        log = DeliveryLog(user=request.user)
+        message = {
+            "sender": item["sender"],
+            "destinations": destinations,
+            "text": item["text"],
+            "options": get_default_options(request, id=log.id),
+        }
+        logs.append((index, log, message, rejected))
+
+    log_rejected_destinations(chunk_rejected, recipient_count)
+
+    if settings.SMS_SEND_ASYNC:
+        reports = []
+        for _, log, message, _ in logs:
+            log.status = DeliveryStatus.QUEUED
+            log.pending_message = message
+            reports.append(
+                create_report(message["destinations"], DeliveryStatus.QUEUED.value)
+            )
+    else:
+        reports = send_grouped_messages(
+            sms_sender, [(log.id, message) for _, log, message, _ in logs]
+        )
+
+    created_logs = []
+    deliveries = []
+    for (index, log, _, rejected), report in zip(logs, reports):
+        if report is None:
+            results[index] = {
+                "index": index,
+                "status": "error",
+                "error": "Rate limit exceeded, retry later",
+            }
+            continue
+        deliveries.extend(log.set_report(report))
+        log.batch_id = get_batch_id(report)
+        created_logs.append(log)
+        results[index] = {"index": index, "status": "ok", "id": str(log.id)}
+        if rejected:
+            results[index]["rejected"] = rejected
+
+    with transaction.atomic():
+        DeliveryLog.objects.bulk_create(created_logs, batch_size=1000)
+        MessageDelivery.objects.bulk_create(deliveries, batch_size=1000)
+
+    if created_logs:
+        try:
+            # Write one audit log entry for the chunk. The object states are left
+            # out, as there can be hundreds of them.
+            audit_log_service._commit_to_audit_log(
+                message=create_api_commit_message_from_request(
+                    request=request,
+                    operation=Operation.CREATE.value,
+                    object_ids=[str(log.pk) for log in created_logs],
+                )
+            )
+        except Exception as e:
+            logger.error(f"Committing to audit log failed: {e}")
+
+    return [results[index] for index, _ in items]
+
+
+def _send_bulk(request):
+    items = _read_ndjson(request.stream, settings.BULK_SEND_MAX_ITEM_SIZE)
+    while chunk := list(itertools.islice(items, settings.BULK_SEND_CHUNK_SIZE)):
+        try:
+            results = _send_bulk_chunk(request, chunk)
+        except Exception as e:
+            # Keep streaming the results of the other chunks
+            logger.exception(f"Sending a chunk of a bulk send failed: {e}")
+            results = [
+                {
+                    "index": index,
+                    "status": "error",
+                    "error": "Internal error, the message may have been sent",
+                }
+                for index, _ in chunk
+            ]
+        for result in results:
+            yield json.dumps(result).encode() + b"\n"
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def send_messages_bulk(request):
+    """
+    Send many messages with one request. The body is NDJSON (content type
+    `application/x-ndjson`), one `send_message` payload per line:
+
+        {"sender": "Hel.fi", "to": [{"destination": "+358461231231"}], "text": "Hi"}
+        {"sender": "Hel.fi", "to": [{"destination": "+358461231232"}], "text": "Hi"}
+
+    Every message gets a delivery log of its own. The body is read and handled
+    `BULK_SEND_CHUNK_SIZE` messages at a time, and the messages of a chunk with
+    the same sender and text are sent with one provider request. When the
+    `SMS_SEND_ASYNC` setting is enabled, the messages are only queued.
+
+    The response is NDJSON with the result of every message in the same order,
+    streamed as the chunks are handled. The index is the line number of the
+    message:
+
+        {"index": 0, "status": "ok", "id": "<delivery log id>"}
+        {"index": 1, "status": "error", "error": "..."}
+
+    The body must have a Content-Length of at most `BULK_SEND_MAX_SIZE` bytes,
+    so that the request fits in the uWSGI harakiri.
+    """
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or "")
+    except ValueError:
+        return Response(status=411, data={"error": "Content-Length is required"})
+    if settings.BULK_SEND_MAX_SIZE and content_length > settings.BULK_SEND_MAX_SIZE:
+        return Response(
+            status=413,
+            data={
+                "error": f"The body is longer than {settings.BULK_SEND_MAX_SIZE} bytes"
+            },
+        )
+
+    return StreamingHttpResponse(
+        _send_bulk(request), content_type="application/x-ndjson"
+    )
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_delivery_log(request, id):
+    """
+    Get a delivery log.
+
+    The response has an `ETag` and a `Last-Modified` header derived from the
+    `updated_at` of the log. A request with a matching `If-None-Match` header
+    gets `304 Not Modified` without loading the report, for polling the delivery
+    status cheaply. `If-Modified-Since` is ignored, as `Last-Modified` has
+    only a one second resolution and would hide the changes made within the
+    same second.
+
+    The serialized logs are cached by their `updated_at`, see `DeliveryLogCache`,
+    so the report is not loaded either when the log has not changed since it was
+    last read by anyone.
+    """
     user = request.user
+    updated_at = (
+        user.delivery_logs.filter(id=id).values_list("updated_at", flat=True).first()
+    )
+    if updated_at is None:
+        return Response(status=404, data={"error": f" Message ID: {id} does not exist"})
+
+    headers = _get_validator_headers(updated_at)
+    response = get_conditional_response(request, etag=headers["ETag"])
+    if response is not None:
+        for header, value in headers.items():
+            response.headers[header] = value
+        # Write audit log of the action. The object state is left out, as the
+        # log was not loaded.
+        audit_log_service._commit_to_audit_log(
+            message=create_api_commit_message_from_request(
+                request=request,
+                operation=Operation.READ.value,
+                object_ids=[str(id)],
+            )
+        )
+        return response
+
+    delivery_log_cache = get_delivery_log_cache()
+    data = delivery_log_cache.get(id, headers["ETag"])
+    if data is not None:
+        # Write audit log of the action. The object state is left out, as the
+        # log was not loaded.
+        audit_log_service._commit_to_audit_log(
+            message=create_api_commit_message_from_request(
+                request=request,
+                operation=Operation.READ.value,
+                object_ids=[str(id)],
+            )
+        )
+        return Response(data=data, headers=headers)
+
     try:
-        log = user.delivery_logs.get(id=id)
+        log = user.delivery_logs.prefetch_related(
+            DeliveryLog.prefetch_deliveries()
+        ).get(id=id)
     except DeliveryLog.DoesNotExist:
         return Response(status=404, data={"error": f" Message ID: {id} does not exist"})
 
-    # Write audit log of the action
+    # Write audit log of the action, with the recipients, which are not a part
+    # of the log itself
     audit_log_service._commit_to_audit_log(
         message=create_api_commit_message_from_request(
             request=request,
             operation=Operation.READ.value,
             object_ids=[str(id)],
-            old_objects=[log],
+            old_objects=[log, *log.deliveries.all()],
         )
     )
 
     data = DeliveryLogSerializer(log).data
-    return Response(data=data)
+    headers = _get_validator_headers(log.updated_at)
+    delivery_log_cache.set(id, headers["ETag"], data)
+    return Response(data=data, headers=headers)
+
+
+def _get_validator_headers(updated_at: datetime) -> dict:
+    """
+    Get the `ETag` and `Last-Modified` headers of an object updated at the time.
+    """
+    return {
+        "ETag": quote_etag(str(int(updated_at.timestamp() * 1_000_000))),
+        "Last-Modified": http_date(updated_at.timestamp()),
+    }
 
 
 @api_view(["POST"])
-# TODO: We probably need some basic authentication before writing data
-def delivery_log_webhook(request, id):
+@permission_classes([IsAuthenticated])
+def get_delivery_logs(request):
+    """
+    Get many delivery logs at once.
+
+    Payload example
+    {
+        "ids": ["<delivery log id>", "<delivery log id>"],
+        "statuses_only": true
+    }
+    At most `DELIVERY_LOG_BATCH_MAX_SIZE` ids can be given. With `statuses_only`,
+    only the status of each recipient is returned instead of the whole report.
+
+    The delivery logs are read with one query, and one audit log entry is written
+    for all of them.
+    """
+    ids = request.data.get("ids") if isinstance(request.data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(id, str) for id in ids):
+        return HttpResponseBadRequest("ids must be a list of strings")
+    if len(ids) > settings.DELIVERY_LOG_BATCH_MAX_SIZE:
+        return HttpResponseBadRequest(
+            f"At most {settings.DELIVERY_LOG_BATCH_MAX_SIZE} ids are allowed"
+        )
+    statuses_only = request.data.get("statuses_only", False)
+    if not isinstance(statuses_only, bool):
+        return HttpResponseBadRequest("statuses_only must be a boolean")
+
+    parsed_ids = {}
+    for id in ids:
+        try:
+            parsed_ids[id] = uuid.UUID(id)
+        except ValueError:
+            pass
+
+    # The user is needed too, as the related manager sets it to the logs
+    logs = request.user.delivery_logs.filter(id__in=parsed_ids.values()).only(
+        "id", "user", "status", "report"
+    )
+    # Write one audit log entry of the action. The object states are left out,
+    # as there can be hundreds of them.
+    logs = logs.with_audit_log_and_request(
+        request=request,
+        operation=Operation.READ.value,
+        force_disable_object_states=True,
+    )
+    logs_by_id = {log.pk: log for log in logs}
+    messages = DeliveryLog.get_messages_of_logs(
+        list(logs_by_id.values()), statuses_only=statuses_only
+    )
+
+    results = []
+    not_found = []
+    for id in ids:
+        log = logs_by_id.get(parsed_ids.get(id))
+        if log is None:
+            not_found.append(id)
+        elif statuses_only:
+            results.append(
+                {"id": str(log.pk), "status": log.status, "messages": messages[log.pk]}
+            )
+        else:
+            report = log.report
+            if report is not None:
+                report = {**report, "messages": messages[log.pk]}
+            results.append({"id": str(log.pk), "report": report})
+    return Response({"results": results, "not_found": not_found})
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def list_delivery_logs(request):
+    """
+    List the delivery logs of the user, the newest first.
+
+    Query parameters:
+        status: Only the delivery logs with the dispatch status, e.g. "SENT".
+        delivery_status: Only the delivery logs with the delivery status derived
+            from their messages, see `AggregateDeliveryStatus`.
+        created_after, created_before: Only the delivery logs created in the
+            time range (ISO 8601, the start inclusive and the end exclusive).
+        page_size: The number of delivery logs per page, at most
+            `MESSAGES_MAX_PAGE_SIZE`.
+        cursor: The `next` cursor of the previous page.
+
+    The pages are keyset paginated on `(created_at, id)`, so a deep page is as
+    fast as the first one. One audit log entry is written per page.
+    """
+    logs = request.user.delivery_logs.order_by("-created_at", "-id")
+    try:
+        if status := request.GET.get("status"):
+            if status not in DeliveryStatus.values:
+                raise ValueError(f"Invalid status {status}")
+            logs = logs.filter(status=status)
+        if delivery_status := request.GET.get("delivery_status"):
+            logs = _filter_by_delivery_status(logs, delivery_status)
+        if created_after := request.GET.get("created_after"):
+            logs = logs.filter(
+                created_at__gte=parse_iso_datetime(created_after, "created_after")
+            )
+        if created_before := request.GET.get("created_before"):
+            logs = logs.filter(
+                created_at__lt=parse_iso_datetime(created_before, "created_before")
+            )
+        if cursor := request.GET.get("cursor"):
+            created_at, id = _decode_cursor(cursor)
+            # The redundant created_at__lte lets the database seek the index
+            # to the cursor instead of scanning from the start
+            logs = logs.filter(
+                Q(created_at__lt=created_at) | Q(id__lt=id),
+                created_at__lte=created_at,
+            )
+        page_size = int(request.GET.get("page_size", MESSAGES_PAGE_SIZE))
+        if not 0 < page_size <= MESSAGES_MAX_PAGE_SIZE:
+            raise ValueError(f"page_size must be 1-{MESSAGES_MAX_PAGE_SIZE}")
+    except ValueError as e:
+        return HttpResponseBadRequest(e)
+
+    # One more than the page size, to know whether there is a next page
+    page = list(logs[: page_size + 1])
+    next_url = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        query = request.GET.copy()
+        query["cursor"] = _encode_cursor(page[-1].created_at, page[-1].id)
+        next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+
+    if page:
+        # Write one audit log entry of the page. The object states are left
+        # out, as the page has only the statuses.
+        DeliveryLog.objects.filter(
+            id__in=[log.id for log in page]
+        ).with_audit_log_and_request(
+            request=request,
+            operation=Operation.READ.value,
+            force_disable_object_states=True,
+        )
+
+    return Response(
+        {
+            "results": DeliveryLogListSerializer(page, many=True).data,
+            "next": next_url,
+        }
+    )
+
+
+def _filter_by_delivery_status(logs, delivery_status: str):
+    """
+    Filter the delivery logs by the delivery status derived from the statuses
+    of their messages. The logs which still have their messages in the report
+    JSON are left out.
+
+    Raises:
+        ValueError: If the delivery status is not valid.
+    """
+    messages = MessageDelivery.objects.filter(log=OuterRef("pk"))
+    if delivery_status == AggregateDeliveryStatus.FAILED:
+        return logs.filter(Exists(messages.filter(status="FAILED")))
+    if delivery_status == AggregateDeliveryStatus.PENDING:
+        return logs.filter(Exists(messages.exclude(status__in=FINAL_MESSAGE_STATUSES)))
+    if delivery_status == AggregateDeliveryStatus.DELIVERED:
+        return logs.filter(
+            Exists(messages), ~Exists(messages.exclude(status="DELIVERED"))
+        )
+    raise ValueError(f"Invalid delivery_status {delivery_status}")
+
+
+def _encode_cursor(created_at: datetime, id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor).decode().split("|")
+        return parse_iso_datetime(created_at, "cursor"), uuid.UUID(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+async def delivery_log_events(request, id):
+    """
+    Stream the delivery status changes of the messages of a delivery log as
+    Server-Sent Events:
+
+        event: status
+        data: {"destination": "+358461231231", "status": "DELIVERED"}
+
+    The stream ends with a `done` event once every message has a final status,
+    or after `?wait=` seconds (at most `DELIVERY_LOG_EVENTS_TIMEOUT`).
+
+    This is an async view, so under an ASGI server an open stream does not
+    hold a worker. Under WSGI the events are collected before the response is
+    sent, and the wait is capped to `DELIVERY_LOG_EVENTS_WSGI_TIMEOUT` to stay
+    below the uWSGI harakiri.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=401
+        )
+    request.user = user
+
+    max_timeout = settings.DELIVERY_LOG_EVENTS_TIMEOUT
+    if not isinstance(request, ASGIRequest):
+        max_timeout = min(max_timeout, settings.DELIVERY_LOG_EVENTS_WSGI_TIMEOUT)
+    try:
+        timeout = float(request.GET.get("wait", max_timeout))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid wait")
+    if not math.isfinite(timeout):
+        return HttpResponseBadRequest("Invalid wait")
+    timeout = min(max(timeout, 0), max_timeout)
+
+    if not await user.delivery_logs.filter(id=id).aexists():
+        return JsonResponse({"error": f" Message ID: {id} does not exist"}, status=404)
+
+    # Write audit log of the action
+    await sync_to_async(audit_log_service._commit_to_audit_log)(
+        message=create_api_commit_message_from_request(
+            request=request,
+            operation=Operation.READ.value,
+            object_ids=[str(id)],
+        )
+    )
+
+    response = StreamingHttpResponse(
+        _stream_delivery_log_events(id, timeout), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    # Disable the buffering of the nginx proxies
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _authenticate(request):
+    """
+    Authenticate the request with the authentication classes of the API.
+
+    Returns:
+        The user, or None if the request is not authenticated.
+    """
+    drf_request = Request(
+        request,
+        authenticators=[
+            authentication()
+            for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ],
+    )
+    try:
+        user = drf_request.user
+    except APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+async def _stream_delivery_log_events(log_id, timeout: float) -> AsyncIterator[bytes]:
+    """
+    Stream the status changes of the messages of a delivery log as Server-Sent
+    Events, until every message has a final status or the timeout passes.
+
+    The first events have the current statuses of the messages. The report is
+    only loaded when the `updated_at` of the delivery log has changed. The
+    database connection is released between the checks, so that the waiting
+    streams do not hold a connection each.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    last_write = loop.time()
+    updated_at = None
+    statuses: Dict[str, Optional[str]] = {}
+    while True:
+        current = (
+            await DeliveryLog.objects.filter(id=log_id)
+            .values_list("updated_at", flat=True)
+            .afirst()
+        )
+        if current is None:
+            return
+        if current != updated_at:
+            updated_at = current
+            log = await DeliveryLog.objects.aget(id=log_id)
+            report = await sync_to_async(log.get_report)()
+            for destination, message in ((report or {}).get("messages") or {}).items():
+                status = message.get("status")
+                if destination not in statuses or statuses[destination] != status:
+                    statuses[destination] = status
+                    yield format_event(
+                        "status", {"destination": destination, "status": status}
+                    )
+                    last_write = loop.time()
+            if statuses and all(
+                status in FINAL_MESSAGE_STATUSES for status in statuses.values()
+            ):
+                yield format_event("done", {})
+                return
+
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return
+        if loop.time() - last_write >= EVENTS_KEEPALIVE_INTERVAL:
+            yield b": keepalive\n\n"
+            last_write = loop.time()
+        await sync_to_async(_close_db_connection)()
+        await delivery_log_changes.wait(
+            log_id, min(settings.DELIVERY_LOG_EVENTS_POLL_INTERVAL, remaining)
+        )
+
+
+def _close_db_connection() -> None:
+    # Not within a transaction, e.g. the one of a test
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+def _receive_delivery_report(request, id, report_data) -> bool:
+    """
+    Apply (or buffer) a delivery report sent by Quriiri.
+
+    When the `DELIVERY_REPORTS_BUFFERED` setting is enabled, the report is only
+    stored and the response is returned right away. The stored reports are
+    applied by the `apply_delivery_reports` management command.
+
+    Returns:
+        False if the delivery log does not exist.
+
+    Raises:
+        ValueError: If the report is not valid.
+    """
+    if settings.DELIVERY_REPORTS_BUFFERED:
+        try:
+            if not DeliveryLog.objects.filter(id=id).exists():
+                return False
+        except ValidationError:
+            return False
+        validate_delivery_report(report_data)
+        DeliveryReport.objects.create(log_id=id, data=report_data)
+
+        # Write audit log of the action. The object state is left out, as the
+        # report is applied to the delivery log later.
+        audit_log_service._commit_to_audit_log(
+            message=create_api_commit_message_from_request(
+                request=request,
+                operation=Operation.UPDATE.value,
+                object_ids=[str(id)],
+            )
+        )
+        return True
+
     try:
         log = DeliveryLog.objects.get(id=id)
     except DeliveryLog.DoesNotExist:
+        return False
+    validate_delivery_report(report_data)
+    log = log.get_batch_log_for_destination(report_data["destination"])
+    deliveries = log.update_report(report_data)
+
+    # Write audit log of the action, with the updated messages, which are not
+    # a part of the log itself
+    audit_log_service._commit_to_audit_log(
+        message=create_api_commit_message_from_request(
+            request=request,
+            operation=Operation.UPDATE.value,
+            object_ids=[str(log.pk)],
+            new_objects=[log, *deliveries],
+        )
+    )
+    return True
+
+
+@api_view(["POST"])
+# TODO: We probably need some basic authentication before writing data
+def delivery_log_webhook(request, id):
+    try:
+        log_found = _receive_delivery_report(request, id, request.data)
+    except ValueError as e:
+        return Response(status=400, data={"error": str(e)})
+    if not log_found:
         # Response error so Quriiri will retry to send the report several times
         return Response(status=404, data={"error": f" Message ID: {id} does not exist"})
-    log.update_report(request.data)
+    return Response(status=200)
 
-    # Write audit log of the action
+
+@csrf_exempt
+def delivery_log_webhook_fast(request, id):
+    """
+    Lean version of `delivery_log_webhook` for JSON delivery reports, served by
+    `api.middleware.DeliveryReportWebhookMiddleware` without the rest of the
+    middleware and without the content negotiation and parsing of DRF.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        report_data = loads_json(request.body)
+    except ValueError as e:
+        return JsonResponse({"error": f"Invalid JSON: {e}"}, status=400)
+
+    # The webhook is not authenticated
+    request.user = AnonymousUser()
+    try:
+        log_found = _receive_delivery_report(request, id, report_data)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if not log_found:
+        # Response error so Quriiri will retry to send the report several times
+        return JsonResponse({"error": f" Message ID: {id} does not exist"}, status=404)
+    return HttpResponse(status=200)
+
+
+def _parse_delivery_reports(request) -> list:
+    """
+    Parse a JSON array or an NDJSON stream of delivery reports.
+
+    Raises:
+        ValueError: If the body is not a JSON array or NDJSON.
+    """
+    body = request.body
+    if request.content_type != "application/x-ndjson" and body.lstrip()[:1] == b"[":
+        reports = loads_json(body)
+        if not isinstance(reports, list):
+            raise ValueError("Expected a JSON array")
+        return reports
+    return [loads_json(line) for line in body.splitlines() if line.strip()]
+
+
+def _validate_delivery_report(report_data) -> uuid.UUID:
+    """
+    Returns:
+        The id of the delivery log of the report, i.e. the batch id.
+
+    Raises:
+        ValueError: If the report is not valid.
+    """
+    validate_delivery_report(report_data)
+    try:
+        return uuid.UUID(str(report_data["batchid"]))
+    except KeyError:
+        raise ValueError("Missing batchid")
+    except ValueError:
+        raise ValueError(f"Invalid batchid: {report_data['batchid']}")
+
+
+@csrf_exempt
+@transaction.atomic
+def delivery_reports_webhook(request):
+    """
+    Receive many delivery reports at once, as a JSON array or as NDJSON (one
+    report per line, content type `application/x-ndjson`). The delivery log of
+    each report is found by its `batchid`.
+
+    The reports are applied with one update per delivery log, or buffered when
+    the `DELIVERY_REPORTS_BUFFERED` setting is enabled. The response has the
+    result of every report in the same order:
+
+        {"results": [{"status": "ok"}, {"status": "error", "error": "..."}]}
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        reports = _parse_delivery_reports(request)
+    except ValueError as e:
+        return JsonResponse({"error": f"Invalid JSON: {e}"}, status=400)
+
+    results = [None] * len(reports)
+    valid_reports = []
+    for index, report_data in enumerate(reports):
+        try:
+            log_id = _validate_delivery_report(report_data)
+        except ValueError as e:
+            results[index] = {"status": "error", "error": str(e)}
+        else:
+            valid_reports.append((index, log_id, report_data))
+
+    if settings.DELIVERY_REPORTS_BUFFERED:
+        existing_log_ids = set(
+            DeliveryLog.objects.filter(
+                id__in={log_id for _, log_id, _ in valid_reports}
+            ).values_list("id", flat=True)
+        )
+        found = [log_id in existing_log_ids for _, log_id, _ in valid_reports]
+        DeliveryReport.objects.bulk_create(
+            [
+                DeliveryReport(log_id=log_id, data=report_data)
+                for (_, log_id, report_data), log_found in zip(valid_reports, found)
+                if log_found
+            ],
+            batch_size=1000,
+        )
+    else:
+        found = update_delivery_logs(
+            [(log_id, report_data) for _, log_id, report_data in valid_reports]
+        )
+    for (index, log_id, _), log_found in zip(valid_reports, found):
+        results[index] = (
+            {"status": "ok"}
+            if log_found
+            else {"status": "error", "error": f"Message ID: {log_id} does not exist"}
+        )
+
+    # Write one audit log entry for the whole batch. The object states are left
+    # out, as there can be thousands of them.
+    request.user = AnonymousUser()
     audit_log_service._commit_to_audit_log(
         message=create_api_commit_message_from_request(
             request=request,
             operation=Operation.UPDATE.value,
-            object_ids=[str(id)],
-            new_objects=[log],
+            object_ids=sorted(
+                {
+                    str(log_id)
+                    for (_, log_id, _), log_found in zip(valid_reports, found)
+                    if log_found
+                }
+            ),
         )
     )
 
-    return Response(status=200)
+    return JsonResponse({"results": results})
@@ -0,0 +1,204 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import pytest
+from resilient_logger.utils import get_resilient_logger_config
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.factories import UserFactory
+
+DEFAULT_OUTPUT = ".benchmarks/results.json"
+
+_results_key = pytest.StashKey[list]()
+_regressions_key = pytest.StashKey[list]()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark")
+    group.addoption(
+        "--benchmark-output",
+        default=DEFAULT_OUTPUT,
+        help=f"Path of the JSON results file (default: {DEFAULT_OUTPUT})",
+    )
+    group.addoption(
+        "--benchmark-compare",
+        default=None,
+        help="Path of an earlier JSON results file to compare the results to",
+    )
+    group.addoption(
+        "--benchmark-max-regression",
+        type=float,
+        default=0.25,
+        help="Maximum allowed slowdown of the median compared to the earlier "
+        "results, e.g. 0.25 for 25%% (default: 0.25)",
+    )
+
+
+def pytest_configure(config):
+    config.stash[_results_key] = []
+
+
+class Benchmark:
+    """
+    Times a function over several rounds and records the statistics.
+    """
+
+    def __init__(self, name, results):
+        self.name = name
+        self.results = results
+        self.extra_info = {}
+
+    def __call__(self, func, *args, rounds=10, warmup_rounds=1, setup=None, **kwargs):
+        """
+        Call `func(*args, **kwargs)` `warmup_rounds + rounds` times and record
+        the durations of the last `rounds` calls.
+
+        :param setup: Function called before every round, outside the timing
+        :return: The return value of the last call
+        """
+        durations = []
+        result = None
+        for i in range(warmup_rounds + rounds):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            duration = time.perf_counter() - start
+            if i >= warmup_rounds:
+                durations.append(duration)
+
+        self.results.append(
+            {
+                "name": self.name,
+                "extra_info": self.extra_info,
+                "stats": {
+                    "rounds": rounds,
+                    "min": min(durations),
+                    "max": max(durations),
+                    "mean": statistics.mean(durations),
+                    "median": statistics.median(durations),
+                    "stddev": statistics.stdev(durations) if rounds > 1 else 0.0,
+                    "ops": 1 / statistics.mean(durations),
+                },
+            }
+        )
+        return result
+
+
+@pytest.fixture
+def benchmark(request):
+    return Benchmark(request.node.nodeid, request.config.stash[_results_key])
+
+
+@pytest.fixture(autouse=True)
+def autouse_db(db):
+    """Rename the db fixture"""
+
+
+@pytest.fixture(autouse=True)
+def setup_resilient_logger(settings):
+    settings.RESILIENT_LOGGER = {
+        **settings.RESILIENT_LOGGER,
+        "environment": "test",
+    }
+    get_resilient_logger_config.cache_clear()
+    yield
+    get_resilient_logger_config.cache_clear()
+
+
+@pytest.fixture
+def token_api_client():
+    user = UserFactory()
+    token, _ = Token.objects.get_or_create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+    client.user = user
+    return client
+
+
+def _get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _find_regressions(results, baseline, max_regression):
+    baseline_medians = {
+        result["name"]: result["stats"]["median"] for result in baseline["benchmarks"]
+    }
+    regressions = []
+    for result in results:
+        baseline_median = baseline_medians.get(result["name"])
+        if not baseline_median:
+            continue
+        change = result["stats"]["median"] / baseline_median - 1
+        if change > max_regression:
+            regressions.append((result["name"], change))
+    return regressions
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    results = config.stash[_results_key]
+    if not results:
+        return
+
+    output = config.getoption("--benchmark-output")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "datetime": datetime.now(timezone.utc).isoformat(),
+                "commit": _get_commit(),
+                "machine_info": {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "processor": platform.processor(),
+                    "cpu_count": os.cpu_count(),
+                },
+                "benchmarks": results,
+            },
+            f,
+            indent=2,
+        )
+
+    compare = config.getoption("--benchmark-compare")
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+        regressions = _find_regressions(
+            results, baseline, config.getoption("--benchmark-max-regression")
+        )
+        config.stash[_regressions_key] = regressions
+        if regressions:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash[_results_key]
+    if not results:
+        return
+    terminalreporter.section("benchmarks")
+    for result in results:
+        stats = result["stats"]
+        terminalreporter.write_line(
+            f"{result['name']}: median {stats['median'] * 1000:.2f} ms, "
+            f"min {stats['min'] * 1000:.2f} ms, rounds {stats['rounds']}"
+        )
+    terminalreporter.write_line(
+        f"Results saved to {config.getoption('--benchmark-output')}"
+    )
+    for name, change in config.stash.get(_regressions_key, []):
+        terminalreporter.write_line(f"REGRESSION {name}: {change:+.0%}", red=True)
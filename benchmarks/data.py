@@ -0,0 +1,35 @@
+import random
+
+from api.utils import create_report
+
+
+def create_destinations(count, seed=0):
+    """Create unique valid Finnish mobile numbers in international format"""
+    rng = random.Random(seed)
+    return [f"+35840{n:07}" for n in rng.sample(range(10**7), count)]
+
+
+def create_mixed_destinations(count, seed=0):
+    """
+    Create a list of phone numbers in different formats where about a third of
+    the numbers are invalid.
+    """
+    rng = random.Random(seed)
+    formats = [
+        lambda n: f"+35840{n:07}",
+        lambda n: f"040{n:07}",
+        lambda n: f"040 {n:07}",
+        lambda n: f"+35891{n:07}",
+        # Invalid numbers
+        lambda n: f"abc{n}",
+        lambda n: f"{n % 1000}",
+        lambda n: "",
+    ]
+    weights = [2, 2, 1, 1, 1, 1, 1]
+    return [
+        rng.choices(formats, weights)[0](rng.randrange(10**7)) for _ in range(count)
+    ]
+
+
+def create_sent_report(count):
+    return create_report(create_destinations(count), "CREATED")
@@ -0,0 +1,30 @@
+import pytest
+
+from api.factories import DeliveryLogFactory
+from audit_log.enums import StoreObjectState
+from audit_log.settings import audit_logging_settings
+from audit_log.utils import create_object_states
+from benchmarks.data import create_sent_report
+from users.factories import UserFactory
+
+
+@pytest.mark.parametrize("store_object_state", list(StoreObjectState))
+def test_create_object_states(benchmark, monkeypatch, store_object_state):
+    monkeypatch.setattr(
+        audit_logging_settings, "STORE_OBJECT_STATE", store_object_state
+    )
+    user = UserFactory()
+    old_objects = DeliveryLogFactory.create_batch(
+        100, user=user, report=create_sent_report(10)
+    )
+    new_objects = DeliveryLogFactory.create_batch(
+        100, user=user, report=create_sent_report(10)
+    )
+    benchmark.extra_info["objects"] = 100
+
+    benchmark(
+        create_object_states,
+        new_objects=new_objects,
+        old_objects=old_objects,
+        rounds=10,
+    )
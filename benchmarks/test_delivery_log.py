@@ -0,0 +1,83 @@
+import pytest
+from django.urls import reverse
+
+from api.factories import DeliveryLogFactory
+from api.models import DeliveryLog
+from api.serializers import DeliveryLogSerializer
+from api.utils import get_delivery_log_cache
+from api.views import _encode_cursor
+from benchmarks.data import create_sent_report
+
+
+def test_update_report(benchmark):
+    report = create_sent_report(10000)
+    log = DeliveryLogFactory()
+    log.save_report(report)
+    destination = list(report["messages"])[5000]
+    webhook_data = {
+        "sender": "hel.fi",
+        "destination": destination,
+        "status": "DELIVERED",
+        "statustime": "2020-07-21T09:18:00Z",
+        "smscount": "1",
+        "billingref": "Palvelutarjotin",
+    }
+
+    benchmark.extra_info["messages"] = 10000
+    benchmark(log.update_report, webhook_data, rounds=10)
+
+    assert log.get_report()["messages"][destination]["status"] == "DELIVERED"
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["uncached", "cached"])
+@pytest.mark.parametrize("message_count", [100, 10000])
+def test_get_delivery_log(benchmark, token_api_client, message_count, cached):
+    log = DeliveryLogFactory(user=token_api_client.user)
+    log.save_report(create_sent_report(message_count))
+    benchmark.extra_info["messages"] = message_count
+    delivery_log_cache = get_delivery_log_cache()
+    delivery_log_cache.clear()
+
+    response = benchmark(
+        token_api_client.get,
+        reverse("get_message", kwargs={"id": log.id}),
+        rounds=10,
+        setup=None if cached else delivery_log_cache.clear,
+    )
+
+    assert response.status_code == 200
+    assert len(response.json()["report"]["messages"]) == message_count
+
+
+def test_delivery_log_serializer(benchmark):
+    log = DeliveryLogFactory()
+    log.save_report(create_sent_report(10000))
+    benchmark.extra_info["messages"] = 10000
+
+    data = benchmark(lambda: DeliveryLogSerializer(log).data, rounds=20)
+
+    assert len(data["report"]["messages"]) == 10000
+
+
+@pytest.mark.parametrize("page", ["first", "deep"])
+def test_list_delivery_logs(benchmark, token_api_client, page):
+    """
+    A page of 100 delivery logs from the start and from the end of 20 000
+    delivery logs.
+    """
+    DeliveryLog.objects.bulk_create(
+        DeliveryLogFactory.build_batch(20000, user=token_api_client.user),
+        batch_size=1000,
+    )
+    params = {}
+    if page == "deep":
+        log = DeliveryLog.objects.order_by("-created_at", "-id")[19800]
+        params["cursor"] = _encode_cursor(log.created_at, log.id)
+    benchmark.extra_info["delivery_logs"] = 20000
+
+    response = benchmark(
+        token_api_client.get, reverse("list_messages"), params, rounds=10
+    )
+
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 100
@@ -0,0 +1,45 @@
+import pytest
+from django.urls import reverse
+
+import api.views
+from benchmarks.data import create_destinations
+from quriiri.fake import FakeQuriiri, FakeSender
+
+
+@pytest.fixture
+def fake_sms_sender(monkeypatch, settings):
+    sms_sender = FakeSender(
+        FakeQuriiri(delivery_reports=False),
+        chunk_size=settings.QURIIRI_CHUNK_SIZE,
+        max_workers=settings.QURIIRI_MAX_WORKERS,
+    )
+    monkeypatch.setattr(api.views, "sms_sender", sms_sender)
+    return sms_sender
+
+
+@pytest.mark.parametrize(
+    "recipient_count,rounds", [(1, 50), (100, 20), (1000, 5), (10000, 3)]
+)
+def test_send_message(
+    benchmark, token_api_client, fake_sms_sender, recipient_count, rounds
+):
+    payload = {
+        "sender": "Hel.fi",
+        "to": [
+            {"destination": destination, "format": "MOBILE"}
+            for destination in create_destinations(recipient_count)
+        ],
+        "text": "SMS message",
+    }
+    benchmark.extra_info["recipients"] = recipient_count
+
+    response = benchmark(
+        token_api_client.post,
+        reverse("send_message"),
+        payload,
+        format="json",
+        rounds=rounds,
+    )
+
+    assert response.status_code == 200
+    assert len(response.data["report"]["messages"]) == recipient_count
@@ -0,0 +1,81 @@
+import pytest
+
+from api.utils import (
+    _parse_destination,
+    _parse_destination_with_phonenumbers,
+    DestinationCache,
+    filter_valid_destinations,
+    get_destination_parse_pool,
+    parse_destinations,
+)
+from benchmarks.data import create_mixed_destinations
+
+
+@pytest.fixture
+def destination_cache(monkeypatch):
+    destination_cache = DestinationCache()
+    monkeypatch.setattr("api.utils.get_destination_cache", lambda: destination_cache)
+    return destination_cache
+
+
+@pytest.mark.parametrize("convert_to_international_format", [False, True])
+@pytest.mark.parametrize("cache_state", ["cold", "warm"])
+def test_filter_valid_destinations(
+    benchmark, destination_cache, cache_state, convert_to_international_format
+):
+    """
+    The same recipient list sent over and over again, with an empty (cold) or a
+    filled (warm) destination cache.
+    """
+    destinations = create_mixed_destinations(10000)
+    benchmark.extra_info["destinations"] = len(destinations)
+
+    valid_destinations = benchmark(
+        filter_valid_destinations,
+        destinations,
+        convert_to_international_format=convert_to_international_format,
+        rounds=3,
+        setup=destination_cache.clear if cache_state == "cold" else None,
+    )
+
+    benchmark.extra_info.update(destination_cache.stats())
+    assert 0 < len(valid_destinations) < len(destinations)
+
+
+@pytest.mark.parametrize(
+    "parse", [_parse_destination, _parse_destination_with_phonenumbers]
+)
+def test_parse_destination(benchmark, parse):
+    """
+    Finnish mobile numbers parsed with and without the fast path, without the
+    destination cache.
+    """
+    destinations = [f"040{number:07d}" for number in range(10000)]
+    benchmark.extra_info["destinations"] = len(destinations)
+
+    results = benchmark(lambda: [parse(destination) for destination in destinations])
+
+    assert all(international for international, _ in results)
+
+
+@pytest.mark.parametrize("workers", [0, 1, 2, 4])
+def test_parse_destinations(benchmark, settings, workers):
+    """
+    A huge list of mixed phone numbers parsed serially (0) and in process pools
+    of different sizes, without the destination cache.
+    """
+    settings.DESTINATION_PARSE_POOL_THRESHOLD = 1 if workers else 0
+    settings.DESTINATION_PARSE_POOL_WORKERS = workers
+    get_destination_parse_pool.cache_clear()
+    destinations = create_mixed_destinations(50000)
+    benchmark.extra_info["destinations"] = len(destinations)
+    benchmark.extra_info["workers"] = workers
+
+    try:
+        results = benchmark(parse_destinations, destinations, rounds=3)
+    finally:
+        if workers:
+            get_destination_parse_pool().shutdown()
+        get_destination_parse_pool.cache_clear()
+
+    assert len(results) == len(destinations)
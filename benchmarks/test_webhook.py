@@ -0,0 +1,36 @@
+import json
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+
+from api.factories import DeliveryLogFactory
+from benchmarks.data import create_sent_report
+
+
+@pytest.mark.parametrize("fast_path", [False, True], ids=["drf", "fast-path"])
+@pytest.mark.parametrize("buffered", [False, True], ids=["direct", "buffered"])
+def test_delivery_log_webhook(benchmark, settings, fast_path, buffered):
+    settings.DELIVERY_REPORT_WEBHOOK_FAST_PATH = fast_path
+    settings.DELIVERY_REPORTS_BUFFERED = buffered
+    report = create_sent_report(1000)
+    log = DeliveryLogFactory()
+    log.save_report(report)
+    url = reverse("delivery_log_webhook", kwargs={"id": str(log.id)})
+    body = json.dumps(
+        {
+            "sender": "hel.fi",
+            "destination": list(report["messages"])[500],
+            "status": "DELIVERED",
+            "statustime": "2020-07-21T09:18:00Z",
+            "smscount": "1",
+            "billingref": "Palvelutarjotin",
+        }
+    )
+    client = Client()
+
+    response = benchmark(
+        client.post, url, data=body, content_type="application/json", rounds=200
+    )
+
+    assert response.status_code == 200
@@ -30,6 +30,16 @@ def token_api_client():
     return _create_api_client_with_user(UserFactory())
 
 
+@pytest.fixture
+def user():
+    return UserFactory()
+
+
+@pytest.fixture
+def user_api_client(user):
+    return _create_api_client_with_user(user)
+
+
 @pytest.fixture
 def delivery_log():
     return DeliveryLogFactory()
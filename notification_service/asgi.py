@@ -0,0 +1,18 @@
+"""
+ASGI config for notification_service project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server when the delivery status event streams are used, so
+that the open streams do not hold a worker each.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "notification_service.settings")
+
+application = get_asgi_application()
@@ -23,6 +23,9 @@ else:
 
 env = environ.Env(
     ALLOWED_HOSTS=(list, []),
+    BULK_SEND_CHUNK_SIZE=(int, 500),
+    BULK_SEND_MAX_ITEM_SIZE=(int, 64 * 1024),
+    BULK_SEND_MAX_SIZE=(int, 1024 * 1024),
     CACHE_URL=(str, "locmemcache://"),
     CORS_ALLOW_ALL_ORIGINS=(bool, False),
     CORS_ALLOWED_ORIGINS=(list, []),
@@ -30,13 +33,57 @@ env = environ.Env(
     DATABASE_PASSWORD=(str, ""),
     DEBUG=(bool, False),
     DEFAULT_FROM_EMAIL=(str, "no-reply@hel.ninja"),
+    DELIVERY_LOG_BATCH_MAX_SIZE=(int, 500),
+    DELIVERY_LOG_CACHE_ALIAS=(str, ""),
+    DELIVERY_LOG_CACHE_SIZE=(int, 1000),
+    DELIVERY_LOG_CACHE_MAX_MESSAGES=(int, 20000),
+    DELIVERY_LOG_CACHE_TTL=(int, 60 * 60),
+    DELIVERY_LOG_EVENTS_POLL_INTERVAL=(float, 5.0),
+    DELIVERY_LOG_EVENTS_TIMEOUT=(int, 300),
+    DELIVERY_LOG_EVENTS_WSGI_TIMEOUT=(int, 15),
+    DELIVERY_REPORT_WEBHOOK_FAST_PATH=(bool, False),
+    DELIVERY_REPORTS_BUFFERED=(bool, False),
+    DESTINATION_CACHE_ALIAS=(str, ""),
+    DESTINATION_CACHE_SIZE=(int, 100000),
+    DESTINATION_CACHE_TTL=(int, 24 * 60 * 60),
+    DESTINATION_PARSE_POOL_THRESHOLD=(int, 0),
+    DESTINATION_PARSE_POOL_WORKERS=(int, 0),
+    FAKE_QURIIRI_DELIVERY_FAILURE_RATE=(float, 0.0),
+    FAKE_QURIIRI_DELIVERY_REPORT_DELAY=(float, 1.0),
+    FAKE_QURIIRI_DELIVERY_REPORTS_PER_SECOND=(int, 0),
+    FAKE_QURIIRI_ERROR_RATE=(float, 0.0),
+    FAKE_QURIIRI_FAILURE_RATE=(float, 0.0),
+    FAKE_QURIIRI_LATENCY=(float, 0.0),
     HELUSERS_PASSWORD_LOGIN_DISABLED=(bool, False),
+    IDEMPOTENCY_KEY_CACHE=(str, "default"),
+    IDEMPOTENCY_KEY_LOCK_TIMEOUT=(int, 60),
+    IDEMPOTENCY_KEY_TTL=(int, 24 * 60 * 60),
+    IDEMPOTENCY_KEY_WAIT=(float, 10.0),
     MEDIA_ROOT=(environ.Path(), environ.Path(checkout_dir("var"))("media")),
     MEDIA_URL=(str, "/media/"),
     QURIIRI_API_KEY=(str, ""),
     QURIIRI_API_URL=(str, "https://api.quriiri.fi/v1/"),
+    QURIIRI_BACKOFF_FACTOR=(float, 0.5),
+    QURIIRI_BATCH_DELIVERY_REPORTS=(bool, False),
+    QURIIRI_CHUNK_SIZE=(int, 1000),
+    QURIIRI_CIRCUIT_BREAKER_MIN_CALLS=(int, 20),
+    QURIIRI_CIRCUIT_BREAKER_RESET_TIMEOUT=(float, 30.0),
+    QURIIRI_CIRCUIT_BREAKER_THRESHOLD=(float, 0.5),
+    QURIIRI_COALESCE_WINDOW=(float, 0.0),
+    QURIIRI_CONNECT_TIMEOUT=(float, 3.05),
+    QURIIRI_DEADLINE=(float, 15.0),
+    QURIIRI_DELIVERY_REPORT_TYPE=(str, "json"),
+    QURIIRI_MAX_WORKERS=(int, 4),
+    QURIIRI_MESSAGES_PER_SECOND=(int, 0),
+    QURIIRI_RATE_LIMIT_CACHE=(str, "default"),
+    QURIIRI_RATE_LIMIT_MAX_WAIT=(float, 5.0),
+    QURIIRI_READ_TIMEOUT=(float, 10.0),
+    QURIIRI_REQUESTS_PER_SECOND=(int, 0),
+    QURIIRI_RETRIES=(int, 2),
     QURIIRI_REPORT_URL=(str, ""),
     SECRET_KEY=(str, ""),
+    SMS_SEND_ASYNC=(bool, False),
+    SMS_SENDER_BACKEND=(str, "api.services.create_quriiri_sender"),
     SENTRY_DSN=(str, ""),
     SENTRY_ENVIRONMENT=(str, "local"),
     SENTRY_PROFILE_SESSION_SAMPLE_RATE=(float, None),
@@ -163,6 +210,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # Must stay before the other middleware it skips
+    "api.middleware.DeliveryReportWebhookMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "logger_extra.middleware.XRequestIdMiddleware",
@@ -261,6 +310,123 @@ AXES_COOLOFF_TIME = 1  # hour after locked out, user will be able to attempt log
 QURIIRI_API_KEY = env.str("QURIIRI_API_KEY")
 QURIIRI_API_URL = env.str("QURIIRI_API_URL")
 QURIIRI_REPORT_URL = env.str("QURIIRI_REPORT_URL")
+# Large destination lists are split into chunks of this size,
+# which are sent concurrently with at most QURIIRI_MAX_WORKERS threads.
+QURIIRI_CHUNK_SIZE = env.int("QURIIRI_CHUNK_SIZE")
+QURIIRI_MAX_WORKERS = env.int("QURIIRI_MAX_WORKERS")
+# Timeouts (in seconds) of the Quriiri requests. The deadline limits the total time
+# of one request including the retries, and should stay below the uWSGI harakiri.
+QURIIRI_CONNECT_TIMEOUT = env.float("QURIIRI_CONNECT_TIMEOUT")
+QURIIRI_READ_TIMEOUT = env.float("QURIIRI_READ_TIMEOUT")
+QURIIRI_DEADLINE = env.float("QURIIRI_DEADLINE")
+# Only the failures where the message was certainly not accepted are retried
+QURIIRI_RETRIES = env.int("QURIIRI_RETRIES")
+QURIIRI_BACKOFF_FACTOR = env.float("QURIIRI_BACKOFF_FACTOR")
+# The circuit breaker opens when the share of failed requests reaches the threshold.
+# Set the threshold to 0 to disable the circuit breaker.
+QURIIRI_CIRCUIT_BREAKER_THRESHOLD = env.float("QURIIRI_CIRCUIT_BREAKER_THRESHOLD")
+QURIIRI_CIRCUIT_BREAKER_MIN_CALLS = env.int("QURIIRI_CIRCUIT_BREAKER_MIN_CALLS")
+QURIIRI_CIRCUIT_BREAKER_RESET_TIMEOUT = env.float(
+    "QURIIRI_CIRCUIT_BREAKER_RESET_TIMEOUT"
+)
+# Rate limits shared by all the processes through the cache. 0 means unlimited.
+# A send waits at most QURIIRI_RATE_LIMIT_MAX_WAIT seconds for its turn. The wait
+# counts against QURIIRI_DEADLINE and leaves the connect and read timeouts for the
+# request, so a send stays below the uWSGI harakiri.
+QURIIRI_MESSAGES_PER_SECOND = env.int("QURIIRI_MESSAGES_PER_SECOND")
+QURIIRI_REQUESTS_PER_SECOND = env.int("QURIIRI_REQUESTS_PER_SECOND")
+QURIIRI_RATE_LIMIT_MAX_WAIT = env.float("QURIIRI_RATE_LIMIT_MAX_WAIT")
+QURIIRI_RATE_LIMIT_CACHE = env.str("QURIIRI_RATE_LIMIT_CACHE")
+# Identical messages sent within this many seconds are merged into one request.
+# 0 disables the merging.
+QURIIRI_COALESCE_WINDOW = env.float("QURIIRI_COALESCE_WINDOW")
+# Ask for the delivery reports to the batch webhook, which accepts many reports
+# per request. The batch id of the message tells the delivery log of a report.
+QURIIRI_BATCH_DELIVERY_REPORTS = env.bool("QURIIRI_BATCH_DELIVERY_REPORTS")
+QURIIRI_DELIVERY_REPORT_TYPE = env.str("QURIIRI_DELIVERY_REPORT_TYPE")
+
+# Queue the messages in the database instead of sending them during the request.
+# The queue is drained with the `send_queued_messages` management command.
+SMS_SEND_ASYNC = env.bool("SMS_SEND_ASYNC")
+
+# The validated and converted phone numbers are memoised in a per-process LRU of
+# DESTINATION_CACHE_SIZE numbers (0 disables it). With DESTINATION_CACHE_ALIAS the
+# numbers missing from the LRU are looked up in that Django cache too, so that the
+# processes share them. They are kept there for DESTINATION_CACHE_TTL seconds.
+DESTINATION_CACHE_SIZE = env.int("DESTINATION_CACHE_SIZE")
+DESTINATION_CACHE_ALIAS = env.str("DESTINATION_CACHE_ALIAS")
+DESTINATION_CACHE_TTL = env.int("DESTINATION_CACHE_TTL")
+
+# When at least DESTINATION_PARSE_POOL_THRESHOLD phone numbers are missing from the
+# cache (0, the default, disables it), they are validated in a pool of
+# DESTINATION_PARSE_POOL_WORKERS processes (0 uses the number of CPUs available to
+# the process, at most 4). The pool is started in every uWSGI worker which gets a
+# huge list, so size it with the number of uWSGI processes in mind.
+DESTINATION_PARSE_POOL_THRESHOLD = env.int("DESTINATION_PARSE_POOL_THRESHOLD")
+DESTINATION_PARSE_POOL_WORKERS = env.int("DESTINATION_PARSE_POOL_WORKERS")
+
+# The bulk send endpoint handles BULK_SEND_CHUNK_SIZE messages at a time, and an
+# NDJSON line may be at most BULK_SEND_MAX_ITEM_SIZE bytes long. The body may be at
+# most BULK_SEND_MAX_SIZE bytes long (0 means unlimited), as the whole request has
+# to be handled within the uWSGI harakiri.
+BULK_SEND_CHUNK_SIZE = env.int("BULK_SEND_CHUNK_SIZE")
+BULK_SEND_MAX_ITEM_SIZE = env.int("BULK_SEND_MAX_ITEM_SIZE")
+BULK_SEND_MAX_SIZE = env.int("BULK_SEND_MAX_SIZE")
+
+# The responses of the send requests with an Idempotency-Key header are kept in the
+# cache for IDEMPOTENCY_KEY_TTL seconds. A concurrent request with the same key waits
+# at most IDEMPOTENCY_KEY_WAIT seconds for the response of the first one. Use a cache
+# shared by all the workers, so that the duplicates are caught between them too.
+IDEMPOTENCY_KEY_CACHE = env.str("IDEMPOTENCY_KEY_CACHE")
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL")
+IDEMPOTENCY_KEY_LOCK_TIMEOUT = env.int("IDEMPOTENCY_KEY_LOCK_TIMEOUT")
+IDEMPOTENCY_KEY_WAIT = env.float("IDEMPOTENCY_KEY_WAIT")
+
+# Store the delivery reports received by the webhook and apply them in batches.
+# The reports are applied with the `apply_delivery_reports` management command.
+DELIVERY_REPORTS_BUFFERED = env.bool("DELIVERY_REPORTS_BUFFERED")
+# Serve the JSON delivery reports without the middleware and DRF, see
+# `api.middleware.DeliveryReportWebhookMiddleware`.
+DELIVERY_REPORT_WEBHOOK_FAST_PATH = env.bool("DELIVERY_REPORT_WEBHOOK_FAST_PATH")
+
+# The statuses of at most DELIVERY_LOG_BATCH_MAX_SIZE delivery logs can be
+# looked up with one request.
+DELIVERY_LOG_BATCH_MAX_SIZE = env.int("DELIVERY_LOG_BATCH_MAX_SIZE")
+
+# The serialized delivery logs are cached by their version in a per-process LRU of
+# DELIVERY_LOG_CACHE_SIZE logs (0 disables it), with at most
+# DELIVERY_LOG_CACHE_MAX_MESSAGES messages in total (0 for no limit) to stay well
+# below the uWSGI reload-on-rss. With DELIVERY_LOG_CACHE_ALIAS the
+# logs missing from the LRU are looked up in that Django cache too, so that the
+# processes share them. They are kept there for DELIVERY_LOG_CACHE_TTL seconds.
+DELIVERY_LOG_CACHE_SIZE = env.int("DELIVERY_LOG_CACHE_SIZE")
+DELIVERY_LOG_CACHE_MAX_MESSAGES = env.int("DELIVERY_LOG_CACHE_MAX_MESSAGES")
+DELIVERY_LOG_CACHE_ALIAS = env.str("DELIVERY_LOG_CACHE_ALIAS")
+DELIVERY_LOG_CACHE_TTL = env.int("DELIVERY_LOG_CACHE_TTL")
+
+# The delivery status event streams are kept open for at most
+# DELIVERY_LOG_EVENTS_TIMEOUT seconds. They are woken up by the delivery reports
+# received by the same process, and check the delivery log every
+# DELIVERY_LOG_EVENTS_POLL_INTERVAL seconds for the reports received by the others.
+# Under WSGI the events are sent only when the stream ends, so there the streams
+# are kept open for at most DELIVERY_LOG_EVENTS_WSGI_TIMEOUT seconds, below the
+# uWSGI harakiri.
+DELIVERY_LOG_EVENTS_TIMEOUT = env.int("DELIVERY_LOG_EVENTS_TIMEOUT")
+DELIVERY_LOG_EVENTS_WSGI_TIMEOUT = env.int("DELIVERY_LOG_EVENTS_WSGI_TIMEOUT")
+DELIVERY_LOG_EVENTS_POLL_INTERVAL = env.float("DELIVERY_LOG_EVENTS_POLL_INTERVAL")
+
+# Dotted path to the function creating the SMS sender. Use
+# "api.services.create_fake_sender" to send the messages to an in-process fake
+# Quriiri, e.g. for load testing. The fake is configured with the settings below.
+SMS_SENDER_BACKEND = env.str("SMS_SENDER_BACKEND")
+FAKE_QURIIRI_LATENCY = env.float("FAKE_QURIIRI_LATENCY")
+FAKE_QURIIRI_ERROR_RATE = env.float("FAKE_QURIIRI_ERROR_RATE")
+FAKE_QURIIRI_FAILURE_RATE = env.float("FAKE_QURIIRI_FAILURE_RATE")
+FAKE_QURIIRI_DELIVERY_REPORT_DELAY = env.float("FAKE_QURIIRI_DELIVERY_REPORT_DELAY")
+FAKE_QURIIRI_DELIVERY_REPORTS_PER_SECOND = env.int(
+    "FAKE_QURIIRI_DELIVERY_REPORTS_PER_SECOND"
+)
+FAKE_QURIIRI_DELIVERY_FAILURE_RATE = env.float("FAKE_QURIIRI_DELIVERY_FAILURE_RATE")
 
 LOGGING = {
     "version": 1,
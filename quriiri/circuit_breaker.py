@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """
+    Error rate based circuit breaker.
+
+    The breaker keeps the outcomes of the latest `window_size` calls. When at
+    least `min_calls` outcomes have been recorded and the share of failures
+    reaches `failure_threshold`, the breaker opens and `allow_request` returns
+    False, so the callers fail fast instead of waiting for a broken provider.
+    After `reset_timeout` seconds the breaker lets a single trial call through
+    (half-open state). A successful trial closes the breaker, a failed one
+    opens it again.
+
+    The breaker is thread safe, so a single instance can be shared by every
+    sender in the process.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold=0.5,
+        min_calls=20,
+        window_size=100,
+        reset_timeout=30.0,
+        clock=time.monotonic,
+    ):
+        """
+        :param failure_threshold: Share of failed calls (0..1) that opens the breaker
+        :param min_calls: Minimum number of recorded calls before the breaker can open
+        :param window_size: Number of latest calls used to calculate the error rate
+        :param reset_timeout: Seconds to wait before a trial call is let through
+        :param clock: Function returning the current time in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._outcomes = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._reset_timeout_passed():
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        """
+        Return True if a call may be made to the provider.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and self._reset_timeout_passed():
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._close()
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            if self._state == self.CLOSED and self._error_rate_exceeded():
+                self._open()
+
+    def reset(self):
+        with self._lock:
+            self._close()
+
+    def _error_rate_exceeded(self):
+        if len(self._outcomes) < self.min_calls:
+            return False
+        failures = self._outcomes.count(False)
+        return failures / len(self._outcomes) >= self.failure_threshold
+
+    def _reset_timeout_passed(self):
+        return self._clock() - self._opened_at >= self.reset_timeout
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._trial_in_progress = False
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._outcomes.clear()
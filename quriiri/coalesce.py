@@ -0,0 +1,138 @@
+import threading
+import time
+
+# The options which may differ between the merged requests. The merged request
+# uses the values of the first request in the batch.
+PER_REQUEST_OPTIONS = ("drurl", "batchid")
+
+
+def split_report(report, destinations, batchid=None):
+    """
+    Split the report of a merged request into the report of the given destinations.
+
+    :param report: The report of the merged request
+    :param destinations: The destinations of one of the merged messages
+    :param batchid: The batch id to add to the report, if any
+    """
+    split = {
+        key: list(value) if isinstance(value, list) else value
+        for key, value in report.items()
+        if key != "messages"
+    }
+    messages = report.get("messages", {})
+    split["messages"] = {
+        destination: messages[destination]
+        for destination in destinations
+        if destination in messages
+    }
+    if batchid:
+        split["batchid"] = batchid
+    return split
+
+
+class _Batch:
+    def __init__(self, sender, text, optional):
+        self.sender = sender
+        self.text = text
+        self.optional = optional
+        self.destinations = []
+        self.request_count = 0
+        self.closed = False
+        self.done = threading.Event()
+        self.report = None
+        self.exception = None
+
+
+class CoalescingSender:
+    """
+    Merges identical sends that arrive within a short window into one request.
+
+    The first call with a given sender, text and options waits `window` seconds
+    for other calls with the same message, and then sends the message to the
+    destinations of all the calls with a single `send_sms` call of the wrapped
+    sender. The response is split back by destination, so every caller gets a
+    report of its own destinations only.
+
+    The delivery reports of the merged request are sent to the `drurl` of the
+    first call. When more than one call was merged, the split reports contain
+    the `batchid` of the first call, so the delivery reports can be routed to
+    the right caller.
+    """
+
+    def __init__(self, sender, window=0.005, max_destinations=1000):
+        """
+        :param sender: The wrapped sender, e.g. `quriiri.send.Sender`
+        :param window: Seconds to wait for identical sends
+        :param max_destinations: Maximum number of destinations in a merged request
+        """
+        self.sender = sender
+        self.window = window
+        self.max_destinations = max_destinations
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.sender, name)
+
+    @staticmethod
+    def _get_key(sender, text, optional):
+        options = tuple(
+            sorted(
+                (key, value)
+                for key, value in optional.items()
+                if key not in PER_REQUEST_OPTIONS
+            )
+        )
+        return sender, text, options
+
+    def send_sms(self, sender, destination, text, **optional):
+        destinations = [destination] if isinstance(destination, str) else destination
+        key = self._get_key(sender, text, optional)
+
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is not None and not self._can_join(batch, destinations):
+                batch = None
+            is_leader = batch is None
+            if is_leader:
+                batch = _Batch(sender, text, optional)
+                self._batches[key] = batch
+            batch.destinations.extend(destinations)
+            batch.request_count += 1
+
+        if is_leader:
+            self._send_batch(key, batch)
+        else:
+            batch.done.wait()
+
+        if batch.exception is not None:
+            raise batch.exception
+        return self._split_report(batch, destinations)
+
+    def _can_join(self, batch, destinations):
+        if batch.closed:
+            return False
+        if len(batch.destinations) + len(destinations) > self.max_destinations:
+            return False
+        # A shared destination could not be told apart in the response
+        return not set(batch.destinations).intersection(destinations)
+
+    def _send_batch(self, key, batch):
+        time.sleep(self.window)
+        with self._lock:
+            batch.closed = True
+            if self._batches.get(key) is batch:
+                del self._batches[key]
+        try:
+            batch.report = self.sender.send_sms(
+                batch.sender, batch.destinations, batch.text, **batch.optional
+            )
+        except Exception as e:
+            batch.exception = e
+        finally:
+            batch.done.set()
+
+    @staticmethod
+    def _split_report(batch, destinations):
+        batchid = batch.optional.get("batchid") if batch.request_count > 1 else None
+        return split_report(batch.report, destinations, batchid)
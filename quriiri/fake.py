@@ -0,0 +1,237 @@
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from quriiri.send import Sender
+
+
+class FakeQuriiri:
+    """
+    Mimics the Quriiri SMS API for local development and load testing.
+
+    Every request is delayed by `latency` (+- `latency_jitter`) seconds. A share
+    of the requests (`error_rate`) fails as a whole with `error_status`, and a
+    share of the destinations of the accepted requests (`failure_rate`) is
+    rejected with a per-destination error, like Quriiri does for invalid numbers.
+
+    The accepted messages get a delivery report, which is posted to the `drurl`
+    of the request `delivery_report_delay` seconds after the message was sent,
+    at most `delivery_reports_per_second` reports per second (0 is unlimited).
+    A share of the delivery reports (`delivery_failure_rate`) tells that the
+    message was not delivered.
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        latency_jitter=0.0,
+        error_rate=0.0,
+        error_status=503,
+        failure_rate=0.0,
+        delivery_report_delay=0.0,
+        delivery_reports_per_second=0,
+        delivery_failure_rate=0.0,
+        delivery_report_workers=4,
+        delivery_reports=True,
+        seed=None,
+    ):
+        """
+        :param latency: Mean response time in seconds
+        :param latency_jitter: Maximum random deviation from the mean response time
+        :param error_rate: Share (0..1) of the requests which fail as a whole
+        :param error_status: HTTP status of the failed requests
+        :param failure_rate: Share (0..1) of the destinations which are rejected
+        :param delivery_report_delay: Seconds from sending to the delivery report
+        :param delivery_reports_per_second: Maximum rate of the delivery reports.
+            0 is unlimited.
+        :param delivery_failure_rate: Share (0..1) of the undelivered messages
+        :param delivery_report_workers: Number of threads posting the reports
+        :param delivery_reports: False disables the delivery reports
+        :param seed: Seed of the random generator, for repeatable runs
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.failure_rate = failure_rate
+        self.delivery_report_delay = delivery_report_delay
+        self.delivery_reports_per_second = delivery_reports_per_second
+        self.delivery_failure_rate = delivery_failure_rate
+        self.delivery_report_workers = delivery_report_workers
+        self.delivery_reports = delivery_reports
+        self.delivery_reports_sent = 0
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._delivery_reports = queue.Queue()
+        self._next_delivery_report_at = 0.0
+        self._delivery_report_lock = threading.Lock()
+        self._workers = []
+
+    def _chance(self, rate):
+        with self._random_lock:
+            return self._random.random() < rate
+
+    def get_latency(self):
+        with self._random_lock:
+            jitter = self._random.uniform(-self.latency_jitter, self.latency_jitter)
+        return max(0.0, self.latency + jitter)
+
+    def handle(self, data):
+        """
+        Handle a send request without the latency.
+
+        :param data: The JSON body of the Quriiri send request
+        :return: The HTTP status code and the JSON body of the response
+        """
+        if self._chance(self.error_rate):
+            return self.error_status, {
+                "errors": [{"message": "Fake Quriiri error"}],
+                "warnings": [],
+            }
+
+        destinations = data.get("destination") or []
+        if isinstance(destinations, str):
+            destinations = [destinations]
+
+        resp = {"errors": [], "warnings": [], "messages": {}}
+        for destination in destinations:
+            if self._chance(self.failure_rate):
+                resp["errors"].append(
+                    {"message": "Invalid destination", "destination": destination}
+                )
+                continue
+            message_id = uuid.uuid4().hex
+            resp["messages"][destination] = {
+                "converted": destination,
+                "status": "CREATED",
+                "messageid": message_id,
+            }
+            if self.delivery_reports and data.get("drurl"):
+                self._schedule_delivery_report(data, destination, message_id)
+        return 200, resp
+
+    def _schedule_delivery_report(self, data, destination, message_id):
+        status = "FAILED" if self._chance(self.delivery_failure_rate) else "DELIVERED"
+        report = {
+            "sender": data.get("sender"),
+            "destination": destination,
+            "status": status,
+            "smscount": "1",
+            "messageid": message_id,
+        }
+        for param in ("billingref", "batchid"):
+            if data.get(param):
+                report[param] = data[param]
+        self._start_workers()
+        self._delivery_reports.put(
+            (time.monotonic() + self.delivery_report_delay, data["drurl"], report)
+        )
+
+    def _start_workers(self):
+        with self._delivery_report_lock:
+            if self._workers:
+                return
+            for _ in range(max(1, self.delivery_report_workers)):
+                worker = threading.Thread(
+                    target=self._post_delivery_reports, daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _wait_for_turn(self, due_at):
+        with self._delivery_report_lock:
+            send_at = max(due_at, self._next_delivery_report_at)
+            if self.delivery_reports_per_second:
+                self._next_delivery_report_at = (
+                    max(send_at, time.monotonic())
+                    + 1 / self.delivery_reports_per_second
+                )
+        delay = send_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _post_delivery_reports(self):
+        # A session of its own for every worker, as the sessions are not thread
+        # safe
+        session = requests.Session()
+        while True:
+            due_at, drurl, report = self._delivery_reports.get()
+            try:
+                self._wait_for_turn(due_at)
+                report["statustime"] = datetime.now(timezone.utc).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                )
+                session.post(drurl, json=report, timeout=10)
+                with self._delivery_report_lock:
+                    self.delivery_reports_sent += 1
+            except requests.RequestException:
+                pass
+            finally:
+                self._delivery_reports.task_done()
+
+    def wait_for_delivery_reports(self):
+        """
+        Block until all the scheduled delivery reports have been posted.
+        """
+        self._delivery_reports.join()
+
+
+class FakeQuriiriAdapter(BaseAdapter):
+    """
+    `requests` transport adapter which answers with a `FakeQuriiri`
+    instead of sending the request over the network.
+    """
+
+    def __init__(self, fake_quriiri):
+        super().__init__()
+        self.fake_quriiri = fake_quriiri
+
+    def send(self, request, timeout=None, **kwargs):
+        latency = self.fake_quriiri.get_latency()
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and latency > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout(request=request)
+        time.sleep(latency)
+
+        status_code, body = self.fake_quriiri.handle(json.loads(request.body))
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.reason = "OK" if status_code < 400 else "Error"
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        response._content = json.dumps(body).encode()
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeSender(Sender):
+    """
+    `Sender` which sends the messages to an in-process `FakeQuriiri`.
+
+    The requests go through the same chunking, retry, circuit breaker and rate
+    limit logic as with the real Quriiri, only the network is replaced.
+    """
+
+    def __init__(self, fake_quriiri=None, url="http://fake-quriiri/", **kwargs):
+        """
+        :param fake_quriiri: The `FakeQuriiri` answering the requests
+        :param url: The URL of the fake API
+        :param kwargs: The options of `Sender`
+        """
+        super().__init__("fake", url, **kwargs)
+        self.fake_quriiri = fake_quriiri or FakeQuriiri()
+        self.mount(url, FakeQuriiriAdapter(self.fake_quriiri))
@@ -0,0 +1,109 @@
+"""
+Standalone HTTP server mimicking the Quriiri SMS API.
+
+Run it with e.g.
+
+    python -m quriiri.fake_server --port 8081 --latency 0.2 --failure-rate 0.01
+
+and point `QURIIRI_API_URL` to `http://localhost:8081/`.
+"""
+
+import argparse
+import json
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from quriiri.fake import FakeQuriiri
+
+
+class FakeQuriiriRequestHandler(BaseHTTPRequestHandler):
+    # Keep the connections alive like the real API does
+    protocol_version = "HTTP/1.1"
+
+    fake_quriiri: FakeQuriiri = None
+    quiet = False
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            data = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._respond(400, {"errors": [{"message": "Invalid JSON"}]})
+            return
+
+        time.sleep(self.fake_quriiri.get_latency())
+        status_code, body = self.fake_quriiri.handle(data)
+        self._respond(status_code, body)
+
+    def _respond(self, status_code, body):
+        content = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def create_server(fake_quriiri, host="127.0.0.1", port=8081, quiet=False):
+    """
+    Create a threaded HTTP server answering with the given `FakeQuriiri`.
+    Port 0 picks a free port, see `server.server_address`.
+    """
+    handler = type(
+        "FakeQuriiriRequestHandler",
+        (FakeQuriiriRequestHandler,),
+        {"fake_quriiri": fake_quriiri, "quiet": quiet},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--delivery-report-delay", type=float, default=0.0)
+    parser.add_argument("--delivery-reports-per-second", type=int, default=0)
+    parser.add_argument("--delivery-failure-rate", type=float, default=0.0)
+    parser.add_argument("--delivery-report-workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    fake_quriiri = FakeQuriiri(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        failure_rate=args.failure_rate,
+        delivery_report_delay=args.delivery_report_delay,
+        delivery_reports_per_second=args.delivery_reports_per_second,
+        delivery_failure_rate=args.delivery_failure_rate,
+        delivery_report_workers=args.delivery_report_workers,
+        seed=args.seed,
+    )
+    server = create_server(fake_quriiri, args.host, args.port, quiet=args.quiet)
+    sys.stdout.write(
+        f"Fake Quriiri listening on http://{args.host}:{server.server_port}/\n"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,80 @@
+import abc
+import asyncio
+import random
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import httpx
 import requests
+import requests.adapters
 from requests import ReadTimeout
+from urllib3.exceptions import NewConnectionError
 
 
-class Sender:
+class BaseSender(abc.ABC):
     # This implementation based from Quriiri: https://quriiri.fi/tekniset-resurssit/
     # which has been slightly updated to pass linters
     USER_AGENT = "Quriiri-TX-Python/1.0.1 %s" % requests.utils.default_user_agent()
 
+    # Responses which tell that the message was not accepted and can be sent again
+    RETRY_STATUS_CODES = (429, 503)
+
     url = None
-    session = None
-
-    def __init__(self, apikey, url):
-        self.session = requests.Session()
-        self.session.headers.update(
-            {
-                "User-Agent": Sender.USER_AGENT,
-                "Authorization": "apikey %s" % apikey,
-                "Content-Type": "application/json",
-            }
-        )
-        self.url = url
 
-    def __del__(self):
-        self.session.close()
+    def __init__(
+        self,
+        apikey,
+        url,
+        chunk_size=None,
+        *,
+        connect_timeout=None,
+        read_timeout=None,
+        deadline=None,
+        retries=0,
+        backoff_factor=0.5,
+        backoff_max=10.0,
+        circuit_breaker=None,
+        rate_limiter=None,
+    ):
+        """
+        :param apikey: Quriiri API key
+        :param url: Quriiri API URL
+        :param chunk_size: Maximum number of destinations sent in one request.
+            Larger destination lists are split into chunks. None disables chunking.
+        :param connect_timeout: Seconds to wait for the connection. None waits forever.
+        :param read_timeout: Seconds to wait for the response. None waits forever.
+        :param deadline: Total seconds one request may take, including the retries
+        :param retries: Maximum number of retries. Only the failures where the
+            message was certainly not accepted by Quriiri are retried.
+        :param backoff_factor: Base of the exponential backoff between the retries
+        :param backoff_max: Maximum backoff between the retries
+        :param circuit_breaker: `quriiri.circuit_breaker.CircuitBreaker` shared by
+            the senders of the process
+        :param rate_limiter: Rate limiter with
+            `reserve(max_wait=..., messages=..., requests=...)` and
+            `cancel(reservation)` methods. The reservation's `ready_at` tells
+            when the request may be sent. `reserve` raises an exception when the
+            limit does not allow sending within `max_wait` seconds, and the
+            exception is passed to the caller. The wait counts against the
+            deadline.
+        """
+        self.headers = {
+            "User-Agent": BaseSender.USER_AGENT,
+            "Authorization": "apikey %s" % apikey,
+            "Content-Type": "application/json",
+        }
+        self.url = url
+        self.chunk_size = chunk_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
 
     def _fill_messages(self, resp, destinations, status):
         messages = resp.setdefault("messages", {})
@@ -33,13 +83,10 @@ class Sender:
                 destination, {"converted": destination, "status": status}
             )
 
-    def send_sms(self, sender, destination, text, **optional):
-        if isinstance(destination, str):
-            destination = (destination,)
-
+    @staticmethod
+    def _build_data(sender, text, **optional):
         data = {
             "sender": sender,
-            "destination": destination,
             "text": text,
         }
 
@@ -56,25 +103,136 @@ class Sender:
                 data[param] = value
         if optional.get("flash"):
             data["flash"] = True
+        return data
 
-        req = requests.Request("POST", self.url, json=data)
-        req = self.session.prepare_request(req)
-        req.headers.pop("Accept", None)
-        req.headers.pop("Accept-Encoding", None)
+    def _split_destinations(self, destinations):
+        if isinstance(destinations, str):
+            destinations = (destinations,)
+        destinations = list(destinations)
+        if not self.chunk_size or len(destinations) <= self.chunk_size:
+            return [destinations]
+        return [
+            destinations[i : i + self.chunk_size]
+            for i in range(0, len(destinations), self.chunk_size)
+        ]
 
-        implicit_status = "UNKNOWN"
+    def _reserve_rate_limit(self, chunks):
+        """
+        Reserve the rate limit for every chunk before anything is sent,
+        so that a message is either sent to all its destinations or not at all.
+        """
+        if self.rate_limiter is None:
+            return [None] * len(chunks)
+        reservations = []
         try:
-            resp = self.session.send(req)
-        except (ValueError, ReadTimeout):
-            ex = sys.exc_info()[1]
-            if isinstance(ex, requests.exceptions.ReadTimeout):
-                key = "warnings"
-            else:
-                key = "errors"
-                implicit_status = "FAILED"
-            resp = {key: [{"message": repr(ex)}]}
+            for chunk in chunks:
+                reservations.append(
+                    self.rate_limiter.reserve(
+                        max_wait=self._get_rate_limit_max_wait(),
+                        messages=len(chunk),
+                        requests=1,
+                    )
+                )
+        except Exception:
+            for reservation in reservations:
+                self.rate_limiter.cancel(reservation)
+            raise
+        return reservations
+
+    def _get_rate_limit_max_wait(self):
+        """
+        The wait for the rate limit counts against the deadline, and must leave
+        the time of one attempt for the request itself.
+        """
+        if not self.deadline:
+            return None
+        return max(
+            0.0,
+            self.deadline - (self.connect_timeout or 0) - (self.read_timeout or 0),
+        )
+
+    @staticmethod
+    def _get_rate_limit_delay(reservation):
+        if reservation is None:
+            return 0
+        return max(0, reservation.ready_at - time.time())
+
+    def _get_deadline(self):
+        if not self.deadline:
+            return None
+        return time.monotonic() + self.deadline
+
+    def _get_timeouts(self, deadline):
+        """
+        Get the connect and read timeouts of the next attempt,
+        limited by the time left before the deadline.
+        """
+        connect_timeout, read_timeout = self.connect_timeout, self.read_timeout
+        if deadline is not None:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            connect_timeout = min(connect_timeout or remaining, remaining)
+            read_timeout = min(read_timeout or remaining, remaining)
+        return connect_timeout, read_timeout
+
+    def _get_backoff(self, attempt):
+        """
+        Exponential backoff with full jitter, so that the workers retrying
+        at the same time do not hit Quriiri at the same moment again.
+        """
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_factor * 2**attempt)
+        )
+
+    def _should_retry(self, attempt, deadline, backoff, ex, resp):
+        if attempt >= self.retries:
+            return False
+        if deadline is not None and time.monotonic() + backoff >= deadline:
+            return False
+        if ex is not None:
+            return self._is_retryable_exception(ex)
+        return resp.status_code in self.RETRY_STATUS_CODES
+
+    @staticmethod
+    @abc.abstractmethod
+    def _is_retryable_exception(ex):
+        """
+        Tell whether the request certainly did not reach Quriiri, so that it
+        can be sent again.
+        """
+
+    def _is_failure(self, ex, resp):
+        return (
+            ex is not None
+            or resp.status_code >= 500
+            or resp.status_code in self.RETRY_STATUS_CODES
+        )
+
+    def _allow_request(self):
+        return self.circuit_breaker is None or self.circuit_breaker.allow_request()
+
+    def _record_outcome(self, ex, resp):
+        if self.circuit_breaker is None:
+            return
+        if self._is_failure(ex, resp):
+            self.circuit_breaker.record_failure()
         else:
-            implicit_status, resp = self._format_response(implicit_status, resp)
+            self.circuit_breaker.record_success()
+
+    def _circuit_open_response(self, destination):
+        resp = {"errors": [{"message": "Circuit breaker is open"}]}
+        return self._finish_response(resp, destination, "FAILED")
+
+    def _handle_exception(self, ex, destination, timeout_class):
+        if isinstance(ex, timeout_class):
+            key = "warnings"
+            implicit_status = "UNKNOWN"
+        else:
+            key = "errors"
+            implicit_status = "FAILED"
+        resp = {key: [{"message": repr(ex)}]}
+        return self._finish_response(resp, destination, implicit_status)
+
+    def _finish_response(self, resp, destination, implicit_status):
         self._fill_messages(resp, destination, implicit_status)
 
         for key in "errors", "warnings":
@@ -82,6 +240,23 @@ class Sender:
 
         return resp
 
+    @staticmethod
+    def _merge_responses(responses):
+        """
+        Merge the responses of the chunked requests into one response
+        with the same shape as the response of a single request.
+        """
+        merged = {"errors": [], "warnings": [], "messages": {}}
+        for resp in responses:
+            for key, value in resp.items():
+                if key in ("errors", "warnings"):
+                    merged[key].extend(value)
+                elif key == "messages":
+                    merged[key].update(value)
+                else:
+                    merged.setdefault(key, value)
+        return merged
+
     @staticmethod
     def _format_response(implicit_status, resp):
         try:
@@ -89,7 +264,9 @@ class Sender:
         except ValueError:
             if resp.status_code >= 400:
                 key = "errors"
-                message = "HTTP %s %s" % (resp.status_code, resp.reason)
+                # `requests` and `httpx` name the reason phrase differently
+                reason = resp.reason if hasattr(resp, "reason") else resp.reason_phrase
+                message = "HTTP %s %s" % (resp.status_code, reason)
                 implicit_status = "FAILED"
             else:
                 key = "warnings"
@@ -99,3 +276,240 @@ class Sender:
             if "errors" in resp and resp["errors"]:
                 implicit_status = "FAILED"
         return implicit_status, resp
+
+
+class Sender(BaseSender):
+    """
+    Sends the messages with `requests`.
+
+    `requests.Session` is not documented to be thread-safe, so every thread
+    sending with the sender, e.g. the threads sending the chunks, has its own
+    session. The sessions share the transport adapters, whose urllib3
+    connection pools are thread-safe, so the connections are still reused
+    across the threads and the calls.
+    """
+
+    adapters = {}
+
+    def __init__(self, apikey, url, chunk_size=None, max_workers=1, **kwargs):
+        """
+        :param apikey: Quriiri API key
+        :param url: Quriiri API URL
+        :param chunk_size: Maximum number of destinations sent in one request.
+            Larger destination lists are split into chunks. None disables chunking.
+        :param max_workers: Maximum number of chunks sent concurrently
+        :param kwargs: Timeout, retry and circuit breaker options of `BaseSender`
+        """
+        super().__init__(apikey, url, chunk_size=chunk_size, **kwargs)
+        self.max_workers = max(1, max_workers)
+        pool_maxsize = max(self.max_workers, requests.adapters.DEFAULT_POOLSIZE)
+        self.adapters = {
+            "https://": requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize),
+            "http://": requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize),
+        }
+        self._local = threading.local()
+
+    def __del__(self):
+        for adapter in self.adapters.values():
+            adapter.close()
+
+    @property
+    def session(self):
+        """
+        The session of the current thread.
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._create_session()
+        return session
+
+    def _create_session(self):
+        session = requests.Session()
+        session.headers.update(self.headers)
+        for prefix, adapter in self.adapters.items():
+            session.mount(prefix, adapter)
+        return session
+
+    def mount(self, prefix, adapter):
+        """
+        Use the transport adapter for the URLs starting with the prefix. Must be
+        called before sending.
+        """
+        self.adapters[prefix] = adapter
+        self._local = threading.local()
+
+    def send_sms(self, sender, destination, text, **optional):
+        data = self._build_data(sender, text, **optional)
+
+        chunks = self._split_destinations(destination)
+        reservations = self._reserve_rate_limit(chunks)
+        if len(chunks) == 1:
+            return self._send_chunk(data, chunks[0], reservations[0])
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(chunks))
+        ) as executor:
+            responses = executor.map(
+                lambda args: self._send_chunk(data, *args), zip(chunks, reservations)
+            )
+            return self._merge_responses(responses)
+
+    def _send_chunk(self, data, destination, reservation=None):
+        deadline = self._get_deadline()
+        delay = self._get_rate_limit_delay(reservation)
+        if delay:
+            time.sleep(delay)
+
+        req = requests.Request(
+            "POST", self.url, json={**data, "destination": destination}
+        )
+        req = self.session.prepare_request(req)
+        req.headers.pop("Accept", None)
+        req.headers.pop("Accept-Encoding", None)
+
+        if not self._allow_request():
+            return self._circuit_open_response(destination)
+
+        attempt = 0
+        while True:
+            ex = resp = None
+            try:
+                resp = self.session.send(req, timeout=self._get_timeouts(deadline))
+            except (ValueError, requests.RequestException):
+                ex = sys.exc_info()[1]
+            backoff = self._get_backoff(attempt)
+            if not self._should_retry(attempt, deadline, backoff, ex, resp):
+                break
+            time.sleep(backoff)
+            attempt += 1
+
+        self._record_outcome(ex, resp)
+        if ex is not None:
+            return self._handle_exception(ex, destination, ReadTimeout)
+        implicit_status, resp = self._format_response("UNKNOWN", resp)
+        return self._finish_response(resp, destination, implicit_status)
+
+    @staticmethod
+    def _is_retryable_exception(ex):
+        # The connection was never established, so the message was not sent
+        if isinstance(ex, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(ex, requests.exceptions.ConnectionError) and ex.args:
+            return isinstance(getattr(ex.args[0], "reason", None), NewConnectionError)
+        return False
+
+
+class AsyncSender(BaseSender):
+    """
+    asyncio version of the `Sender`.
+
+    The requests are sent with a pooled `httpx.AsyncClient`, so many requests
+    can be in flight on one event loop at the same time. The connection pool
+    is shared by all the calls, so the sender should be created once and
+    closed with `aclose` (or used as an async context manager).
+    """
+
+    client = None
+
+    def __init__(
+        self,
+        apikey,
+        url,
+        chunk_size=None,
+        max_connections=100,
+        transport=None,
+        **kwargs,
+    ):
+        """
+        :param apikey: Quriiri API key
+        :param url: Quriiri API URL
+        :param chunk_size: Maximum number of destinations sent in one request.
+            Larger destination lists are split into chunks. None disables chunking.
+        :param max_connections: Maximum number of simultaneous connections
+        :param transport: Custom `httpx` transport, e.g. for testing
+        :param kwargs: Timeout, retry and circuit breaker options of `BaseSender`
+        """
+        super().__init__(apikey, url, chunk_size=chunk_size, **kwargs)
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=httpx.Timeout(
+                None, connect=self.connect_timeout, read=self.read_timeout
+            ),
+            transport=transport,
+        )
+        self.client.headers.pop("Accept", None)
+        self.client.headers.pop("Accept-Encoding", None)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def send_sms(self, sender, destination, text, **optional):
+        data = self._build_data(sender, text, **optional)
+
+        chunks = self._split_destinations(destination)
+        # The rate limiter blocks on its cache, so keep it off the event loop
+        reservations = await asyncio.to_thread(self._reserve_rate_limit, chunks)
+        responses = await asyncio.gather(
+            *(
+                self._send_chunk(data, chunk, reservation)
+                for chunk, reservation in zip(chunks, reservations)
+            )
+        )
+        if len(responses) == 1:
+            return responses[0]
+        return self._merge_responses(responses)
+
+    async def _send_chunk(self, data, destination, reservation=None):
+        deadline = self._get_deadline()
+        delay = self._get_rate_limit_delay(reservation)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if not self._allow_request():
+            return self._circuit_open_response(destination)
+
+        attempt = 0
+        while True:
+            ex = resp = None
+            try:
+                resp = await self.client.post(
+                    self.url,
+                    json={**data, "destination": destination},
+                    timeout=self._get_httpx_timeout(deadline),
+                )
+            except (ValueError, httpx.HTTPError):
+                ex = sys.exc_info()[1]
+            backoff = self._get_backoff(attempt)
+            if not self._should_retry(attempt, deadline, backoff, ex, resp):
+                break
+            await asyncio.sleep(backoff)
+            attempt += 1
+
+        self._record_outcome(ex, resp)
+        if ex is not None:
+            return self._handle_exception(ex, destination, httpx.ReadTimeout)
+        implicit_status, resp = self._format_response("UNKNOWN", resp)
+        return self._finish_response(resp, destination, implicit_status)
+
+    def _get_httpx_timeout(self, deadline):
+        if deadline is None:
+            return httpx.USE_CLIENT_DEFAULT
+        connect_timeout, read_timeout = self._get_timeouts(deadline)
+        return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+    @staticmethod
+    def _is_retryable_exception(ex):
+        # The connection was never established, so the message was not sent
+        return isinstance(
+            ex, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+        )
@@ -0,0 +1,76 @@
+import pytest
+
+from quriiri.circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(
+        failure_threshold=0.5,
+        min_calls=4,
+        window_size=10,
+        reset_timeout=30,
+        clock=clock,
+    )
+
+
+def test_circuit_breaker_stays_closed_below_min_calls(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_circuit_breaker_stays_closed_below_threshold(breaker):
+    for _ in range(3):
+        breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_breaker_opens_at_threshold(breaker):
+    for _ in range(2):
+        breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_circuit_breaker_half_open_trial_success_closes(breaker, clock):
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now = 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    # Only a single trial call is let through
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_circuit_breaker_half_open_trial_failure_opens(breaker, clock):
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now = 30
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    clock.now = 60
+    assert breaker.allow_request()
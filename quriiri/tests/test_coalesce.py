@@ -0,0 +1,130 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from quriiri.coalesce import CoalescingSender
+
+
+def _echo_send_sms(sender, destination, text, **optional):
+    return {
+        "errors": [],
+        "warnings": [],
+        "messages": {d: {"converted": d, "status": "CREATED"} for d in destination},
+    }
+
+
+def _send_concurrently(coalescing_sender, calls):
+    results = [None] * len(calls)
+    barrier = threading.Barrier(len(calls))
+
+    def send(index, args, kwargs):
+        barrier.wait()
+        try:
+            results[index] = coalescing_sender.send_sms(*args, **kwargs)
+        except Exception as e:
+            results[index] = e
+
+    threads = [
+        threading.Thread(target=send, args=(index, args, kwargs))
+        for index, (args, kwargs) in enumerate(calls)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.fixture
+def wrapped_sender():
+    sender = MagicMock()
+    sender.send_sms.side_effect = _echo_send_sms
+    return sender
+
+
+def test_coalescing_sender_merges_identical_sends(wrapped_sender):
+    coalescing_sender = CoalescingSender(wrapped_sender, window=0.2)
+
+    results = _send_concurrently(
+        coalescing_sender,
+        [
+            (("Hel.fi", ["+358461231231"], "Hello"), {"drurl": "a", "batchid": "1"}),
+            (("Hel.fi", ["+358461231232"], "Hello"), {"drurl": "b", "batchid": "2"}),
+            (("Hel.fi", ["+358461231233"], "Hello"), {"drurl": "c", "batchid": "3"}),
+        ],
+    )
+
+    assert wrapped_sender.send_sms.call_count == 1
+    args, kwargs = wrapped_sender.send_sms.call_args
+    assert sorted(args[1]) == ["+358461231231", "+358461231232", "+358461231233"]
+    # The merged request uses the options of the first call
+    assert kwargs["batchid"] in ("1", "2", "3")
+    for result, destination in zip(
+        results, ["+358461231231", "+358461231232", "+358461231233"]
+    ):
+        assert list(result["messages"]) == [destination]
+        assert result["batchid"] == kwargs["batchid"]
+
+
+def test_coalescing_sender_single_send_has_no_batch_id(wrapped_sender):
+    coalescing_sender = CoalescingSender(wrapped_sender, window=0)
+
+    result = coalescing_sender.send_sms("Hel.fi", "+358461231231", "Hello", batchid="1")
+
+    wrapped_sender.send_sms.assert_called_once_with(
+        "Hel.fi", ["+358461231231"], "Hello", batchid="1"
+    )
+    assert "batchid" not in result
+    assert list(result["messages"]) == ["+358461231231"]
+
+
+@pytest.mark.parametrize(
+    "second_call",
+    [
+        (("Hel.fi", ["+358461231232"], "Other text"), {}),
+        (("Other", ["+358461231232"], "Hello"), {}),
+        (("Hel.fi", ["+358461231232"], "Hello"), {"smsc": "other"}),
+        # The same destination could not be told apart in the response
+        (("Hel.fi", ["+358461231231"], "Hello"), {}),
+    ],
+)
+def test_coalescing_sender_does_not_merge_different_sends(wrapped_sender, second_call):
+    coalescing_sender = CoalescingSender(wrapped_sender, window=0.2)
+
+    results = _send_concurrently(
+        coalescing_sender,
+        [(("Hel.fi", ["+358461231231"], "Hello"), {}), second_call],
+    )
+
+    assert wrapped_sender.send_sms.call_count == 2
+    assert all(len(result["messages"]) == 1 for result in results)
+
+
+def test_coalescing_sender_max_destinations(wrapped_sender):
+    coalescing_sender = CoalescingSender(wrapped_sender, window=0.2, max_destinations=2)
+
+    _send_concurrently(
+        coalescing_sender,
+        [(("Hel.fi", [f"+35846123123{i}"], "Hello"), {}) for i in range(3)],
+    )
+
+    assert sorted(
+        len(call.args[1]) for call in wrapped_sender.send_sms.call_args_list
+    ) == [1, 2]
+
+
+def test_coalescing_sender_exception_raised_to_every_caller(wrapped_sender):
+    wrapped_sender.send_sms.side_effect = ValueError("Invalid response")
+    coalescing_sender = CoalescingSender(wrapped_sender, window=0.2)
+
+    results = _send_concurrently(
+        coalescing_sender,
+        [
+            (("Hel.fi", ["+358461231231"], "Hello"), {}),
+            (("Hel.fi", ["+358461231232"], "Hello"), {}),
+        ],
+    )
+
+    assert wrapped_sender.send_sms.call_count == 1
+    assert all(isinstance(result, ValueError) for result in results)
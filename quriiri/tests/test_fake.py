@@ -0,0 +1,144 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import pytest
+import requests
+
+from quriiri.fake import FakeQuriiri, FakeSender
+from quriiri.fake_server import create_server
+from quriiri.send import Sender
+
+DESTINATIONS = ["+358461231231", "+358461231232", "+358461231233"]
+
+
+@pytest.fixture
+def delivery_report_server():
+    """HTTP server collecting the delivery reports posted to it"""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            received.append(json.loads(self.rfile.read(length)))
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.received = received
+    server.url = f"http://127.0.0.1:{server.server_port}/webhook/"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fake_sender_accepts_messages():
+    sender = FakeSender(FakeQuriiri())
+
+    resp = sender.send_sms("Hel.fi", DESTINATIONS, "Hello")
+
+    assert resp["errors"] == []
+    assert list(resp["messages"]) == DESTINATIONS
+    assert all(m["status"] == "CREATED" for m in resp["messages"].values())
+
+
+def test_fake_sender_partial_failure():
+    sender = FakeSender(FakeQuriiri(failure_rate=0.5, seed=1))
+
+    resp = sender.send_sms("Hel.fi", [f"+35846123{i:04}" for i in range(100)], "Hi")
+
+    failed = [d for d, m in resp["messages"].items() if m["status"] == "FAILED"]
+    assert 0 < len(failed) < 100
+    assert sorted(e["destination"] for e in resp["errors"]) == sorted(failed)
+
+
+def test_fake_sender_error_rate_is_retried():
+    fake_quriiri = FakeQuriiri(error_rate=1.0)
+    sender = FakeSender(fake_quriiri, retries=2, backoff_factor=0)
+
+    resp = sender.send_sms("Hel.fi", DESTINATIONS, "Hello")
+
+    assert resp["errors"] == [{"message": "Fake Quriiri error"}]
+    assert all(m["status"] == "FAILED" for m in resp["messages"].values())
+
+
+def test_fake_sender_latency_above_read_timeout():
+    sender = FakeSender(FakeQuriiri(latency=0.2), read_timeout=0.01)
+
+    resp = sender.send_sms("Hel.fi", DESTINATIONS, "Hello")
+
+    assert resp["warnings"]
+    assert all(m["status"] == "UNKNOWN" for m in resp["messages"].values())
+
+
+def test_fake_quriiri_posts_delivery_reports(delivery_report_server):
+    fake_quriiri = FakeQuriiri(delivery_failure_rate=0.0)
+    sender = FakeSender(fake_quriiri)
+
+    sender.send_sms(
+        "Hel.fi",
+        DESTINATIONS,
+        "Hello",
+        drurl=delivery_report_server.url,
+        billingref="ref",
+    )
+    fake_quriiri.wait_for_delivery_reports()
+
+    assert fake_quriiri.delivery_reports_sent == 3
+    assert sorted(r["destination"] for r in delivery_report_server.received) == (
+        DESTINATIONS
+    )
+    assert all(
+        r["status"] == "DELIVERED" and r["billingref"] == "ref"
+        for r in delivery_report_server.received
+    )
+
+
+def test_fake_quriiri_delivery_report_workers_have_own_sessions(
+    delivery_report_server,
+):
+    fake_quriiri = FakeQuriiri(delivery_failure_rate=0.0, delivery_report_workers=3)
+    sessions = set()
+    post = requests.Session.post
+
+    def record_session(session, *args, **kwargs):
+        sessions.add((threading.get_ident(), id(session)))
+        return post(session, *args, **kwargs)
+
+    with mock.patch.object(requests.Session, "post", record_session):
+        FakeSender(fake_quriiri).send_sms(
+            "Hel.fi", DESTINATIONS * 5, "Hello", drurl=delivery_report_server.url
+        )
+        fake_quriiri.wait_for_delivery_reports()
+
+    threads = {thread for thread, _ in sessions}
+    assert len({session for _, session in sessions}) == len(threads)
+    assert len(sessions) == len(threads)
+
+
+def test_fake_server(delivery_report_server):
+    fake_quriiri = FakeQuriiri(failure_rate=1.0)
+    server = create_server(fake_quriiri, port=0, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        sender = Sender("key", f"http://127.0.0.1:{server.server_port}/")
+        resp = sender.send_sms(
+            "Hel.fi", DESTINATIONS, "Hello", drurl=delivery_report_server.url
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(resp["errors"]) == 3
+    assert all(m["status"] == "FAILED" for m in resp["messages"].values())
+    # Rejected messages do not get delivery reports
+    fake_quriiri.wait_for_delivery_reports()
+    assert delivery_report_server.received == []
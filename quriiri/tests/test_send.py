@@ -0,0 +1,384 @@
+import asyncio
+import json
+from unittest import mock
+
+import httpx
+import pytest
+import requests
+
+from quriiri.circuit_breaker import CircuitBreaker
+from quriiri.send import AsyncSender, Sender
+
+DESTINATIONS = [f"+35840{i:07d}" for i in range(10)]
+
+
+def _create_response(status_code=200, content=b"", reason="OK"):
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = reason
+    response._content = content
+    return response
+
+
+def _echo_response(request, **kwargs):
+    """Create a Quriiri-like response from the sent request."""
+    destinations = json.loads(request.body)["destination"]
+    return _create_response(
+        content=json.dumps(
+            {
+                "errors": [],
+                "warnings": [{"message": f"{len(destinations)} destinations"}],
+                "messages": {
+                    destination: {"converted": destination, "status": "CREATED"}
+                    for destination in destinations
+                },
+            }
+        ).encode()
+    )
+
+
+@pytest.fixture
+def sender():
+    return Sender("apikey", "https://api.example.com/v1/")
+
+
+def test_send_sms_single_request(sender):
+    with mock.patch.object(
+        requests.Session, "send", side_effect=_echo_response
+    ) as send:
+        resp = sender.send_sms("Hel.fi", DESTINATIONS, "SMS message")
+
+    assert send.call_count == 1
+    request = send.call_args.args[0]
+    assert request.headers["Authorization"] == "apikey apikey"
+    assert json.loads(request.body) == {
+        "sender": "Hel.fi",
+        "destination": DESTINATIONS,
+        "text": "SMS message",
+    }
+    assert list(resp["messages"]) == DESTINATIONS
+    assert resp["errors"] == []
+
+
+def test_send_sms_in_chunks(sender):
+    sender.chunk_size = 4
+    sender.max_workers = 3
+
+    with mock.patch.object(
+        requests.Session, "send", side_effect=_echo_response
+    ) as mocked_send:
+        resp = sender.send_sms("Hel.fi", DESTINATIONS, "SMS message", drurl="url")
+
+    assert mocked_send.call_count == 3
+    sent_destinations = [
+        json.loads(call.args[0].body)["destination"]
+        for call in mocked_send.call_args_list
+    ]
+    assert sorted(len(chunk) for chunk in sent_destinations) == [2, 4, 4]
+    assert all(
+        json.loads(call.args[0].body)["drurl"] == "url"
+        for call in mocked_send.call_args_list
+    )
+    assert list(resp["messages"]) == DESTINATIONS
+    assert resp["errors"] == []
+    assert resp["warnings"] == [
+        {"message": "4 destinations"},
+        {"message": "4 destinations"},
+        {"message": "2 destinations"},
+    ]
+
+
+def test_send_sms_in_chunks_partial_failure(sender):
+    sender.chunk_size = 5
+
+    def send(request, **kwargs):
+        if DESTINATIONS[0] in json.loads(request.body)["destination"]:
+            return _create_response(500, reason="Internal Server Error")
+        return _echo_response(request)
+
+    with mock.patch.object(requests.Session, "send", side_effect=send):
+        resp = sender.send_sms("Hel.fi", DESTINATIONS, "SMS message")
+
+    assert resp["errors"] == [{"message": "HTTP 500 Internal Server Error"}]
+    statuses = [resp["messages"][d]["status"] for d in DESTINATIONS]
+    assert statuses == ["FAILED"] * 5 + ["CREATED"] * 5
+
+
+def test_send_sms_read_timeout(sender):
+    with mock.patch.object(
+        requests.Session, "send", side_effect=requests.exceptions.ReadTimeout()
+    ):
+        resp = sender.send_sms("Hel.fi", DESTINATIONS[0], "SMS message")
+
+    assert resp == {
+        "errors": [],
+        "warnings": [{"message": "ReadTimeout()"}],
+        "messages": {
+            DESTINATIONS[0]: {"converted": DESTINATIONS[0], "status": "UNKNOWN"}
+        },
+    }
+
+
+def test_send_sms_timeouts(sender):
+    sender.connect_timeout = 1
+    sender.read_timeout = 5
+    with mock.patch.object(
+        requests.Session, "send", side_effect=_echo_response
+    ) as send:
+        sender.send_sms("Hel.fi", DESTINATIONS, "SMS message")
+    assert send.call_args.kwargs["timeout"] == (1, 5)
+
+
+def test_send_sms_timeouts_limited_by_deadline(sender):
+    sender.connect_timeout = 1
+    sender.read_timeout = 5
+    sender.deadline = 2
+    with mock.patch.object(
+        requests.Session, "send", side_effect=_echo_response
+    ) as send:
+        sender.send_sms("Hel.fi", DESTINATIONS, "SMS message")
+    connect_timeout, read_timeout = send.call_args.kwargs["timeout"]
+    assert connect_timeout == 1
+    assert 1.9 < read_timeout <= 2
+
+
+def test_send_sms_in_chunks_session_per_thread(sender):
+    sender.chunk_size = 4
+    sender.max_workers = 3
+    sessions = set()
+
+    def send(session, request, **kwargs):
+        sessions.add(session)
+        return _echo_response(request)
+
+    with mock.patch.object(requests.Session, "send", autospec=True, side_effect=send):
+        sender.send_sms("Hel.fi", DESTINATIONS, "SMS message")
+
+    assert sender.session not in sessions
+    # The sessions of the threads share the connection pools
+    assert {session.adapters["https://"] for session in sessions} == {
+        sender.adapters["https://"]
+    }
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [
+        _create_response(503, reason="Service Unavailable"),
+        _create_response(429, reason="Too Many Requests"),
+        requests.exceptions.ConnectTimeout(),
+    ],
+)
+def test_send_sms_retries_idempotent_failures(sender, failure):
+    sender.retries = 2
+    side_effect = [failure, failure, _echo_response]
+
+    def send(request, **kwargs):
+        result = side_effect.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result(request) if callable(result) else result
+
+    with (
+        mock.patch.object(requests.Session, "send", side_effect=send) as mocked_send,
+        mock.patch("quriiri.send.time.sleep") as sleep,
+    ):
+        resp = sender.send_sms("Hel.fi", DESTINATIONS, "SMS message")
+
+    assert mocked_send.call_count == 3
+    assert sleep.call_count == 2
+    assert resp["errors"] == []
+    assert list(resp["messages"]) == DESTINATIONS
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [
+        _create_response(500, reason="Internal Server Error"),
+        requests.exceptions.ReadTimeout(),
+    ],
+)
+def test_send_sms_does_not_retry_maybe_accepted_messages(sender, failure):
+    """The message may have been accepted, so sending it again could duplicate it"""
+    sender.retries = 2
+    with (
+        mock.patch.object(requests.Session, "send", side_effect=[failure]) as send,
+        mock.patch("quriiri.send.time.sleep"),
+    ):
+        sender.send_sms("Hel.fi", DESTINATIONS, "SMS message")
+    assert send.call_count == 1
+
+
+def test_send_sms_retries_stop_at_deadline(sender):
+    sender.retries = 10
+    sender.deadline = 1
+    sender.backoff_factor = 10
+    with (
+        mock.patch.object(
+            requests.Session, "send", return_value=_create_response(503)
+        ) as send,
+        mock.patch("quriiri.send.random.uniform", return_value=5),
+        mock.patch("quriiri.send.time.sleep") as sleep,
+    ):
+        resp = sender.send_sms("Hel.fi", DESTINATIONS[0], "SMS message")
+    assert send.call_count == 1
+    sleep.assert_not_called()
+    assert resp["messages"][DESTINATIONS[0]]["status"] == "FAILED"
+
+
+def test_send_sms_connection_error_fails(sender):
+    with mock.patch.object(
+        requests.Session, "send", side_effect=requests.exceptions.ConnectionError("x")
+    ):
+        resp = sender.send_sms("Hel.fi", DESTINATIONS[0], "SMS message")
+    assert resp["errors"] == [{"message": "ConnectionError('x')"}]
+    assert resp["messages"][DESTINATIONS[0]]["status"] == "FAILED"
+
+
+def test_send_sms_circuit_breaker(sender):
+    sender.circuit_breaker = CircuitBreaker(min_calls=2, failure_threshold=1)
+    with mock.patch.object(
+        requests.Session, "send", return_value=_create_response(500)
+    ) as send:
+        for _ in range(3):
+            resp = sender.send_sms("Hel.fi", DESTINATIONS[0], "SMS message")
+
+    assert send.call_count == 2
+    assert sender.circuit_breaker.state == CircuitBreaker.OPEN
+    assert resp == {
+        "errors": [{"message": "Circuit breaker is open"}],
+        "warnings": [],
+        "messages": {
+            DESTINATIONS[0]: {"converted": DESTINATIONS[0], "status": "FAILED"}
+        },
+    }
+
+
+def _create_async_sender(handler, **kwargs):
+    return AsyncSender(
+        "apikey",
+        "https://api.example.com/v1/",
+        transport=httpx.MockTransport(handler),
+        **kwargs,
+    )
+
+
+async def _async_echo_response(request):
+    destinations = json.loads(request.content)["destination"]
+    await asyncio.sleep(0.01)
+    return httpx.Response(
+        200,
+        json={
+            "errors": [],
+            "warnings": [],
+            "messages": {
+                destination: {"converted": destination, "status": "CREATED"}
+                for destination in destinations
+            },
+        },
+    )
+
+
+def test_async_send_sms_matches_sender(sender):
+    async def send():
+        async with _create_async_sender(_async_echo_response) as async_sender:
+            return await async_sender.send_sms("Hel.fi", DESTINATIONS, "SMS message")
+
+    with mock.patch.object(requests.Session, "send", side_effect=_echo_response):
+        expected = sender.send_sms("Hel.fi", DESTINATIONS, "SMS message")
+    expected["warnings"] = []
+
+    assert asyncio.run(send()) == expected
+
+
+def test_async_send_sms_concurrent_requests():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            return await _async_echo_response(request)
+        finally:
+            in_flight -= 1
+
+    async def send():
+        async with _create_async_sender(handler, chunk_size=2) as async_sender:
+            return await asyncio.gather(
+                *(
+                    async_sender.send_sms("Hel.fi", destination, "SMS message")
+                    for destination in DESTINATIONS
+                ),
+                async_sender.send_sms("Hel.fi", DESTINATIONS, "SMS message"),
+            )
+
+    *single_responses, chunked_response = asyncio.run(send())
+
+    assert max_in_flight > 1
+    assert [list(resp["messages"]) for resp in single_responses] == [
+        [destination] for destination in DESTINATIONS
+    ]
+    assert list(chunked_response["messages"]) == DESTINATIONS
+
+
+@pytest.mark.parametrize(
+    "response,expected_status,expected_errors",
+    [
+        (
+            httpx.Response(503, content=b"Service Unavailable"),
+            "FAILED",
+            [{"message": "HTTP 503 Service Unavailable"}],
+        ),
+        (
+            httpx.Response(200, json={"errors": [{"message": "Invalid sender"}]}),
+            "FAILED",
+            [{"message": "Invalid sender"}],
+        ),
+    ],
+)
+def test_async_send_sms_error_response(response, expected_status, expected_errors):
+    async def send():
+        async with _create_async_sender(lambda request: response) as async_sender:
+            return await async_sender.send_sms("Hel.fi", DESTINATIONS[0], "SMS")
+
+    resp = asyncio.run(send())
+
+    assert resp["errors"] == expected_errors
+    assert resp["messages"][DESTINATIONS[0]]["status"] == expected_status
+
+
+def test_async_send_sms_retries_connect_error():
+    attempts = []
+
+    async def handler(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("Connection refused", request=request)
+        return await _async_echo_response(request)
+
+    async def send():
+        async with _create_async_sender(
+            handler, retries=1, backoff_factor=0
+        ) as async_sender:
+            return await async_sender.send_sms("Hel.fi", DESTINATIONS[0], "SMS")
+
+    resp = asyncio.run(send())
+
+    assert len(attempts) == 2
+    assert resp["messages"][DESTINATIONS[0]]["status"] == "CREATED"
+
+
+def test_async_send_sms_read_timeout():
+    def handler(request):
+        raise httpx.ReadTimeout("Timeout", request=request)
+
+    async def send():
+        async with _create_async_sender(handler) as async_sender:
+            return await async_sender.send_sms("Hel.fi", DESTINATIONS[0], "SMS")
+
+    resp = asyncio.run(send())
+
+    assert resp["warnings"] == [{"message": "ReadTimeout('Timeout')"}]
+    assert resp["messages"][DESTINATIONS[0]]["status"] == "UNKNOWN"